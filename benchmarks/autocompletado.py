@@ -0,0 +1,95 @@
+"""
+Benchmark: latencia del índice de autocompletado con prefijos de 5
+caracteres sobre 1,000,000 de títulos sintéticos y de aplicar un cambio
+de título (el que llega por signals o de otro proceso); no usa base de datos.
+Ejecutar con: python -m benchmarks.autocompletado [num_libros]
+"""
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.busqueda import vocabulario
+from benchmarks.entorno import imprimir_tabla
+
+from libros.autocompletado import IndicePrefijos, normalizar_clave
+
+CONSULTAS = 20000
+CAMBIOS = 5000
+
+
+def generar(num_libros, azar):
+    palabras = vocabulario()
+    pesos = [1 / (i + 1) for i in range(len(palabras))]
+    autores = [
+        (i, azar.choice(palabras).capitalize(), azar.choice(palabras).capitalize())
+        for i in range(num_libros // 10)
+    ]
+    libros = [
+        (
+            i, ' '.join(azar.choices(palabras, pesos, k=azar.randint(2, 5))).capitalize(),
+            f'{9790000000000 + i}', azar.randrange(len(autores)),
+        )
+        for i in range(num_libros)
+    ]
+    return libros, autores
+
+
+def percentiles(tiempos):
+    tiempos = sorted(tiempos)
+    return (
+        statistics.median(tiempos),
+        tiempos[int(len(tiempos) * 0.99)],
+        tiempos[-1],
+    )
+
+
+def main():
+    num_libros = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    azar = random.Random(42)
+    libros, autores = generar(num_libros, azar)
+
+    indice = IndicePrefijos()
+    inicio = time.perf_counter()
+    indice.cargar(libros, autores)
+    # Sin revisar la versión compartida durante la medición
+    indice.revisado = float('inf')
+    print(f'Índice de {num_libros} libros construido en {time.perf_counter() - inicio:.1f} s')
+
+    casos = {
+        'título': [normalizar_clave(t)[:5] for _, t, _, _ in azar.sample(libros, CONSULTAS)],
+        'autor': [normalizar_clave(a)[:5] for _, a, _ in azar.choices(autores, k=CONSULTAS)],
+        'isbn': [isbn[:5] for _, _, isbn, _ in azar.sample(libros, CONSULTAS)],
+        'sin resultados': ['qqqqq'] * CONSULTAS,
+    }
+
+    filas = []
+    for nombre, prefijos in casos.items():
+        tiempos = []
+        for prefijo in prefijos:
+            inicio = time.perf_counter()
+            indice.buscar(prefijo)
+            tiempos.append((time.perf_counter() - inicio) * 1_000_000)
+        p50, p99, maximo = percentiles(tiempos)
+        filas.append((nombre, f'{p50:.0f}', f'{p99:.0f}', f'{maximo:.0f}'))
+
+    tiempos = []
+    palabras = vocabulario()
+    for pk, _, isbn, autor_id in azar.sample(libros, CAMBIOS):
+        titulo = ' '.join(azar.choices(palabras, k=3)).capitalize()
+        inicio = time.perf_counter()
+        with indice.lock:
+            indice._aplicar(('libro', pk, (titulo, isbn, autor_id)))
+        tiempos.append((time.perf_counter() - inicio) * 1_000_000)
+    p50, p99, maximo = percentiles(tiempos)
+    filas.append(('cambio de título', f'{p50:.0f}', f'{p99:.0f}', f'{maximo:.0f}'))
+
+    imprimir_tabla(
+        f'Prefijos de 5 caracteres y cambios sobre {num_libros} títulos '
+        f'({CONSULTAS} consultas, {CAMBIOS} cambios)',
+        filas, ('caso', 'µs p50', 'µs p99', 'µs máx'),
+    )
+
+
+if __name__ == '__main__':
+    main()
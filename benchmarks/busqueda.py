@@ -0,0 +1,129 @@
+"""
+Benchmark: búsqueda en un catálogo sintético (1,000,000 de libros por
+defecto) con `icontains` como SearchFilter frente al índice invertido.
+Ejecutar con: python -m benchmarks.busqueda [num_libros]
+"""
+import random
+import sys
+import time
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from benchmarks.entorno import base_de_datos_temporal, imprimir_tabla, medir
+
+from django.db.models import Q
+from libros.busqueda import IndiceInvertido, filtrar, obtener_backend
+from libros.models import Autor, Libro
+
+LOTE = 5000
+
+SILABAS = 'ma ri so la ne to ca be lu do pe sa mi ro ta ve ga fi no le'.split()
+TAMANO_VOCABULARIO = 5000
+
+# Palabras reales en posiciones fijas del ranking de frecuencia (Zipf),
+# para que las consultas del benchmark sean legibles
+PALABRAS = {
+    5: 'memoria', 40: 'ciudad', 120: 'sombras', 400: 'noche', 900: 'mar',
+    1500: 'tormenta', 2500: 'biblioteca', 2600: 'bibliotecario', 4000: 'laberinto',
+}
+
+CONSULTAS = (
+    ('término muy común', 'memoria'),
+    ('término medio', 'sombras'),
+    ('término raro', 'laberinto'),
+    ('dos términos', 'sombras ciudad'),
+    ('prefijo', 'biblio'),
+    ('tecleando', 'memoria ciudad torm'),
+)
+
+
+def vocabulario():
+    azar = random.Random(7)
+    sinteticas = sorted({
+        ''.join(azar.choices(SILABAS, k=azar.randint(2, 4)))
+        for _ in range(TAMANO_VOCABULARIO * 2)
+    })
+    azar.shuffle(sinteticas)
+    sinteticas = iter(sinteticas)
+    return [
+        PALABRAS.get(i) or next(sinteticas) for i in range(TAMANO_VOCABULARIO)
+    ]
+
+
+def sembrar(num_libros):
+    azar = random.Random(42)
+    palabras = vocabulario()
+    # Distribución sesgada: pocas palabras muy frecuentes, muchas raras
+    pesos = [1 / (i + 1) for i in range(len(palabras))]
+    autor = Autor.objects.create(nombre='Autor', apellido='Bench')
+
+    def frase(n):
+        return ' '.join(azar.choices(palabras, pesos, k=n))
+
+    for inicio in range(0, num_libros, LOTE):
+        Libro.objects.bulk_create([
+            Libro(
+                titulo=frase(azar.randint(2, 5)).capitalize(),
+                isbn=f'{9790000000000 + i}', autor=autor,
+                descripcion=frase(azar.randint(10, 25)),
+                stock=1, precio=Decimal('100.00'),
+            )
+            for i in range(inicio, min(inicio + LOTE, num_libros))
+        ])
+
+
+def pagina(queryset):
+    """Lo que hace el listado: COUNT(*) y la primera página"""
+    queryset.count()
+    return list(queryset.values_list('pk', flat=True)[:20])
+
+
+def buscar_icontains(texto):
+    # Lo que genera SearchFilter con search_fields = ['titulo', 'isbn', 'descripcion']
+    filtro = Q()
+    for termino in texto.split():
+        filtro &= reduce(or_, (
+            Q(**{f'{campo}__icontains': termino})
+            for campo in ('titulo', 'isbn', 'descripcion')
+        ))
+    return pagina(Libro.objects.filter(filtro).order_by('-fecha_creacion', '-id'))
+
+
+def buscar_indice(texto):
+    return pagina(filtrar(Libro.objects.all(), texto))
+
+
+def main():
+    num_libros = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    indice = obtener_backend()
+    assert isinstance(indice, IndiceInvertido)
+
+    with base_de_datos_temporal():
+        inicio = time.perf_counter()
+        sembrar(num_libros)
+        print(f'Catálogo: {num_libros} libros en {time.perf_counter() - inicio:.1f} s')
+
+        inicio = time.perf_counter()
+        indice.reconstruir(Libro, lote=LOTE)
+        print(f'Índice construido en {time.perf_counter() - inicio:.1f} s')
+
+        filas = []
+        for nombre, texto in CONSULTAS:
+            resultados = filtrar(Libro.objects.all(), texto, ordenar=False).count()
+            _, ms_like = medir(lambda: buscar_icontains(texto), repeticiones=3)
+            consultas, ms_indice = medir(lambda: buscar_indice(texto), repeticiones=3)
+            filas.append((
+                nombre, repr(texto), resultados,
+                f'{ms_like:.1f}', f'{ms_indice:.1f}', consultas,
+            ))
+
+        imprimir_tabla(
+            f'Búsqueda sobre {num_libros} libros: total + primera página',
+            filas,
+            ('caso', 'texto', 'resultados', 'ms icontains', 'ms índice', 'consultas'),
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark: mensajes por segundo en una sala de ws/chat/ con un emisor y
+varios oyentes, sin persistencia, guardando cada mensaje con un INSERT
+en el consumer y con el almacén en lotes de libros/chat.py.
+Ejecutar con: python -m benchmarks.chat_persistente [mensajes] [oyentes]
+"""
+import json
+import sys
+import time
+import uuid
+from unittest import mock
+
+from benchmarks.entorno import base_de_datos_temporal, imprimir_tabla
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db.backends.utils import CursorWrapper
+from django.test.utils import override_settings
+from django.urls import re_path
+from django.utils import timezone
+
+from libros.chat import almacen
+from libros.consumers import ChatConsumer
+from libros.models import MensajeChat
+
+
+class ChatIngenuo(ChatConsumer):
+    """Persistencia directa: un INSERT por mensaje antes de reenviarlo"""
+
+    async def connect(self):
+        await super().connect()
+        self.persistente = False
+
+    async def receive(self, text_data):
+        data = json.loads(text_data)
+        await database_sync_to_async(MensajeChat.objects.create)(
+            sala=self.room_name, uid=uuid.uuid4().hex, usuario=data.get('username', 'Anónimo'),
+            mensaje=data['message'], fecha=timezone.now(),
+        )
+        await super().receive(text_data)
+
+
+def aplicacion(consumer):
+    return URLRouter([re_path(r'ws/chat/(?P<room_name>\w+)/$', consumer.as_asgi())])
+
+
+def sala(app, mensajes, oyentes):
+    """Segundos desde el primer envío hasta que todos reciben el último"""
+
+    async def sesion():
+        clientes = []
+        for _ in range(oyentes + 1):
+            ws = WebsocketCommunicator(app, '/ws/chat/bench/')
+            await ws.connect()
+            clientes.append(ws)
+        # Vaciar historial y avisos de entrada
+        for ws in clientes:
+            while not await ws.receive_nothing(timeout=0.05):
+                await ws.receive_output()
+
+        emisor = clientes[0]
+        inicio = time.perf_counter()
+        for i in range(mensajes):
+            await emisor.send_json_to({'message': f'mensaje {i}', 'username': 'bench'})
+        for ws in clientes:
+            for _ in range(mensajes):
+                await ws.receive_json_from(timeout=30)
+        segundos = time.perf_counter() - inicio
+        for ws in clientes:
+            await ws.disconnect()
+        return segundos
+
+    return async_to_sync(sesion)()
+
+
+def contar_inserts(funcion):
+    """Sentencias INSERT de cualquier hilo (el almacén guarda en el suyo)"""
+    inserts = [0]
+    original = CursorWrapper._execute
+
+    def contar(self, sql, params, *args):
+        if sql.lstrip().upper().startswith('INSERT'):
+            inserts[0] += 1
+        return original(self, sql, params, *args)
+
+    with mock.patch.object(CursorWrapper, '_execute', contar):
+        resultado = funcion()
+    return resultado, inserts[0]
+
+
+def main():
+    mensajes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    oyentes = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    variantes = [
+        ('sin persistencia', ChatConsumer, {'ACTIVO': False}),
+        ('INSERT por mensaje', ChatIngenuo, {'ACTIVO': False}),
+        ('almacén en lotes', ChatConsumer, {'ACTIVO': True, 'INTERVALO': 1.0, 'LOTE': 500}),
+    ]
+    filas = []
+    with base_de_datos_temporal():
+        for nombre, consumer, config in variantes:
+            MensajeChat.objects.all().delete()
+            almacen.olvidar()
+            with override_settings(CHAT_PERSISTENTE={**config, 'HISTORIAL': 50}):
+                segundos, inserts = contar_inserts(lambda: sala(aplicacion(consumer), mensajes, oyentes))
+                # Lo que quede pendiente también cuenta para los lotes
+                _, finales = contar_inserts(almacen.vaciar)
+            filas.append((
+                nombre, f'{mensajes / segundos:,.0f}', f'{segundos * 1000:,.0f}',
+                inserts + finales, MensajeChat.objects.count(),
+            ))
+    imprimir_tabla(
+        f'{mensajes} mensajes de un emisor a {oyentes} oyentes en una sala',
+        filas,
+        ('variante', 'mensajes/s', 'ms total', 'INSERTs', 'filas guardadas'),
+    )
+
+
+if __name__ == '__main__':
+    main()
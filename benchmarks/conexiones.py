@@ -0,0 +1,103 @@
+"""
+Benchmark: conexiones a la base de datos que se abren bajo carga
+concurrente, como la recibe Daphne, antes y después de libros/conexiones.py:
+- consultas de consumers (database_sync_to_async de channels, un hilo y
+  CONN_MAX_AGE=0, frente al pool con conexiones persistentes),
+- peticiones GET a /api/categorias/ (ASGIHandler, un hilo por petición,
+  frente a ASGIHandlerConPool).
+Con MySQL cada apertura es un handshake más el init_command de settings.
+Ejecutar con: python -m benchmarks.conexiones [llamadas] [concurrencia]
+"""
+import asyncio
+import sys
+import time
+
+from benchmarks.entorno import base_de_datos_temporal, imprimir_tabla
+
+from channels.db import database_sync_to_async as database_sync_to_async_channels
+from channels.testing import HttpCommunicator
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
+from django.test.utils import override_settings
+
+from libros import conexiones
+from libros.models import Categoria
+
+
+async def en_lotes(crear, total, concurrencia):
+    """Ejecutar `total` corrutinas con a lo más `concurrencia` a la vez"""
+    limite = asyncio.Semaphore(concurrencia)
+
+    async def una():
+        async with limite:
+            return await crear()
+
+    return await asyncio.gather(*(una() for _ in range(total)))
+
+
+def consumers(envolver, llamadas, concurrencia):
+    @envolver
+    def consultar():
+        return Categoria.objects.filter(nombre='Novela').exists()
+
+    asyncio.run(en_lotes(consultar, llamadas, concurrencia))
+
+
+def peticiones(aplicacion, llamadas, concurrencia):
+    async def pedir():
+        cliente = HttpCommunicator(
+            aplicacion, 'GET', '/api/categorias/', headers=[(b'host', b'testserver')],
+        )
+        respuesta = await cliente.get_response(timeout=30)
+        assert respuesta['status'] == 200, respuesta['status']
+        await cliente.send_input({'type': 'http.disconnect'})
+        await cliente.wait(timeout=30)
+
+    asyncio.run(en_lotes(pedir, llamadas, concurrencia))
+
+
+def medir(funcion, conn_max_age):
+    """(conexiones abiertas, ms) de una ronda con el CONN_MAX_AGE dado"""
+    connections.settings['default']['CONN_MAX_AGE'] = conn_max_age
+    conexiones.cerrar()
+    conexiones.metricas.reiniciar()
+    inicio = time.perf_counter()
+    funcion()
+    ms = (time.perf_counter() - inicio) * 1000
+    conexiones.cerrar()
+    return conexiones.metricas.resumen()['aperturas'].get('default', 0), ms
+
+
+def main():
+    llamadas = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrencia = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    filas = []
+    with base_de_datos_temporal(), override_settings(
+        CONEXIONES_DB={'HILOS': 10}, CACHE_RESPUESTAS={'ACTIVO': False},
+        RATE_LIMIT={'POLITICAS': []},
+        REST_FRAMEWORK={'DEFAULT_THROTTLE_CLASSES': []},
+    ):
+        Categoria.objects.create(nombre='Novela')
+        variantes = [
+            ('consumers', 'channels, CONN_MAX_AGE=0',
+             lambda: consumers(database_sync_to_async_channels, llamadas, concurrencia), 0),
+            ('consumers', 'pool de 10, CONN_MAX_AGE=60',
+             lambda: consumers(conexiones.database_sync_to_async, llamadas, concurrencia), 60),
+            ('HTTP', 'ASGIHandler, CONN_MAX_AGE=0',
+             lambda: peticiones(ASGIHandler(), llamadas, concurrencia), 0),
+            ('HTTP', 'ASGIHandlerConPool, CONN_MAX_AGE=60',
+             lambda: peticiones(conexiones.ASGIHandlerConPool(), llamadas, concurrencia), 60),
+        ]
+        for carga, variante, funcion, conn_max_age in variantes:
+            abiertas, ms = medir(funcion, conn_max_age)
+            filas.append((carga, variante, abiertas, f'{abiertas / llamadas:.3f}', f'{ms:,.0f}'))
+    imprimir_tabla(
+        f'{llamadas:,} llamadas, {concurrencia} concurrentes (SQLite)',
+        filas,
+        ('carga', 'variante', 'conexiones abiertas', 'por llamada', 'ms'),
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Utilidades comunes de los benchmarks.
+
+Los benchmarks corren con biblioteca_project.settings_test (SQLite, sin
+servicios externos) sobre una base de datos temporal que se crea y se
+borra en cada ejecución. Ejecutar desde la raíz del proyecto, p. ej.:
+    python -m benchmarks.graphql_dataloaders
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'biblioteca_project.settings_test')
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+
+@contextmanager
+def base_de_datos_temporal():
+    """Crear una base de datos de prueba migrada y borrarla al terminar"""
+    nombre_original = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+
+def medir(funcion, repeticiones=5):
+    """Ejecutar `funcion` varias veces; devuelve (consultas, ms mediana)"""
+    consultas = [0]
+
+    def contar(execute, sql, params, many, context):
+        consultas[0] += 1
+        return execute(sql, params, many, context)
+
+    tiempos = []
+    with connection.execute_wrapper(contar):
+        for _ in range(repeticiones):
+            consultas[0] = 0
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+    return consultas[0], statistics.median(tiempos)
+
+
+def imprimir_tabla(titulo, filas, columnas):
+    """Tabla simple en texto plano"""
+    print(f'\n{titulo}')
+    print('-' * len(titulo))
+    anchos = [
+        max(len(str(c)), *(len(str(f[i])) for f in filas))
+        for i, c in enumerate(columnas)
+    ]
+    print('  '.join(str(c).ljust(a) for c, a in zip(columnas, anchos)))
+    for fila in filas:
+        print('  '.join(str(v).ljust(a) for v, a in zip(fila, anchos)))
@@ -0,0 +1,92 @@
+"""
+Benchmark: consulta GraphQL anidada sobre 1,000 libros con y sin DataLoaders
+(recorriendo todas las páginas de allLibros).
+Ejecutar con: python -m benchmarks.graphql_dataloaders [num_libros]
+"""
+import sys
+from datetime import date
+from decimal import Decimal
+from types import SimpleNamespace
+
+from benchmarks.entorno import base_de_datos_temporal, imprimir_tabla, medir
+
+from django.contrib.auth.models import User
+from libros.models import Autor, Categoria, Libro, Prestamo
+from libros.schema import schema
+
+CONSULTA = '''query($after: String) {
+    allLibros(first: 100, after: $after) {
+        pageInfo { hasNextPage endCursor }
+        edges { node {
+            titulo
+            creadoPor { username }
+            categoria { nombre }
+            autor {
+                nombre
+                libros { titulo prestamos { estado } }
+            }
+            prestamos { estado libro { isbn } }
+        } }
+    }
+}'''
+
+
+def sembrar(num_libros):
+    usuario = User.objects.create_user('bench', password='x')
+    categorias = Categoria.objects.bulk_create([
+        Categoria(nombre=f'Categoría {i}') for i in range(10)
+    ])
+    autores = Autor.objects.bulk_create([
+        Autor(nombre=f'Autor {i}', apellido='Bench') for i in range(num_libros // 10)
+    ])
+    libros = Libro.objects.bulk_create([
+        Libro(
+            titulo=f'Libro {i}', isbn=f'{9790000000000 + i}',
+            autor=autores[i % len(autores)], categoria=categorias[i % 10],
+            stock=3, precio=Decimal('100.00'), creado_por=usuario,
+        )
+        for i in range(num_libros)
+    ])
+    Prestamo.objects.bulk_create([
+        Prestamo(libro=libro, usuario=usuario, fecha_devolucion_esperada=date(2030, 1, 1))
+        for libro in libros[::2]
+    ])
+
+
+def main():
+    num_libros = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with base_de_datos_temporal():
+        sembrar(num_libros)
+
+        def recorrer(contexto=None):
+            cursor = None
+            while True:
+                resultado = schema.execute(
+                    CONSULTA, variables={'after': cursor},
+                    context_value=contexto() if contexto else None,
+                )
+                assert not resultado.errors, resultado.errors
+                pagina = resultado.data['allLibros']['pageInfo']
+                if not pagina['hasNextPage']:
+                    break
+                cursor = pagina['endCursor']
+
+        def sin_cargadores():
+            recorrer()
+
+        def con_cargadores():
+            recorrer(SimpleNamespace)
+
+        filas = []
+        for nombre, funcion in (('sin DataLoaders', sin_cargadores),
+                                ('con DataLoaders', con_cargadores)):
+            consultas, ms = medir(funcion, repeticiones=3)
+            filas.append((nombre, consultas, f'{ms:.1f}'))
+        imprimir_tabla(
+            f'Consulta anidada sobre {num_libros} libros',
+            filas, ('modo', 'consultas SQL', 'ms (mediana)'),
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark: costo de parsear + validar una consulta GraphQL en cada petición
+frente a tomarla del caché de documentos (hash + LRU).
+No usa base de datos.
+Ejecutar con: python -m benchmarks.graphql_documentos [iteraciones]
+"""
+import sys
+
+from benchmarks.entorno import imprimir_tabla, medir
+
+from graphql import parse, validate
+from libros.graphql_persistidas import CacheDocumentos, hash_consulta
+from libros.schema import schema
+
+CONSULTAS = {
+    'listado simple': '{ allLibros(first: 20) { edges { node { id titulo } } } }',
+    'anidada': '''query($after: String) {
+        allLibros(first: 50, after: $after) {
+            pageInfo { hasNextPage endCursor }
+            edges { node {
+                titulo isbn stock
+                creadoPor { username }
+                categoria { nombre }
+                autor { nombre apellido libros { titulo prestamos { estado } } }
+                prestamos { estado fechaPrestamo libro { isbn } }
+            } }
+        }
+    }''',
+    'mutación': '''mutation($libroId: Int!, $cantidad: Int!) {
+        actualizarStockLibro(libroId: $libroId, cantidad: $cantidad) {
+            mensaje libro { id stock estado }
+        }
+    }''',
+}
+
+
+def main():
+    iteraciones = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    graphql_schema = schema.graphql_schema
+
+    filas = []
+    for nombre, consulta in CONSULTAS.items():
+        assert not validate(graphql_schema, parse(consulta)), nombre
+        cache = CacheDocumentos(100)
+
+        def sin_cache():
+            for _ in range(iteraciones):
+                validate(graphql_schema, parse(consulta))
+
+        def con_cache():
+            for _ in range(iteraciones):
+                cache.obtener(hash_consulta(consulta), consulta, graphql_schema)
+
+        _, ms_sin = medir(sin_cache, repeticiones=3)
+        _, ms_con = medir(con_cache, repeticiones=3)
+        us_sin = ms_sin * 1000 / iteraciones
+        us_con = ms_con * 1000 / iteraciones
+        filas.append((nombre, f'{us_sin:.1f}', f'{us_con:.1f}', f'{us_sin - us_con:.1f}'))
+
+    imprimir_tabla(
+        f'Parse + validate por petición ({iteraciones} iteraciones)',
+        filas, ('consulta', 'µs sin caché', 'µs con caché', 'µs ahorrados'),
+    )
+
+
+if __name__ == '__main__':
+    main()
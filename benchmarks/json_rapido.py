@@ -0,0 +1,90 @@
+"""
+Benchmark: CPU para codificar JSON en un broadcast de ws/notificaciones/
+(json.dumps por cliente frente al frame codificado una vez al publicar)
+y en una página de /api/libros/ (JSONRenderer de DRF frente al de
+libros/json_rapido.py).
+Ejecutar con: python -m benchmarks.json_rapido [clientes] [libros_por_pagina]
+"""
+import json
+import statistics
+import sys
+import time
+from decimal import Decimal
+
+from benchmarks.entorno import base_de_datos_temporal, imprimir_tabla
+
+from django.contrib.auth.models import User
+from rest_framework.renderers import JSONRenderer
+
+from libros.json_rapido import JSONRapidoRenderer
+from libros.models import Autor, Categoria, Libro
+from libros.notificaciones import delta, evento_libro
+from libros.serializers import LibroSerializer
+
+
+def cpu_ms(funcion, repeticiones=7):
+    """Mediana de tiempo de CPU del proceso en milisegundos"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.process_time()
+        funcion()
+        tiempos.append((time.process_time() - inicio) * 1000)
+    return statistics.median(tiempos)
+
+
+def broadcast(clientes):
+    libro = delta(42, 3, Libro.DISPONIBLE, 7, 2)
+
+    def antes():
+        # Cada consumer recibía el dict y lo codificaba con json.dumps
+        evento = {'type': 'libro_actualizado', 'libro': libro}
+        for _ in range(clientes):
+            json.dumps({'type': 'libro_actualizado', 'libro': evento['libro']})
+
+    def despues():
+        evento = evento_libro(libro)
+        for _ in range(clientes):
+            evento['frames']['json']
+
+    return cpu_ms(antes), cpu_ms(despues)
+
+
+def pagina(libros_por_pagina):
+    usuario = User.objects.create_user('bench', password='x')
+    categoria = Categoria.objects.create(nombre='Novela')
+    autor = Autor.objects.create(nombre='Miguel', apellido='de Unamuno')
+    Libro.objects.bulk_create([
+        Libro(
+            titulo=f'Niebla, edición {i}', isbn=f'{9790000000000 + i}', autor=autor,
+            categoria=categoria, stock=3, precio=Decimal('199.90'), creado_por=usuario,
+            descripcion='Nivola sobre Augusto Pérez y su creador. ' * 5,
+        )
+        for i in range(libros_por_pagina)
+    ])
+    datos = {
+        'count': libros_por_pagina, 'next': None, 'previous': None,
+        'results': LibroSerializer(Libro.objects.select_related('autor', 'categoria'), many=True).data,
+    }
+    assert JSONRenderer().render(datos) == JSONRapidoRenderer().render(datos)
+    return cpu_ms(lambda: JSONRenderer().render(datos)), cpu_ms(lambda: JSONRapidoRenderer().render(datos))
+
+
+def main():
+    clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    libros_por_pagina = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    filas = []
+    antes, despues = broadcast(clientes)
+    filas.append((f'broadcast a {clientes} clientes', f'{antes:.2f}', f'{despues:.2f}', f'{antes / despues:.0f}x'))
+    with base_de_datos_temporal():
+        antes, despues = pagina(libros_por_pagina)
+    filas.append((f'página de {libros_por_pagina} libros', f'{antes:.2f}', f'{despues:.2f}', f'{antes / despues:.1f}x'))
+    imprimir_tabla(
+        'CPU de codificación JSON (mediana, ms)',
+        filas,
+        ('caso', 'antes', 'después', 'mejora'),
+    )
+
+
+if __name__ == '__main__':
+    main()
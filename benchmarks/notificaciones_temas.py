@@ -0,0 +1,116 @@
+"""
+Benchmark: mensajes entregados a 10.000 suscriptores simulados de
+ws/notificaciones/ cuando cambia el stock del catálogo, con todos en el
+grupo general (el modelo anterior) frente a suscripciones por libro,
+categoría y autor (libros/notificaciones.py). No usa base de datos: los
+deltas se publican con notificaciones.publicar sobre una capa en memoria
+que cuenta las entregas en lugar de encolarlas.
+Ejecutar con: python -m benchmarks.notificaciones_temas [suscriptores] [cambios]
+"""
+import random
+import sys
+import time
+from unittest import mock
+
+from benchmarks.entorno import imprimir_tabla
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+
+from libros import notificaciones
+
+LIBROS = 5000
+CATEGORIAS = 30
+AUTORES = 800
+
+
+class CapaContada(InMemoryChannelLayer):
+    """Capa en memoria que cuenta lo que llegaría a cada conexión"""
+
+    def __init__(self):
+        super().__init__(expiry=60, group_expiry=86400)
+        self.entregas = 0
+        self.vistos = set()
+        self.bytes = 0
+
+    def _clean_expired(self):
+        # La capa en memoria recorre todos los grupos en cada group_send;
+        # aquí no hay colas que caduquen y distorsionaría los tiempos
+        pass
+
+    async def send(self, channel, message):
+        self.entregas += 1
+        # El consumer descarta las copias del mismo evento (varios temas)
+        clave = (channel, message['evento'])
+        if clave not in self.vistos:
+            self.vistos.add(clave)
+            self.bytes += len(message['frames']['json'].encode())
+
+
+def catalogo(azar):
+    return {
+        pk: (azar.randrange(1, AUTORES + 1), azar.choice([None, *range(1, CATEGORIAS + 1)]))
+        for pk in range(1, LIBROS + 1)
+    }
+
+
+def temas_de_suscriptor(azar):
+    """Mezcla típica: unos títulos concretos, una categoría o un autor"""
+    tipo = azar.random()
+    if tipo < 0.6:
+        return [f'libro:{azar.randrange(1, LIBROS + 1)}' for _ in range(azar.randint(1, 5))]
+    if tipo < 0.85:
+        return [f'categoria:{azar.randrange(1, CATEGORIAS + 1)}']
+    return [f'autor:{azar.randrange(1, AUTORES + 1)}']
+
+
+def simular(suscripciones, deltas):
+    capa = CapaContada()
+
+    async def suscribir():
+        for i, temas in enumerate(suscripciones):
+            for tema in temas:
+                await capa.group_add(notificaciones.grupo_de_tema(tema), f'cliente.{i}')
+
+    async_to_sync(suscribir)()
+    with mock.patch.object(notificaciones, 'get_channel_layer', return_value=capa):
+        inicio = time.perf_counter()
+        notificaciones.publicar(deltas)
+        ms = (time.perf_counter() - inicio) * 1000
+    return capa.entregas, len(capa.vistos), capa.bytes, ms
+
+
+def main():
+    suscriptores = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    cambios = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    azar = random.Random(42)
+    libros = catalogo(azar)
+    deltas = [
+        notificaciones.delta(pk, azar.randint(0, 5), 'disponible', *libros[pk])
+        for pk in (azar.randrange(1, LIBROS + 1) for _ in range(cambios))
+    ]
+
+    modelos = [
+        ('todos en el grupo general', [['todo']] * suscriptores),
+        ('temas por libro/categoría/autor', [temas_de_suscriptor(azar) for _ in range(suscriptores)]),
+    ]
+    filas = []
+    for nombre, suscripciones in modelos:
+        entregas, enviados, bytes_, ms = simular(suscripciones, deltas)
+        filas.append((
+            nombre, f'{entregas:,}', f'{enviados:,}',
+            f'{enviados / suscriptores:.2f}', f'{bytes_ / 1024:,.0f}', f'{ms:,.0f}',
+        ))
+    imprimir_tabla(
+        f'{cambios} cambios de stock en un catálogo de {LIBROS} libros, {suscriptores:,} suscriptores',
+        filas,
+        ('modelo', 'entregas capa', 'al socket', 'por cliente', 'KiB al socket', 'ms publicar'),
+    )
+    print(
+        'Con el grupo general cada cambio llega a cada cliente; con temas '
+        'solo a quien sigue ese libro, su categoría o su autor.'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: latencia de /api/libros/ a distintas profundidades con
+paginación por número de página (COUNT + OFFSET) frente a cursor,
+sin la caché de respuestas (cada repetición llega a la base de datos).
+Ejecutar con: python -m benchmarks.paginacion_rest [num_libros]
+"""
+import sys
+from decimal import Decimal
+
+from benchmarks.entorno import base_de_datos_temporal, imprimir_tabla, medir
+
+from django.test.utils import override_settings
+from rest_framework.test import APIRequestFactory
+from libros.api_views import LibroViewSet
+from libros.models import Autor, Libro
+from libros.paginacion import codificar_cursor
+
+TAMANO_PAGINA = 20
+
+
+def sembrar(num_libros):
+    autor = Autor.objects.create(nombre='Autor', apellido='Bench')
+    for inicio in range(0, num_libros, 5000):
+        Libro.objects.bulk_create([
+            Libro(
+                titulo=f'Libro {i}', isbn=f'{9790000000000 + i}', autor=autor,
+                stock=3, precio=Decimal('100.00'),
+            )
+            for i in range(inicio, min(inicio + 5000, num_libros))
+        ])
+
+
+def main():
+    num_libros = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    vista = LibroViewSet.as_view({'get': 'list'})
+    fabrica = APIRequestFactory()
+    orden = ('-fecha_creacion', '-id')
+
+    with base_de_datos_temporal(), override_settings(CACHE_RESPUESTAS={'ACTIVO': False}):
+        sembrar(num_libros)
+        total_paginas = num_libros // TAMANO_PAGINA
+
+        filas = []
+        for pagina in (1, 10, 100, total_paginas // 2, total_paginas):
+            desplazamiento = (pagina - 1) * TAMANO_PAGINA
+            anterior = None
+            if desplazamiento:
+                anterior = Libro.objects.order_by(*orden)[desplazamiento - 1]
+            cursor = codificar_cursor(anterior, orden) if anterior else ''
+
+            def por_numero():
+                respuesta = vista(fabrica.get(
+                    '/api/libros/', {'page': pagina, 'page_size': TAMANO_PAGINA}
+                ))
+                assert respuesta.status_code == 200
+
+            def por_cursor():
+                respuesta = vista(fabrica.get('/api/libros/', {
+                    'cursor': cursor, 'page_size': TAMANO_PAGINA, 'count': 'false',
+                }))
+                assert respuesta.status_code == 200
+
+            consultas_n, ms_n = medir(por_numero)
+            consultas_c, ms_c = medir(por_cursor)
+            filas.append((
+                pagina, f'{ms_n:.1f}', consultas_n, f'{ms_c:.1f}', consultas_c,
+            ))
+
+        imprimir_tabla(
+            f'/api/libros/ sobre {num_libros} libros, {TAMANO_PAGINA} por página',
+            filas,
+            ('página', 'ms ?page=', 'consultas', 'ms ?cursor=', 'consultas'),
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark: bytes en el cable y tiempo de codificación de 10.000 cambios
+de stock por segundo en ws/notificaciones/ con los frames de cada
+subprotocolo (libros/protocolos.py) frente al JSON que enviaba antes el
+consumer (json.dumps con los separadores por defecto). No usa base de datos.
+Ejecutar con: python -m benchmarks.subprotocolos [cambios_por_segundo]
+"""
+import json
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.entorno import imprimir_tabla
+
+from libros.json_rapido import dumps
+from libros.models import Libro
+from libros.notificaciones import delta
+from libros.protocolos import FORMATOS_BINARIOS, compacto
+
+
+def cabecera_websocket(longitud):
+    """Bytes de la cabecera de un frame del servidor (sin máscara)"""
+    if longitud < 126:
+        return 2
+    return 4 if longitud < 65536 else 10
+
+
+def medir(codificar, cambios, repeticiones=5):
+    """(bytes en el cable, ms de CPU mediana) para codificar todos los cambios"""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.process_time()
+        frames = [codificar(libro) for libro in cambios]
+        tiempos.append((time.process_time() - inicio) * 1000)
+    total = sum(len(f) + cabecera_websocket(len(f)) for f in frames)
+    return total, statistics.median(tiempos)
+
+
+def main():
+    por_segundo = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    azar = random.Random(7)
+    cambios = [
+        delta(
+            azar.randrange(1, 200000), azar.randint(0, 40), Libro.DISPONIBLE,
+            azar.randrange(1, 5000), azar.choice([None, *range(1, 60)]),
+        )
+        for _ in range(por_segundo)
+    ]
+
+    variantes = [
+        ('JSON anterior', lambda libro: json.dumps({'type': 'libro_actualizado', 'libro': libro}).encode()),
+        ('biblioteca.json', lambda libro: dumps({'type': 'libro_actualizado', 'libro': libro}).encode()),
+    ] + [
+        (f'biblioteca.{formato}', lambda libro, codificar=codificar: codificar(compacto(libro)))
+        for formato, (codificar, _) in FORMATOS_BINARIOS.items()
+    ]
+
+    filas = []
+    referencia = None
+    for nombre, codificar in variantes:
+        total, ms = medir(codificar, cambios)
+        referencia = referencia or total
+        filas.append((
+            nombre, f'{total / por_segundo:.1f}', f'{total / 1024:,.0f}',
+            f'{100 * total / referencia:.0f}%', f'{ms:.1f}',
+        ))
+    imprimir_tabla(
+        f'{por_segundo:,} cambios de stock por segundo, por cliente',
+        filas,
+        ('formato', 'bytes/frame', 'KiB/s', 'vs anterior', 'ms CPU/s codificando'),
+    )
+    print('Los frames se codifican una vez por cambio (notificaciones.evento_libro), no por cliente.')
+
+
+if __name__ == '__main__':
+    main()
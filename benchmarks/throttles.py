@@ -0,0 +1,135 @@
+"""
+Benchmark: operaciones de caché y bytes por petición de los throttles
+por defecto (burst 60/min + sustained 1000/day) de un mismo usuario a lo
+largo de un día, con el SimpleRateThrottle de DRF frente a las ventanas
+de contadores de libros/throttles.py (no usa base de datos).
+Ejecutar con: python -m benchmarks.throttles [peticiones]
+"""
+import pickle
+import sys
+from unittest import mock
+
+from benchmarks.entorno import imprimir_tabla
+
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.throttling import SimpleRateThrottle, UserRateThrottle
+from rest_framework.views import APIView
+
+from libros.throttles import BurstRateThrottle, SustainedRateThrottle
+
+DIA = 86400
+
+
+class CacheContada(LocMemCache):
+    """LocMemCache que cuenta operaciones y bytes serializados"""
+
+    def __init__(self):
+        super().__init__('benchmark-throttles', {})
+        self.operaciones = 0
+        self.bytes = 0
+
+    def _contar(self, *valores):
+        self.operaciones += 1
+        self.bytes += sum(len(pickle.dumps(v, pickle.HIGHEST_PROTOCOL)) for v in valores)
+
+    def get(self, key, default=None, version=None):
+        valor = super().get(key, default, version)
+        self._contar(valor)
+        return valor
+
+    def get_many(self, keys, version=None):
+        # BaseCache.get_many llama a get() por llave: contar una sola operación
+        valores = {}
+        for key in keys:
+            valor = super().get(key, self._missing_key, version)
+            if valor is not self._missing_key:
+                valores[key] = valor
+        self._contar(*valores.values())
+        return valores
+
+    def set(self, key, value, timeout=None, version=None):
+        self._contar(value)
+        return super().set(key, value, timeout, version)
+
+    def add(self, key, value, timeout=None, version=None):
+        self._contar(value)
+        return super().add(key, value, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        valor = super().incr(key, delta, version)
+        self._contar(valor)
+        return valor
+
+
+class BurstAntes(UserRateThrottle):
+    scope = 'burst'
+
+
+class SustainedAntes(UserRateThrottle):
+    scope = 'sustained'
+
+
+def vista(*clases):
+    class Vista(APIView):
+        throttle_classes = clases
+        permission_classes = []
+
+        def get(self, request):
+            return None
+
+        def finalize_response(self, request, response, *args, **kwargs):
+            return response
+
+    return Vista()
+
+
+def simular(clases, peticiones, puntos):
+    """[(desde, hasta, ops por petición, bytes por petición)] entre puntos"""
+    cache = CacheContada()
+    usuario = mock.Mock(pk=1, is_authenticated=True)
+    fabrica = APIRequestFactory()
+    instante = [0.0]
+    tramos = []
+    marca = (0, 0, 0)
+    with mock.patch.object(SimpleRateThrottle, 'cache', cache), \
+            mock.patch.object(SimpleRateThrottle, 'timer', lambda _: instante[0]):
+        v = vista(*clases)
+        for i in range(1, peticiones + 1):
+            instante[0] = i * (DIA - 1) / peticiones
+            peticion = fabrica.get('/api/libros/')
+            force_authenticate(peticion, usuario)
+            v.check_throttles(v.initialize_request(peticion))
+            if i in puntos:
+                n = i - marca[0]
+                tramos.append((
+                    marca[0] + 1, i,
+                    (cache.operaciones - marca[1]) / n, (cache.bytes - marca[2]) / n,
+                ))
+                marca = (i, cache.operaciones, cache.bytes)
+    return tramos
+
+
+def main():
+    peticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 999
+    puntos = {10, 100, 500, peticiones}
+    antes = simular((BurstAntes, SustainedAntes), peticiones, puntos)
+    despues = simular((BurstRateThrottle, SustainedRateThrottle), peticiones, puntos)
+
+    filas = [
+        (f'{desde}-{hasta}', f'{ops_a:.1f}', f'{bytes_a:.0f}', f'{ops_d:.1f}', f'{bytes_d:.0f}')
+        for (desde, hasta, ops_a, bytes_a), (_, _, ops_d, bytes_d) in zip(antes, despues)
+    ]
+    imprimir_tabla(
+        f'{peticiones} peticiones de un usuario en un día (burst + sustained), promedio por petición',
+        filas,
+        ('peticiones', 'ops DRF', 'bytes DRF', 'ops ventanas', 'bytes ventanas'),
+    )
+    print(
+        'Con RedisCache cada operación de DRF es una ida y vuelta; las '
+        'ventanas van en un solo pipeline (una ida, más otra si se rechaza).'
+    )
+
+
+if __name__ == '__main__':
+    main()
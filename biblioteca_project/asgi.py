@@ -1,14 +1,18 @@
 import os
-from django.core.asgi import get_asgi_application
+import django
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from channels.security.websocket import AllowedHostsOriginValidator
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'biblioteca_project.settings')
 
-django_asgi_app = get_asgi_application()
+django.setup(set_prefix=False)
 
-from libros.routing import websocket_urlpatterns
+from libros.conexiones import ASGIHandlerConPool  # noqa: E402
+from libros.routing import websocket_urlpatterns  # noqa: E402
+
+# Vistas en el pool de hilos con conexiones persistentes (libros/conexiones.py)
+django_asgi_app = ASGIHandlerConPool()
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
@@ -17,4 +21,4 @@ application = ProtocolTypeRouter({
             URLRouter(websocket_urlpatterns)
         )
     ),
-})
\ No newline at end of file
+})
@@ -48,7 +48,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'libros.middleware.ConexionesMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'libros.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,9 +98,39 @@ DATABASES = {
             'charset': 'utf8mb4',
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         },
+        # Conexiones persistentes por hilo del pool (libros/conexiones.py),
+        # verificadas antes de reusarlas
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Réplicas de solo lectura (hosts separados por comas), con las mismas
+# credenciales que la primaria. libros.routers.ReplicaRouter les manda
+# las lecturas del catálogo; sin hosts todo va a 'default'.
+DB_REPLICA_HOSTS = config('DB_REPLICA_HOSTS', default='', cast=Csv())
+for _numero, _host in enumerate(DB_REPLICA_HOSTS, start=1):
+    DATABASES[f'replica_{_numero}'] = {
+        **DATABASES['default'], 'HOST': _host,
+        # En las pruebas la réplica es la misma base que la primaria
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['libros.routers.ReplicaRouter']
+
+# Hilos que comparten database_sync_to_async y las vistas bajo ASGI: a lo
+# más una conexión persistente por hilo y base de datos
+CONEXIONES_DB = {
+    'HILOS': config('DB_HILOS', default=10, cast=int),
+}
+
+REPLICAS = {
+    'ALIAS': [alias for alias in DATABASES if alias.startswith('replica_')],
+    'MODELOS': ['libros.Libro', 'libros.Autor', 'libros.Categoria'],
+    # Segundos que un cliente lee de la primaria después de escribir
+    'FIJAR_SEGUNDOS': config('REPLICAS_FIJAR_SEGUNDOS', default=5, cast=int),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -192,6 +224,17 @@ REST_FRAMEWORK = {
         'rest_framework.filters.OrderingFilter',
     ],
     
+    # JSON con ujson (libros/json_rapido.py); misma salida que el de DRF
+    'DEFAULT_RENDERER_CLASSES': [
+        'libros.json_rapido.JSONRapidoRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'libros.json_rapido.JSONRapidoParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    
     'DEFAULT_THROTTLE_CLASSES': [
         'libros.throttles.BurstRateThrottle',
         'libros.throttles.SustainedRateThrottle',
@@ -311,20 +354,135 @@ OAUTH2_PROVIDER = {
 # ASGI Application
 ASGI_APPLICATION = 'biblioteca_project.asgi.application'
 
-CHANNEL_LAYERS = {
+# Capas de canales (WebSockets). Con CHANNEL_REDIS_HOSTS (URLs redis://
+# separadas por comas) se usa channels_redis: los mensajes viajan en
+# msgpack y cada grupo vive en uno de los hosts (hash consistente), así
+# varios procesos Daphne comparten grupos. Sin hosts, memoria del proceso.
+CHANNEL_REDIS_HOSTS = config('CHANNEL_REDIS_HOSTS', default='', cast=Csv())
+
+# Una capa por tipo de tráfico para ajustar cola y caducidad por grupo
+CAPAS_CANALES = {
+    # Notificaciones de stock: un estado viejo no sirve, cola corta
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'prefix': 'biblioteca:notificaciones:',
+        'expiry': 10,
+        'group_expiry': 86400,
+        'capacity': 50,
+    },
+    # Chat: cada mensaje cuenta, más cola y más tiempo antes de descartar
+    'chat': {
+        'prefix': 'biblioteca:chat:',
+        'expiry': 60,
+        'group_expiry': 86400,
+        'capacity': 200,
+    },
+}
+
+if CHANNEL_REDIS_HOSTS:
+    CHANNEL_LAYERS = {
+        alias: {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': CHANNEL_REDIS_HOSTS, **capa},
+        }
+        for alias, capa in CAPAS_CANALES.items()
+    }
+else:
+    CHANNEL_LAYERS = {
+        alias: {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {k: v for k, v in capa.items() if k != 'prefix'},
+        }
+        for alias, capa in CAPAS_CANALES.items()
     }
+
+# Notificaciones de stock por ws/notificaciones/ (libros/notificaciones.py):
+# ventana para agrupar cambios de un libro y temas por conexión
+NOTIFICACIONES_STOCK = {
+    'VENTANA': config('NOTIFICACIONES_VENTANA', default=0.25, cast=float),
+    'MAX_SUSCRIPCIONES': config('NOTIFICACIONES_MAX_SUSCRIPCIONES', default=50, cast=int),
+}
+
+# Cola de salida por conexión WebSocket (libros/contrapresion.py): máximo
+# de mensajes pendientes y segundos que puede seguir llena antes de cerrar
+SALIDA_WEBSOCKET = {
+    'MAX_COLA': 100,
+    'TOLERANCIA': 5.0,
+}
+
+# Motor de libros/json_rapido.py: 'ujson' o 'json' (biblioteca estándar)
+JSON_RAPIDO = {
+    'MOTOR': 'ujson',
+}
+
+# Historial del chat (libros/chat.py): mensajes en memoria por sala y
+# guardado en lotes cada INTERVALO segundos
+CHAT_PERSISTENTE = {
+    'ACTIVO': config('CHAT_PERSISTENTE', default=True, cast=bool),
+    'HISTORIAL': 50,
+    'INTERVALO': 1.0,
+    'LOTE': 500,
 }
 
 # GraphQL Settings
 GRAPHENE = {
     'SCHEMA': 'libros.schema.schema',
-    'MIDDLEWARE': [
-        'graphene_django.debug.DjangoDebugMiddleware',
+    # Sin DjangoDebugMiddleware (graphene lo agrega con DEBUG): el esquema
+    # no expone `_debug` y, sin ese campo, el middleware deja envuelto el
+    # cursor de cada conexión (también el de las réplicas) para siempre
+    'MIDDLEWARE': [],
+}
+
+# Caché: Redis si hay REDIS_URL (compartida entre procesos). En memoria local
+# cada proceso tiene su propia copia y solo ve sus propias invalidaciones
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Caché de respuestas de los listados del catálogo (libros/cache_respuestas.py)
+CACHE_RESPUESTAS = {
+    'ALIAS': 'default',
+    'TTL': config('CACHE_RESPUESTAS_TTL', default=300, cast=int),
+}
+
+# Límites por ruta del RateLimitMiddleware (libros/limites.py). Motor
+# 'redis' (atómico entre procesos) si la caché es Redis, si no 'local'
+RATE_LIMIT = {
+    'POLITICAS': [
+        {'ruta': '/api/auth/', 'limite': 20, 'periodo': 60, 'por': 'ip'},
+        {'ruta': '/api/', 'limite': 100, 'periodo': 3600, 'por': 'usuario'},
     ],
 }
 
+# Búsqueda de texto del catálogo (libros/busqueda.py). None: FULLTEXT en
+# MySQL, índice invertido propio en los demás motores
+BUSQUEDA_BACKEND = config('BUSQUEDA_BACKEND', default=None)
+
+# Límites de costo y profundidad de las consultas GraphQL (libros/graphql_costo.py)
+GRAPHQL_COSTO = {
+    'PROFUNDIDAD_MAXIMA': config('GRAPHQL_PROFUNDIDAD_MAXIMA', default=10, cast=int),
+    'COSTO_MAXIMO': config('GRAPHQL_COSTO_MAXIMO', default=5000, cast=int),
+    'TAMANO_LISTA': 20,
+}
+
+# Consultas persistidas (APQ) y caché de documentos (libros/graphql_persistidas.py)
+GRAPHQL_APQ = {
+    'TAMANO_CACHE_DOCUMENTOS': 500,
+    'SOLO_REGISTRADAS': config('GRAPHQL_SOLO_REGISTRADAS', default=False, cast=bool),
+    'CONSULTAS_REGISTRADAS': BASE_DIR / 'graphql_consultas.json',
+    'MAX_AGE_GET': config('GRAPHQL_MAX_AGE_GET', default=0, cast=int),
+}
+
 # Solo para PRODUCCIÓN (no desarrollo)
 if not DEBUG:
     # Forzar HTTPS
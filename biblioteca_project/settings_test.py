@@ -0,0 +1,55 @@
+"""
+Configuración para correr las pruebas localmente
+Ejecutar con: python manage.py test --settings=biblioteca_project.settings_test
+Usa SQLite y caché en memoria, sin servicios externos (MySQL, Redis).
+"""
+import os
+
+# Valores por defecto para las variables que settings.py lee del .env
+os.environ.setdefault('SECRET_KEY', 'clave-solo-para-pruebas')
+os.environ.setdefault('DEBUG', 'True')
+os.environ.setdefault('ALLOWED_HOSTS', 'localhost,127.0.0.1,testserver')
+os.environ.setdefault('DB_NAME', 'biblioteca')
+os.environ.setdefault('DB_USER', '')
+os.environ.setdefault('DB_PASS', '')
+os.environ.setdefault('DB_HOST', '')
+os.environ.setdefault('DB_PORT', '')
+os.environ.setdefault('GOOGLE_CLIENT_ID', 'test')
+os.environ.setdefault('GOOGLE_SECRET_CLIENT', 'test')
+
+from .settings import *  # noqa: E402,F401,F403
+from .settings import BASE_DIR  # noqa: E402
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'timeout': 30,
+        },
+        'TEST': {
+            # Archivo (no memoria) para que las pruebas con hilos
+            # compartan la misma base de datos
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    },
+    # Segunda base para probar ReplicaRouter; solo se crea en las pruebas
+    # que la declaran y REPLICAS['ALIAS'] queda vacío salvo en ellas
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db_replica.sqlite3',
+        },
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from libros import web_views
 
-from graphene_django.views import GraphQLView
+from libros.graphql_views import BibliotecaGraphQLView
 from django.views.decorators.csrf import csrf_exempt
 
 urlpatterns = [
@@ -21,5 +21,5 @@ urlpatterns = [
     path('oauth/login/', web_views.oauth_login, name='oauth_login'),
     path('login/jwt/', web_views.jwt_login_page, name='jwt_login_page'),
     path('chat/', web_views.chat_page, name='chat_page'),
-    path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql/', csrf_exempt(BibliotecaGraphQLView.as_view(graphiql=True))),
 ]
\ No newline at end of file
@@ -3,11 +3,13 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from django_filters.rest_framework import DjangoFilterBackend
+from django.db.models import Count, Max, Q
 
 from .models import Categoria, Autor, Libro, Prestamo
 from .serializers import (
     CategoriaSerializer, AutorSerializer, 
-    LibroSerializer, PrestamoSerializer
+    LibroSerializer, PrestamoSerializer,
+    PrestamoLoteSerializer, DevolucionLoteSerializer
 )
 
 from rest_framework.decorators import api_view, throttle_classes
@@ -17,9 +19,15 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from .external_services import GoogleBooksAPI
+from .services import PrestamoService
+from .paginacion import PaginacionCursor, PaginacionNumerada
+from .busqueda import BusquedaFilter
+from .autocompletado import LIMITE as LIMITE_AUTOCOMPLETADO, indice as indice_autocompletado
+from .cache_respuestas import cachear_respuesta
+from .condicional import RespuestaCondicionalMixin
 
 from .throttles import BurstRateThrottle
-class CategoriaViewSet(viewsets.ModelViewSet):
+class CategoriaViewSet(RespuestaCondicionalMixin, viewsets.ModelViewSet):
     """
     ViewSet para Categorías
     - GET /api/categorias/ - Listar todas
@@ -35,42 +43,75 @@ class CategoriaViewSet(viewsets.ModelViewSet):
     search_fields = ['nombre', 'descripcion']
     ordering_fields = ['nombre', 'fecha_creacion']
     ordering = ['nombre']
+    pagination_class = PaginacionNumerada
+    
+    @cachear_respuesta('categoria')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cachear_respuesta('categoria')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
-class AutorViewSet(viewsets.ModelViewSet):
+class AutorViewSet(RespuestaCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para Autores"""
     
-    queryset = Autor.objects.all()
+    queryset = AutorSerializer.anotar_queryset(Autor.objects.all())
     serializer_class = AutorSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, BusquedaFilter]
     filterset_fields = ['pais_origen']
     search_fields = ['nombre', 'apellido', 'biografia']
     ordering_fields = ['apellido', 'nombre', 'fecha_creacion']
     ordering = ['apellido', 'nombre']
+    pagination_class = PaginacionNumerada
+    # total_libros cambia con los libros del autor (ETag, ver condicional.py)
+    agregados_version = {
+        'fecha_actualizacion': Max('fecha_actualizacion'),
+        'libros_actualizacion': Max('libros__fecha_actualizacion'),
+        'libros_activos': Count('libros', filter=Q(libros__activo=True), distinct=True),
+    }
+    campos_version = ('fecha_actualizacion', 'total_libros')
     
     @action(detail=True, methods=['get'])
+    @cachear_respuesta('autor', 'libro')
     def libros(self, request, pk=None):
         """Endpoint personalizado: /api/autores/{id}/libros/"""
         autor = self.get_object()
-        libros = autor.libros.filter(activo=True)
+        libros = autor.libros.filter(activo=True).select_related('autor', 'categoria')
         serializer = LibroSerializer(libros, many=True)
         return Response(serializer.data)
 
 
-class LibroViewSet(viewsets.ModelViewSet):
+class LibroViewSet(RespuestaCondicionalMixin, viewsets.ModelViewSet):
     """ViewSet para Libros"""
     
     queryset = Libro.objects.filter(activo=True).select_related('autor', 'categoria')
     serializer_class = LibroSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, BusquedaFilter]
     filterset_fields = ['estado', 'categoria', 'autor']
     search_fields = ['titulo', 'isbn', 'descripcion']
     ordering_fields = ['titulo', 'precio', 'fecha_publicacion', 'valoracion']
-    ordering = ['-fecha_creacion']
+    ordering = ['-fecha_creacion', '-id']
+    pagination_class = PaginacionCursor
+    # Se serializan los nombres del autor y de la categoría
+    agregados_version = {
+        'fecha_actualizacion': Max('fecha_actualizacion'),
+        'autor_actualizacion': Max('autor__fecha_actualizacion'),
+        'categoria_actualizacion': Max('categoria__fecha_actualizacion'),
+    }
+    campos_version = (
+        'fecha_actualizacion', 'autor.fecha_actualizacion', 'categoria.fecha_actualizacion',
+    )
+    
+    @cachear_respuesta('libro')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     @action(detail=False, methods=['get'])
+    @cachear_respuesta('libro')
     def disponibles(self, request):
         """Endpoint: /api/libros/disponibles/"""
         libros = self.queryset.filter(
@@ -80,6 +121,18 @@ class LibroViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(libros, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Endpoint: /api/libros/autocomplete/?q=cien&limite=10
+        Título, autor o ISBN por prefijo, desde el índice en memoria
+        """
+        try:
+            limite = max(1, min(int(request.query_params.get('limite', LIMITE_AUTOCOMPLETADO)), 50))
+        except (TypeError, ValueError):
+            limite = LIMITE_AUTOCOMPLETADO
+        return Response(indice_autocompletado.buscar(request.query_params.get('q', ''), limite))
+    
     @action(detail=True, methods=['post'])
     def actualizar_stock(self, request, pk=None):
         """
@@ -111,12 +164,12 @@ class PrestamoViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['estado', 'usuario']
     ordering_fields = ['fecha_prestamo', 'fecha_devolucion_esperada']
-    ordering = ['-fecha_prestamo']
+    ordering = ['-fecha_prestamo', '-id']
+    pagination_class = PaginacionCursor
     
     def perform_create(self, serializer):
-        """Al crear préstamo, asignar usuario actual y actualizar stock"""
-        prestamo = serializer.save(usuario=self.request.user)
-        prestamo.libro.actualizar_stock(-1)  # Reducir stock en 1
+        """Al crear préstamo, asignar usuario actual y reservar un ejemplar"""
+        PrestamoService.prestar(serializer, self.request.user)
     
     @action(detail=True, methods=['post'])
     def devolver(self, request, pk=None):
@@ -124,26 +177,71 @@ class PrestamoViewSet(viewsets.ModelViewSet):
         Endpoint: POST /api/prestamos/{id}/devolver/
         Marca el préstamo como devuelto
         """
-        from django.utils import timezone
-        
         prestamo = self.get_object()
         
-        if prestamo.estado == Prestamo.DEVUELTO:
+        if not PrestamoService.devolver(prestamo):
             return Response(
                 {'error': 'Este préstamo ya fue devuelto'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        prestamo.fecha_devolucion_real = timezone.now()
-        prestamo.estado = Prestamo.DEVUELTO
-        prestamo.save()
-        
-        # Incrementar stock del libro
-        prestamo.libro.actualizar_stock(1)
-        
         serializer = self.get_serializer(prestamo)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Endpoint: POST /api/prestamos/bulk/
+        Body: {"libros": [1, 2, 2], "fecha_devolucion_esperada": "2026-01-31"}
+        Presta varios libros al usuario actual; resultado por libro
+        """
+        entrada = PrestamoLoteSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        
+        resultados = PrestamoService.prestar_lote(
+            entrada.validated_data['libros'],
+            request.user,
+            entrada.validated_data['fecha_devolucion_esperada'],
+            entrada.validated_data['notas'],
+        )
+        return self._respuesta_lote('libro', resultados)
+    
+    @action(detail=False, methods=['post'], url_path='bulk-devolver')
+    def bulk_devolver(self, request):
+        """
+        Endpoint: POST /api/prestamos/bulk-devolver/
+        Body: {"prestamos": [10, 11, 12]}
+        Devuelve varios préstamos; resultado por préstamo
+        """
+        entrada = DevolucionLoteSerializer(data=request.data)
+        entrada.is_valid(raise_exception=True)
+        
+        resultados = PrestamoService.devolver_lote(
+            entrada.validated_data['prestamos'],
+            self.get_queryset(),
+        )
+        return self._respuesta_lote('prestamo_id', resultados)
+    
+    def _respuesta_lote(self, clave, resultados):
+        """Formato común de las respuestas en lote"""
+        items = []
+        for id_solicitado, prestamo, error in resultados:
+            if error:
+                items.append({clave: id_solicitado, 'ok': False, 'error': error})
+            else:
+                items.append({
+                    clave: id_solicitado,
+                    'ok': True,
+                    'prestamo': self.get_serializer(prestamo).data,
+                })
+        
+        exitosos = sum(1 for item in items if item['ok'])
+        return Response({
+            'exitosos': exitosos,
+            'fallidos': len(items) - exitosos,
+            'resultados': items,
+        })
+    
 @api_view(['GET'])
 @throttle_classes([BurstRateThrottle])
 def api_intensiva(request):
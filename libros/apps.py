@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class LibrosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'libros'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .graphql_persistidas import verificar_configuracion
+
+        verificar_configuracion()
@@ -0,0 +1,374 @@
+"""
+Índice en memoria para el autocompletado de /api/libros/autocomplete/.
+
+Cada proceso guarda arreglos ordenados de claves normalizadas (título,
+ISBN y nombre del autor en ambos órdenes) y busca los prefijos con
+bisect: O(log n) por tecla, sin tocar la base de datos.
+
+- Se construye la primera vez que se consulta.
+- Los post_save/post_delete de Libro y Autor (signals.py) lo actualizan
+  en el proceso que hizo el cambio y publican el cambio en la caché de
+  Django bajo una versión compartida; los demás procesos aplican los
+  cambios que les faltan al revisar la versión, sin consultar la base.
+- Si un cambio ya no está en la caché (expiró o se perdió) o faltan
+  demasiados, el índice se reconstruye en un hilo aparte y se reemplaza
+  de una vez; mientras tanto el anterior sigue respondiendo.
+"""
+import heapq
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from itertools import compress
+
+from django.core.cache import cache
+from django.db import connections
+
+from .busqueda import tokenizar
+
+logger = logging.getLogger(__name__)
+
+LLAVE_VERSION = 'autocompletado:version'
+LIMITE = 10
+# Cada cuántos segundos se compara la versión local con la compartida
+INTERVALO_VERSION = 2.0
+# Segundos que se guarda cada cambio publicado
+TTL_CAMBIOS = 600
+# Con más cambios pendientes es más barato reconstruir
+MAX_CAMBIOS = 1000
+# Altas y bajas acumuladas (como mínimo) antes de reordenar los arreglos
+MAX_PENDIENTES = 1024
+
+
+def llave_cambio(version):
+    return f'autocompletado:cambio:{version}'
+
+
+def normalizar_clave(texto):
+    return ' '.join(tokenizar(texto, stopwords=False))
+
+
+class ClavesOrdenadas:
+    """
+    Arreglo ordenado de claves con el id de su objeto en paralelo.
+
+    Las altas van a una lista ordenada chica y las bajas marcan su
+    posición en el arreglo; cuando se acumulan se reordena todo de una
+    vez. Insertar en medio del arreglo grande costaría O(n) por clave.
+    """
+
+    def __init__(self, pares=()):
+        pares = sorted(pares)
+        self.claves = [clave for clave, _ in pares]
+        self.ids = array('q', (pk for _, pk in pares))
+        self.nuevos = []
+        self.borrados = set()
+
+    def agregar(self, clave, pk):
+        if not clave:
+            return
+        insort(self.nuevos, (clave, pk))
+        self._compactar()
+
+    def quitar(self, clave, pk):
+        i = bisect_left(self.nuevos, (clave, pk))
+        if i < len(self.nuevos) and self.nuevos[i] == (clave, pk):
+            del self.nuevos[i]
+            return
+        i = self._posicion(clave, pk)
+        if i is not None:
+            self.borrados.add(i)
+            self._compactar()
+
+    def _posicion(self, clave, pk):
+        """Posición de (clave, pk) en el arreglo, o None si no está"""
+        i = bisect_left(self.claves, clave)
+        while i < len(self.claves) and self.claves[i] == clave:
+            if self.ids[i] == pk and i not in self.borrados:
+                return i
+            i += 1
+        return None
+
+    def _compactar(self):
+        # Reordenar cuesta O(n): se hace cada n / 64 cambios como mínimo
+        if len(self.nuevos) + len(self.borrados) <= max(MAX_PENDIENTES, len(self.claves) >> 6):
+            return
+        claves, ids = self.claves, self.ids
+        if self.borrados:
+            vivos = bytearray(b'\x01') * len(claves)
+            for i in self.borrados:
+                vivos[i] = 0
+            claves = list(compress(claves, vivos))
+            ids = array('q', compress(ids, vivos))
+        # Intercalar por tramos: cada alta cuesta un bisect y no un insert
+        self.claves, self.ids = [], array('q')
+        anterior = 0
+        for clave, pk in self.nuevos:
+            i = bisect_left(claves, clave, anterior)
+            while i < len(claves) and claves[i] == clave and ids[i] < pk:
+                i += 1
+            self.claves += claves[anterior:i]
+            self.ids += ids[anterior:i]
+            self.claves.append(clave)
+            self.ids.append(pk)
+            anterior = i
+        self.claves += claves[anterior:]
+        self.ids += ids[anterior:]
+        self.nuevos = []
+        self.borrados = set()
+
+    def prefijo(self, prefijo):
+        """ids cuyas claves empiezan con `prefijo`, en orden alfabético"""
+        def del_arreglo():
+            i = bisect_left(self.claves, prefijo)
+            while i < len(self.claves) and self.claves[i].startswith(prefijo):
+                if i not in self.borrados:
+                    yield self.claves[i], self.ids[i]
+                i += 1
+
+        def de_nuevos():
+            i = bisect_left(self.nuevos, (prefijo,))
+            while i < len(self.nuevos) and self.nuevos[i][0].startswith(prefijo):
+                yield self.nuevos[i]
+                i += 1
+
+        pares = heapq.merge(del_arreglo(), de_nuevos()) if self.nuevos else del_arreglo()
+        for _, pk in pares:
+            yield pk
+
+
+class IndicePrefijos:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.cargado = False
+        self.version = 0
+        self.revisado = 0.0
+        # Primera versión que no estaba en la caché en la revisión anterior
+        self.faltante = None
+        self.reconstruccion = None
+
+    # ----- Construcción -----
+
+    def cargar(self, libros, autores):
+        """
+        libros: (id, titulo, isbn, autor_id) de los libros activos
+        autores: (id, nombre, apellido)
+        """
+        self.libros = {}
+        self.autores = {}
+        self.libros_de_autor = {}
+        pares_libros, pares_autores = [], []
+        for pk, nombre, apellido in autores:
+            self.autores[pk] = (f'{nombre} {apellido}', nombre, apellido)
+            self.libros_de_autor[pk] = set()
+            pares_autores.extend((clave, pk) for clave in self._claves_autor(nombre, apellido))
+        for pk, titulo, isbn, autor_id in libros:
+            self.libros[pk] = (titulo, isbn, autor_id)
+            self.libros_de_autor.setdefault(autor_id, set()).add(pk)
+            pares_libros.extend((clave, pk) for clave in self._claves_libro(titulo, isbn))
+        self.claves_libros = ClavesOrdenadas(pares_libros)
+        self.claves_autores = ClavesOrdenadas(pares_autores)
+        self.cargado = True
+
+    def cargar_de_bd(self):
+        from .models import Autor, Libro
+
+        # Antes de leer: los cambios posteriores se vuelven a aplicar encima
+        version = cache.get(LLAVE_VERSION, 0)
+        self.cargar(
+            Libro.objects.filter(activo=True).values_list('id', 'titulo', 'isbn', 'autor_id'),
+            Autor.objects.values_list('id', 'nombre', 'apellido'),
+        )
+        self.version = version
+        self.faltante = None
+        self.revisado = time.monotonic()
+
+    def asegurar(self):
+        """Construir el índice si falta o aplicar los cambios de otros procesos"""
+        ahora = time.monotonic()
+        if self.cargado and ahora - self.revisado < INTERVALO_VERSION:
+            return
+        with self.lock:
+            if not self.cargado:
+                # No hay índice anterior que pueda responder mientras tanto
+                self.cargar_de_bd()
+            else:
+                self._ponerse_al_dia()
+            self.revisado = ahora
+
+    def _ponerse_al_dia(self):
+        compartida = cache.get(LLAVE_VERSION, 0)
+        if compartida == self.version:
+            return
+        if compartida < self.version or compartida - self.version > MAX_CAMBIOS:
+            # La caché se vació o faltan demasiados cambios
+            self.reconstruir_en_segundo_plano()
+            return
+        versiones = range(self.version + 1, compartida + 1)
+        cambios = cache.get_many([llave_cambio(v) for v in versiones])
+        for version in versiones:
+            cambio = cambios.get(llave_cambio(version))
+            if cambio is None:
+                # Otro proceso incrementó la versión y aún no publica el
+                # cambio; si sigue faltando en la siguiente revisión, se perdió
+                if self.faltante == version:
+                    self.reconstruir_en_segundo_plano()
+                self.faltante = version
+                return
+            self._aplicar(cambio)
+            self.version = version
+        self.faltante = None
+
+    def reconstruir_en_segundo_plano(self):
+        """Leer la base en otro hilo y reemplazar el índice al terminar"""
+        with self.lock:
+            if self.reconstruccion is not None and self.reconstruccion.is_alive():
+                return self.reconstruccion
+            self.reconstruccion = threading.Thread(
+                target=self._reconstruir, name='autocompletado', daemon=True,
+            )
+            self.reconstruccion.start()
+            return self.reconstruccion
+
+    def _reconstruir(self):
+        try:
+            nuevo = IndicePrefijos()
+            nuevo.cargar_de_bd()
+            with self.lock:
+                for atributo in (
+                    'libros', 'autores', 'libros_de_autor',
+                    'claves_libros', 'claves_autores', 'version',
+                ):
+                    setattr(self, atributo, getattr(nuevo, atributo))
+                self.faltante = None
+                self.cargado = True
+        except Exception:
+            logger.exception('No se pudo reconstruir el índice de autocompletado')
+        finally:
+            connections.close_all()
+
+    def _claves_libro(self, titulo, isbn):
+        return [clave for clave in (normalizar_clave(titulo), isbn) if clave]
+
+    def _claves_autor(self, nombre, apellido):
+        return [
+            clave for clave in {
+                normalizar_clave(f'{nombre} {apellido}'),
+                normalizar_clave(f'{apellido} {nombre}'),
+            } if clave
+        ]
+
+    # ----- Consulta -----
+
+    def buscar(self, texto, limite=LIMITE):
+        """[{id, titulo, autor}] de los libros cuyo título, ISBN o autor empieza con `texto`"""
+        prefijo = normalizar_clave(texto)
+        if not prefijo or limite < 1:
+            return []
+        self.asegurar()
+        with self.lock:
+            encontrados = []
+            vistos = set()
+
+            def agregar(pk):
+                if pk not in vistos and pk in self.libros:
+                    vistos.add(pk)
+                    encontrados.append(pk)
+                return len(encontrados) >= limite
+
+            for pk in self.claves_libros.prefijo(prefijo):
+                if agregar(pk):
+                    break
+            else:
+                for autor_id in self.claves_autores.prefijo(prefijo):
+                    if any(agregar(pk) for pk in sorted(self.libros_de_autor.get(autor_id, ()))):
+                        break
+
+            return [self._resultado(pk) for pk in encontrados]
+
+    def _resultado(self, pk):
+        titulo, _, autor_id = self.libros[pk]
+        autor = self.autores.get(autor_id)
+        return {'id': pk, 'titulo': titulo, 'autor': autor[0] if autor else None}
+
+    # ----- Mantenimiento (signals) -----
+
+    def actualizar_libro(self, libro):
+        datos = (libro.titulo, libro.isbn, libro.autor_id) if libro.activo else None
+        self._cambiar(('libro', libro.pk, datos))
+
+    def quitar_libro(self, pk):
+        self._cambiar(('libro', pk, None))
+
+    def actualizar_autor(self, autor):
+        self._cambiar(('autor', autor.pk, (autor.nombre, autor.apellido)))
+
+    def quitar_autor(self, pk):
+        self._cambiar(('autor', pk, None))
+
+    def _cambiar(self, cambio):
+        with self.lock:
+            if self.cargado:
+                self._aplicar(cambio)
+            self._publicar(cambio)
+
+    def _aplicar(self, cambio):
+        """
+        Cambio: ('libro', pk, (titulo, isbn, autor_id) o None) o
+        ('autor', pk, (nombre, apellido) o None). Deja el objeto como dice
+        el cambio, así que aplicarlo dos veces no hace daño.
+        """
+        tipo, pk, datos = cambio
+        if tipo == 'libro':
+            self._quitar_libro(pk)
+            if datos is not None:
+                titulo, isbn, autor_id = datos
+                self.libros[pk] = datos
+                self.libros_de_autor.setdefault(autor_id, set()).add(pk)
+                for clave in self._claves_libro(titulo, isbn):
+                    self.claves_libros.agregar(clave, pk)
+        else:
+            self._quitar_autor(pk)
+            if datos is not None:
+                nombre, apellido = datos
+                self.autores[pk] = (f'{nombre} {apellido}', nombre, apellido)
+                self.libros_de_autor.setdefault(pk, set())
+                for clave in self._claves_autor(nombre, apellido):
+                    self.claves_autores.agregar(clave, pk)
+
+    def _quitar_libro(self, pk):
+        anterior = self.libros.pop(pk, None)
+        if anterior is None:
+            return
+        titulo, isbn, autor_id = anterior
+        self.libros_de_autor.get(autor_id, set()).discard(pk)
+        for clave in self._claves_libro(titulo, isbn):
+            self.claves_libros.quitar(clave, pk)
+
+    def _quitar_autor(self, pk):
+        anterior = self.autores.pop(pk, None)
+        if anterior is None:
+            return
+        _, nombre, apellido = anterior
+        for clave in self._claves_autor(nombre, apellido):
+            self.claves_autores.quitar(clave, pk)
+
+    def _publicar(self, cambio):
+        """
+        Guardar el cambio bajo la siguiente versión compartida. Si la
+        versión avanzó más de uno, otro proceso también cambió algo: sus
+        cambios (y este otra vez) se aplican en la siguiente revisión.
+        """
+        cache.add(LLAVE_VERSION, 0, None)
+        try:
+            nueva = cache.incr(LLAVE_VERSION)
+        except ValueError:
+            return
+        cache.set(llave_cambio(nueva), cambio, TTL_CAMBIOS)
+        if self.cargado and nueva == self.version + 1:
+            self.version = nueva
+
+
+indice = IndicePrefijos()
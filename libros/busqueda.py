@@ -0,0 +1,369 @@
+"""
+Búsqueda de texto del catálogo (libros y autores).
+
+Reemplaza los `icontains` (LIKE '%x%', un recorrido completo de la tabla
+por consulta) con un backend intercambiable:
+
+- BusquedaMySQL: índices FULLTEXT nativos (migración 0004) con
+  MATCH ... AGAINST en modo booleano.
+- IndiceInvertido: índice propio en las tablas DocumentoBusqueda y
+  TerminoBusqueda, portable a cualquier motor. El texto se normaliza
+  (minúsculas, sin acentos ni stopwords en español), el último término
+  de la consulta se busca por prefijo (todas sus expansiones) y los
+  resultados se ordenan por BM25. Se mantiene al guardar o borrar un Libro o Autor (signals.py);
+  lo que se cargue con bulk_create o update() se indexa con
+  `reconstruir(modelo)`.
+
+settings.BUSQUEDA_BACKEND elige la clase; si es None se usa MySQL
+FULLTEXT en MySQL y el índice invertido en los demás motores.
+
+Las coincidencias no se recortan: `filtrar` las aplica como subconsulta
+junto con los demás filtros de la vista y solo la página se limita.
+"""
+import hashlib
+import math
+import re
+import unicodedata
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import (
+    Avg, Case, Count, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Cast
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from rest_framework.filters import SearchFilter
+from rest_framework.settings import api_settings
+
+from .models import Autor, DocumentoBusqueda, Libro, TerminoBusqueda
+
+# Campos indexados por modelo y su peso (repeticiones del término)
+CAMPOS = {
+    Libro: {'titulo': 3, 'subtitulo': 2, 'isbn': 1, 'descripcion': 1},
+    Autor: {'nombre': 2, 'apellido': 2, 'biografia': 1},
+}
+
+STOPWORDS = frozenset('''
+    a al algo ante antes como con contra cual de del desde donde durante e
+    el ella ellas ellos en entre era es esa ese eso esta este esto fue ha
+    hay la las le les lo los mas me mi mis muy no nos o os para pero por
+    que se ser si sin sobre son su sus tambien te tu un una uno unos unas
+    y ya
+'''.split())
+
+LIMITE_RESULTADOS = 500
+LARGO_MAXIMO_TERMINO = 64
+
+
+# ===== NORMALIZACIÓN =====
+
+def normalizar(texto):
+    """Minúsculas y sin acentos: 'Años' -> 'anos'"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def tokenizar(texto, stopwords=True):
+    terminos = re.findall(r'[a-z0-9]+', normalizar(texto))
+    return [
+        termino[:LARGO_MAXIMO_TERMINO] for termino in terminos
+        if not (stopwords and termino in STOPWORDS)
+    ]
+
+
+def terminos_de(objeto, campos):
+    """Frecuencia ponderada de cada término de los campos de `objeto`"""
+    frecuencias = Counter()
+    for campo, peso in campos.items():
+        for termino in tokenizar(getattr(objeto, campo)):
+            frecuencias[termino] += peso
+    return frecuencias
+
+
+def terminos_consulta(texto):
+    """
+    Términos de una consulta. El último se busca por prefijo, así que se
+    conserva aunque sea stopword: 'la' todavía puede ser 'laberinto'.
+    """
+    terminos = tokenizar(texto, stopwords=False)
+    return [t for t in terminos[:-1] if t not in STOPWORDS] + terminos[-1:]
+
+
+def firma_de(frecuencias):
+    texto = ' '.join(f'{t}:{n}' for t, n in sorted(frecuencias.items()))
+    return hashlib.md5(texto.encode()).hexdigest()
+
+
+def nombre_modelo(modelo):
+    return modelo._meta.model_name
+
+
+def construir_indice(modelo, campos, documento, termino_modelo, lote=2000):
+    """
+    Borrar e indexar todas las filas de `modelo` en las tablas de
+    `documento` y `termino_modelo`
+    """
+    nombre = nombre_modelo(modelo)
+    termino_modelo.objects.filter(modelo=nombre).delete()
+    documento.objects.filter(modelo=nombre).delete()
+    documentos, terminos = [], []
+
+    def guardar():
+        documento.objects.bulk_create(documentos, batch_size=lote)
+        termino_modelo.objects.bulk_create(terminos, batch_size=lote)
+        documentos.clear()
+        terminos.clear()
+
+    filas = modelo._base_manager.only('pk', *campos).order_by('pk')
+    for objeto in filas.iterator(chunk_size=lote):
+        frecuencias = terminos_de(objeto, campos)
+        longitud = sum(frecuencias.values())
+        documentos.append(documento(
+            modelo=nombre, objeto_id=objeto.pk,
+            longitud=longitud, firma=firma_de(frecuencias),
+        ))
+        terminos.extend(
+            termino_modelo(
+                modelo=nombre, termino=termino, objeto_id=objeto.pk,
+                frecuencia=frecuencia, longitud=longitud,
+            )
+            for termino, frecuencia in frecuencias.items()
+        )
+        if len(documentos) >= lote:
+            guardar()
+    guardar()
+
+
+# ===== BACKENDS =====
+
+class Backend:
+    """
+    Cada backend implementa `coincidencias(modelo, texto)`: un queryset
+    de valores (objeto_id, puntaje) con todos los objetos que contienen
+    la consulta, o None si no puede haber ninguno.
+    """
+
+    def buscar(self, modelo, texto, limite=LIMITE_RESULTADOS):
+        """[(pk, puntaje)] de los `limite` más relevantes"""
+        encontrados = self.coincidencias(modelo, texto)
+        if encontrados is None:
+            return []
+        return list(
+            encontrados.order_by('-puntaje', 'objeto_id')
+            .values_list('objeto_id', 'puntaje')[:limite]
+        )
+
+
+class IndiceInvertido(Backend):
+    """Índice invertido en tablas propias con ranking BM25"""
+
+    k1 = 1.2
+    b = 0.75
+    ttl_estadisticas = 300
+
+    # ----- Mantenimiento -----
+
+    def indexar(self, objeto):
+        """(Re)indexar un objeto; no hace nada si su texto no cambió"""
+        modelo = nombre_modelo(type(objeto))
+        frecuencias = terminos_de(objeto, CAMPOS[type(objeto)])
+        firma = firma_de(frecuencias)
+        actual = (
+            DocumentoBusqueda.objects
+            .filter(modelo=modelo, objeto_id=objeto.pk)
+            .values_list('firma', flat=True).first()
+        )
+        if actual == firma:
+            return
+
+        longitud = sum(frecuencias.values())
+        with transaction.atomic():
+            TerminoBusqueda.objects.filter(modelo=modelo, objeto_id=objeto.pk).delete()
+            TerminoBusqueda.objects.bulk_create([
+                TerminoBusqueda(
+                    modelo=modelo, termino=termino, objeto_id=objeto.pk,
+                    frecuencia=frecuencia, longitud=longitud,
+                )
+                for termino, frecuencia in frecuencias.items()
+            ])
+            DocumentoBusqueda.objects.update_or_create(
+                modelo=modelo, objeto_id=objeto.pk,
+                defaults={'longitud': longitud, 'firma': firma},
+            )
+
+    def desindexar(self, modelo, pk):
+        modelo = nombre_modelo(modelo)
+        TerminoBusqueda.objects.filter(modelo=modelo, objeto_id=pk).delete()
+        DocumentoBusqueda.objects.filter(modelo=modelo, objeto_id=pk).delete()
+
+    def reconstruir(self, modelo, lote=2000):
+        """Reindexar todas las filas de `modelo` desde cero"""
+        with transaction.atomic():
+            construir_indice(
+                modelo, CAMPOS[modelo], DocumentoBusqueda, TerminoBusqueda, lote
+            )
+        cache.delete(f'busqueda:estadisticas:{nombre_modelo(modelo)}')
+        # Sin estadísticas, SQLite elige el índice (modelo, objeto_id) para
+        # el GROUP BY y recorre todo el índice en vez de buscar por término
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                for tabla in (TerminoBusqueda, DocumentoBusqueda):
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(tabla._meta.db_table)}')
+
+    # ----- Consulta -----
+
+    def coincidencias(self, modelo, texto):
+        """
+        Objetos que contienen todos los términos de `texto`; el último
+        vale por cualquiera de sus expansiones, que cuentan como un solo
+        término para el IDF.
+        """
+        consulta = terminos_consulta(texto)
+        if not consulta:
+            return None
+        nombre = nombre_modelo(modelo)
+        *exactos, ultimo = consulta
+        grupos = [Q(termino=t) for t in exactos] + [
+            Q(termino__gte=ultimo, termino__lt=ultimo + '\uffff')
+        ]
+        postings = TerminoBusqueda.objects.filter(reduce(or_, grupos), modelo=nombre)
+
+        # Documentos que tienen cada grupo, en una consulta
+        df = postings.aggregate(**{
+            f'g{i}': Count('objeto_id', filter=grupo, distinct=True)
+            for i, grupo in enumerate(grupos)
+        })
+        df = [df[f'g{i}'] for i in range(len(grupos))]
+        if not all(df):
+            return None
+
+        n, promedio = self.estadisticas(nombre)
+
+        # BM25 sumado en la base de datos: una fila por documento que
+        # tenga al menos un término de cada grupo
+        frecuencia = Cast('frecuencia', FloatField())
+        puntaje = (
+            Case(*[When(grupo, then=Value(self.idf(d, n))) for grupo, d in zip(grupos, df)],
+                 output_field=FloatField())
+            * frecuencia * (self.k1 + 1)
+            / (frecuencia + self.k1 * (
+                1 - self.b + self.b * Cast('longitud', FloatField()) / promedio
+            ))
+        )
+        presentes = {f'en{i}': Count('id', filter=grupo) for i, grupo in enumerate(grupos)}
+        return (
+            postings.values('objeto_id')
+            .annotate(puntaje=Sum(puntaje))
+            .alias(**presentes)
+            .filter(**{f'{alias}__gt': 0 for alias in presentes})
+        )
+
+    def estadisticas(self, nombre):
+        """
+        (documentos, longitud promedio) del índice. BM25 tolera que estén
+        un poco desactualizadas, así que se guardan unos minutos en caché
+        en vez de recorrer DocumentoBusqueda en cada búsqueda.
+        """
+        llave = f'busqueda:estadisticas:{nombre}'
+        estadisticas = cache.get(llave)
+        if estadisticas is None:
+            valores = DocumentoBusqueda.objects.filter(modelo=nombre).aggregate(
+                n=Count('id'), promedio=Avg('longitud')
+            )
+            estadisticas = (valores['n'], valores['promedio'] or 1)
+            cache.set(llave, estadisticas, self.ttl_estadisticas)
+        return estadisticas
+
+    def idf(self, df, n):
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+
+class BusquedaMySQL(Backend):
+    """Índices FULLTEXT de MySQL; el motor los mantiene solo"""
+
+    def indexar(self, objeto):
+        pass
+
+    def desindexar(self, modelo, pk):
+        pass
+
+    def reconstruir(self, modelo, lote=None):
+        pass
+
+    def coincidencias(self, modelo, texto):
+        terminos = terminos_consulta(texto)
+        if not terminos:
+            return None
+        # Todos obligatorios y el último por prefijo, igual que el índice propio
+        booleana = ' '.join(f'+{t}' for t in terminos) + '*'
+        qn = connection.ops.quote_name
+        columnas = ', '.join(qn(campo) for campo in CAMPOS[modelo])
+        puntaje = RawSQL(
+            f'MATCH ({columnas}) AGAINST (%s IN BOOLEAN MODE)', [booleana]
+        )
+        return (
+            modelo._base_manager.annotate(puntaje=puntaje, objeto_id=F('pk'))
+            .filter(puntaje__gt=0)
+            .values('objeto_id', 'puntaje')
+        )
+
+
+_backend = None
+
+
+def obtener_backend():
+    global _backend
+    if _backend is None:
+        ruta = getattr(settings, 'BUSQUEDA_BACKEND', None)
+        if ruta:
+            _backend = import_string(ruta)()
+        elif connection.vendor == 'mysql':
+            _backend = BusquedaMySQL()
+        else:
+            _backend = IndiceInvertido()
+    return _backend
+
+
+# ===== API PARA VISTAS Y SCHEMA =====
+
+def buscar(modelo, texto, limite=LIMITE_RESULTADOS):
+    return obtener_backend().buscar(modelo, texto, limite)
+
+
+def filtrar(queryset, texto, ordenar=True):
+    """
+    Restringir `queryset` a todos los resultados de la búsqueda (una
+    subconsulta, sin límite); con `ordenar` quedan de más a menos
+    relevante. El puntaje se calcula solo para las filas que pasan los
+    demás filtros.
+    """
+    encontrados = obtener_backend().coincidencias(queryset.model, texto)
+    if encontrados is None:
+        return queryset.none()
+    queryset = queryset.filter(pk__in=encontrados.values('objeto_id'))
+    if ordenar:
+        puntaje = encontrados.filter(objeto_id=OuterRef('pk')).values('puntaje')[:1]
+        queryset = queryset.annotate(
+            relevancia=Subquery(puntaje, output_field=FloatField())
+        ).order_by('-relevancia', 'pk')
+    return queryset
+
+
+class BusquedaFilter(SearchFilter):
+    """
+    ?search= sobre el backend de búsqueda para los modelos indexados.
+    Sin ?ordering= explícito, ordena por relevancia; por eso debe ir
+    después de OrderingFilter en filter_backends.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        texto = request.query_params.get(self.search_param, '').strip()
+        if not texto or queryset.model not in CAMPOS:
+            return super().filter_queryset(request, queryset, view)
+        ordenar = not request.query_params.get(api_settings.ORDERING_PARAM)
+        return filtrar(queryset, texto, ordenar=ordenar)
@@ -0,0 +1,200 @@
+"""
+Caché de respuestas para los endpoints de lectura del catálogo.
+
+Cada respuesta se guarda bajo una llave que combina la ruta, los query
+params normalizados, el alcance (público o por usuario) y la versión de
+cada namespace del que depende ('libro', 'autor', ...). Invalidar un
+namespace es solo incrementar su versión: las llaves viejas dejan de
+consultarse y expiran solas, sin tener que buscarlas ni borrarlas.
+
+Las versiones suben con post_save/post_delete de Libro, Autor, Categoria
+y Prestamo (signals.py) y con los ajustes de stock por UPDATE, siempre
+después del commit.
+
+Cada acierto o fallo se emite con la señal `respuesta_cacheada`; por
+defecto se acumulan en `metricas` (ver `metricas.resumen()`).
+"""
+import hashlib
+import threading
+from collections import Counter
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from .routers import leer_de_primaria
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TTL': 60 * 5,
+    'ACTIVO': True,
+}
+
+PREFIJO = 'respuestas'
+
+# Validadores de RespuestaCondicionalMixin (condicional.py) que se guardan
+# con los datos: un acierto también puede responder 304 sin consultas
+ENCABEZADOS = ('ETag', 'Last-Modified')
+
+# Argumentos: vista (str), acierto (bool), llave (str)
+respuesta_cacheada = Signal()
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'CACHE_RESPUESTAS', {})}
+
+
+def almacen():
+    return caches[configuracion()['ALIAS']]
+
+
+# ===== NAMESPACES =====
+
+def _llave_namespace(namespace):
+    return f'{PREFIJO}:ns:{namespace}'
+
+
+def versiones(namespaces):
+    """Versión actual de cada namespace, en una sola ida al caché"""
+    llaves = [_llave_namespace(ns) for ns in namespaces]
+    encontradas = almacen().get_many(llaves)
+    return [encontradas.get(llave, 0) for llave in llaves]
+
+
+def invalidar(*namespaces):
+    """
+    Incrementar la versión de los namespaces al confirmar la transacción
+    actual (o de inmediato si no hay una abierta).
+    """
+    def incrementar():
+        cache = almacen()
+        for namespace in namespaces:
+            llave = _llave_namespace(namespace)
+            # Sin expiración: perder la versión reviviría respuestas viejas
+            cache.add(llave, 0, None)
+            try:
+                cache.incr(llave)
+            except ValueError:
+                # Expulsada entre add() e incr()
+                cache.set(llave, 1, None)
+
+    transaction.on_commit(incrementar)
+
+
+# ===== LLAVES =====
+
+def llave_respuesta(request, namespaces, por_usuario=False):
+    parametros = sorted(
+        (nombre, valor)
+        for nombre in request.query_params
+        for valor in request.query_params.getlist(nombre)
+    )
+    if por_usuario and request.user.is_authenticated:
+        alcance = f'u{request.user.pk}'
+    else:
+        alcance = 'publico'
+    partes = [
+        request.get_host(), request.path, urlencode(parametros), alcance,
+        request.accepted_media_type,
+        *(f'{ns}={v}' for ns, v in zip(namespaces, versiones(namespaces))),
+    ]
+    huella = hashlib.sha1('|'.join(map(str, partes)).encode()).hexdigest()
+    return f'{PREFIJO}:r:{huella}'
+
+
+# ===== DECORADOR =====
+
+def cachear_respuesta(*namespaces, por_usuario=False):
+    """
+    Cachear las respuestas GET 200 de una acción de ViewSet. Se guarda
+    `response.data`: en un acierto no hay consultas ni serialización,
+    solo el render.
+    """
+    def decorador(metodo):
+        @wraps(metodo)
+        def envoltura(self, request, *args, **kwargs):
+            config = configuracion()
+            if request.method != 'GET' or not config['ACTIVO']:
+                return metodo(self, request, *args, **kwargs)
+
+            vista = f'{type(self).__name__}.{metodo.__name__}'
+            llave = llave_respuesta(request, namespaces, por_usuario)
+            guardada = almacen().get(llave)
+            if guardada is not None:
+                respuesta_cacheada.send(sender=type(self), vista=vista, acierto=True, llave=llave)
+                return _desde_cache(request, *guardada)
+
+            respuesta_cacheada.send(sender=type(self), vista=vista, acierto=False, llave=llave)
+            # Lo que se guarda se lee de la primaria: una réplica atrasada
+            # justo después de invalidar quedaría en la caché todo el TTL
+            with leer_de_primaria():
+                respuesta = metodo(self, request, *args, **kwargs)
+            if respuesta.status_code == 200:
+                encabezados = {
+                    nombre: respuesta[nombre] for nombre in ENCABEZADOS if respuesta.has_header(nombre)
+                }
+                almacen().set(llave, (respuesta.data, encabezados), config['TTL'])
+            respuesta['X-Cache'] = 'MISS'
+            return respuesta
+        return envoltura
+    return decorador
+
+
+def _desde_cache(request, datos, encabezados):
+    modificado = encabezados.get('Last-Modified')
+    respuesta = get_conditional_response(
+        request,
+        etag=encabezados.get('ETag'),
+        last_modified=modificado and parse_http_date_safe(modificado),
+    ) or Response(datos)
+    for nombre, valor in encabezados.items():
+        respuesta[nombre] = valor
+    respuesta['X-Cache'] = 'HIT'
+    return respuesta
+
+
+# ===== MÉTRICAS =====
+
+class Metricas:
+    """Aciertos y fallos por vista en este proceso"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.aciertos = Counter()
+        self.fallos = Counter()
+
+    def registrar(self, vista, acierto):
+        with self.lock:
+            (self.aciertos if acierto else self.fallos)[vista] += 1
+
+    def resumen(self):
+        with self.lock:
+            vistas = set(self.aciertos) | set(self.fallos)
+            resumen = {}
+            for vista in sorted(vistas):
+                total = self.aciertos[vista] + self.fallos[vista]
+                resumen[vista] = {
+                    'aciertos': self.aciertos[vista],
+                    'fallos': self.fallos[vista],
+                    'tasa_aciertos': round(self.aciertos[vista] / total, 4),
+                }
+            return resumen
+
+    def reiniciar(self):
+        with self.lock:
+            self.aciertos.clear()
+            self.fallos.clear()
+
+
+metricas = Metricas()
+
+
+@receiver(respuesta_cacheada)
+def _acumular_metricas(sender, vista, acierto, **kwargs):
+    metricas.registrar(vista, acierto)
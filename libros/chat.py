@@ -0,0 +1,259 @@
+"""
+Historial de las salas de chat sin una escritura por mensaje.
+
+AlmacenChat tiene dos estructuras por proceso:
+- Pendientes: los mensajes recibidos por los consumers de este proceso
+  que aún no están en la base de datos. Se guardan con bulk_create cada
+  INTERVALO segundos (o en cuanto se juntan LOTE mensajes), en otro hilo:
+  el consumer nunca espera a la base de datos para reenviar un mensaje.
+- Un buffer circular por sala con los últimos HISTORIAL mensajes. Se
+  alimenta de los eventos de la capa de canales (los ve cualquier proceso
+  con alguien en la sala) y sirve el historial a quien entra sin consultar
+  la base de datos. La primera vez que un proceso necesita una sala lo
+  llena con una consulta; las páginas anteriores se leen bajo demanda.
+
+Cada mensaje tiene un uid asignado al recibirlo, con el que se descartan
+duplicados entre memoria y base de datos. Si el proceso termina de golpe
+se pierden a lo sumo los mensajes de un INTERVALO. Si un lote falla se
+reintenta por sala y, en la sala que falle, fila por fila: una fila mala
+no se lleva a las demás.
+"""
+import logging
+import re
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .paginacion import CursorInvalido, codificar_cursor, paginar
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ACTIVO': True,
+    # Mensajes por sala en memoria y por página del historial
+    'HISTORIAL': 50,
+    # Segundos entre guardados y máximo de mensajes por lote
+    'INTERVALO': 1.0,
+    'LOTE': 500,
+}
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'CHAT_PERSISTENTE', {})}
+
+
+# ===== VALIDACIÓN =====
+
+# MensajeChat.sala admite 100, pero el grupo de la capa es 'chat_<sala>'
+# y channels solo acepta nombres ASCII de menos de 100 caracteres
+SALA_VALIDA = re.compile(r'[A-Za-z0-9_]{1,94}')
+# MensajeChat.usuario
+LARGO_USUARIO = 150
+# Paginación por llave: uid desempata los mensajes del mismo instante
+ORDEN_HISTORIAL = ('-fecha', '-uid')
+
+
+def validar_sala(sala):
+    """Lanza ValueError si la sala no cabe en el grupo ni en la columna"""
+    if not isinstance(sala, str) or not SALA_VALIDA.fullmatch(sala):
+        raise ValueError(f'Sala no válida: {str(sala)[:100]}')
+    return sala
+
+
+def limpiar_usuario(usuario):
+    """Nombre mostrado, recortado al largo de la columna"""
+    if not isinstance(usuario, str) or not usuario.strip():
+        return 'Anónimo'
+    return usuario[:LARGO_USUARIO]
+
+
+def cursor_de(mensaje):
+    """Cursor para pedir los mensajes anteriores a `mensaje`"""
+    from .models import MensajeChat
+
+    return codificar_cursor(
+        MensajeChat(fecha=parse_datetime(mensaje['fecha']), uid=mensaje['id']), ORDEN_HISTORIAL,
+    )
+
+
+def nuevo_mensaje(usuario, mensaje):
+    """Datos de un mensaje recién recibido, tal como viajan por la capa"""
+    return {
+        'id': uuid.uuid4().hex,
+        'username': usuario,
+        'message': mensaje,
+        'fecha': timezone.now().isoformat(),
+    }
+
+
+def _desde_modelo(fila):
+    return {
+        'id': fila.uid,
+        'username': fila.usuario,
+        'message': fila.mensaje,
+        'fecha': fila.fecha.isoformat(),
+    }
+
+
+class AlmacenChat:
+    """Mensajes pendientes de guardar y buffers de historial por sala"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pendientes = []
+        self.salas = {}
+        # Salas cuyo buffer ya tiene lo último de la base de datos
+        self.cargadas = set()
+        self.temporizador = None
+
+    # ===== ESCRITURA =====
+
+    def guardar(self, sala, mensaje):
+        """Encolar un mensaje para el próximo lote (no toca la base de datos)"""
+        config = configuracion()
+        with self.lock:
+            self.pendientes.append((sala, mensaje))
+            if len(self.pendientes) >= config['LOTE']:
+                espera = 0
+            elif self.temporizador is None:
+                espera = config['INTERVALO']
+            else:
+                return
+            if self.temporizador is not None:
+                self.temporizador.cancel()
+            self.temporizador = threading.Timer(espera, self._vaciar_en_hilo)
+            self.temporizador.daemon = True
+            self.temporizador.start()
+
+    def _vaciar_en_hilo(self):
+        try:
+            self.vaciar()
+        finally:
+            connections.close_all()
+
+    def vaciar(self):
+        """Guardar los pendientes en lotes de LOTE filas"""
+        from .models import MensajeChat
+
+        with self.lock:
+            pendientes, self.pendientes = self.pendientes, []
+            if self.temporizador is not None:
+                self.temporizador.cancel()
+                self.temporizador = None
+        if not pendientes:
+            return
+        filas = [
+            MensajeChat(
+                sala=sala, uid=m['id'], usuario=m['username'],
+                mensaje=m['message'], fecha=parse_datetime(m['fecha']),
+            )
+            for sala, m in pendientes
+        ]
+        if self._insertar(filas, avisar=True):
+            return
+        por_sala = defaultdict(list)
+        for fila in filas:
+            por_sala[fila.sala].append(fila)
+        for sala, de_la_sala in por_sala.items():
+            if len(por_sala) > 1 and self._insertar(de_la_sala):
+                continue
+            perdidas = [fila for fila in de_la_sala if not self._insertar([fila])]
+            if perdidas:
+                logger.error(
+                    'No se pudieron guardar %s mensajes de la sala %s', len(perdidas), sala,
+                )
+
+    def _insertar(self, filas, avisar=False):
+        """bulk_create en su propio savepoint; False si falla"""
+        from .models import MensajeChat
+
+        try:
+            with transaction.atomic():
+                MensajeChat.objects.bulk_create(
+                    filas, batch_size=configuracion()['LOTE'], ignore_conflicts=True,
+                )
+        except Exception:
+            if avisar:
+                logger.warning(
+                    'Falló el lote de %s mensajes de chat; se reintenta por sala',
+                    len(filas), exc_info=True,
+                )
+            return False
+        return True
+
+    # ===== HISTORIAL =====
+
+    def recordar(self, sala, mensaje):
+        """Agregar al buffer de la sala un mensaje visto en la capa"""
+        with self.lock:
+            buffer = self.salas.get(sala)
+            if buffer is None or mensaje['id'] in buffer:
+                # Sala que aún no se cargó: se leerá entera al cargarla
+                return
+            buffer[mensaje['id']] = mensaje
+            if len(buffer) > configuracion()['HISTORIAL']:
+                buffer.popitem(last=False)
+
+    def en_memoria(self, sala):
+        """Últimos mensajes de una sala ya cargada, o None"""
+        with self.lock:
+            if sala not in self.cargadas:
+                return None
+            return list(self.salas[sala].values())
+
+    def historial(self, sala):
+        """Últimos HISTORIAL mensajes, de memoria o con una consulta"""
+        mensajes = self.en_memoria(sala)
+        if mensajes is not None:
+            return mensajes
+
+        with self.lock:
+            # Desde aquí recordar() ya la alimenta mientras se lee
+            buffer = self.salas.setdefault(sala, OrderedDict())
+        # Los pendientes de este proceso también deben salir de la consulta
+        self.vaciar()
+        leidos = self.pagina(sala, antes=None, vaciar=False)
+        with self.lock:
+            combinados = OrderedDict((m['id'], m) for m in leidos)
+            combinados.update(buffer)
+            while len(combinados) > configuracion()['HISTORIAL']:
+                combinados.popitem(last=False)
+            self.salas[sala] = combinados
+            self.cargadas.add(sala)
+            return list(combinados.values())
+
+    def pagina(self, sala, antes=None, vaciar=True):
+        """
+        HISTORIAL mensajes anteriores al cursor `antes` (cursor_de() del
+        más antiguo que ya se tiene), del más antiguo al más reciente. Sin
+        `antes`, los últimos. Lanza CursorInvalido si no se puede leer.
+        """
+        from .models import MensajeChat
+
+        if antes is not None and not isinstance(antes, str):
+            raise CursorInvalido('Cursor inválido')
+        if vaciar:
+            self.vaciar()
+        filas, _ = paginar(
+            MensajeChat.objects.filter(sala=sala), ORDEN_HISTORIAL,
+            configuracion()['HISTORIAL'], antes,
+        )
+        return [_desde_modelo(fila) for fila in reversed(filas)]
+
+    def olvidar(self):
+        """Descartar buffers y pendientes sin guardarlos"""
+        with self.lock:
+            if self.temporizador is not None:
+                self.temporizador.cancel()
+                self.temporizador = None
+            self.pendientes = []
+            self.salas = {}
+            self.cargadas = set()
+
+
+almacen = AlmacenChat()
@@ -0,0 +1,113 @@
+"""
+GET condicional (ETag / Last-Modified) para los ViewSets del catálogo.
+
+Si el cliente ya tiene la versión vigente (If-None-Match /
+If-Modified-Since) se responde 304 sin serializar nada.
+
+- Detalle: ETag fuerte con las fechas de actualización de la fila que
+  carga get_object() (y de las relaciones que se serializan con ella);
+  no agrega consultas.
+- Listados: ETag débil con una sola consulta de agregados sobre el
+  queryset filtrado (MAX de las fechas y COUNT de filas). El total se
+  pasa al paginador (`total_filas`) para no contar dos veces. Con
+  ?count=false no se calcula: es el mismo recorrido que se quiso evitar.
+  Sin Last-Modified: borrar una fila no mueve el MAX de las fechas y
+  If-Modified-Since daría un 304 con la fila borrada; el ETag sí cambia
+  porque incluye el COUNT.
+
+Cada ViewSet declara de qué dependen sus datos serializados en
+`agregados_version` (listados) y `campos_version` (detalle).
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def calcular_etag(request, valores, debil):
+    parametros = sorted(
+        (nombre, valor)
+        for nombre in request.query_params
+        for valor in request.query_params.getlist(nombre)
+    )
+    partes = [
+        request.path, urlencode(parametros), request.accepted_media_type,
+        *(f'{nombre}={valores[nombre]}' for nombre in sorted(valores)),
+    ]
+    huella = hashlib.sha1('|'.join(map(str, partes)).encode()).hexdigest()
+    etag = quote_etag(huella)
+    return f'W/{etag}' if debil else etag
+
+
+def ultima_modificacion(valores):
+    """Timestamp (segundos) de la fecha más reciente entre los valores"""
+    fechas = [valor for valor in valores.values() if hasattr(valor, 'timestamp')]
+    return int(max(fechas).timestamp()) if fechas else None
+
+
+def valor_de(objeto, ruta):
+    """Seguir 'autor.fecha_actualizacion' tolerando relaciones nulas"""
+    for atributo in ruta.split('.'):
+        if objeto is None:
+            return None
+        objeto = getattr(objeto, atributo)
+    return objeto
+
+
+class RespuestaCondicionalMixin:
+    """list/retrieve con validadores y respuestas 304"""
+
+    agregados_version = {
+        'fecha_actualizacion': Max('fecha_actualizacion'),
+    }
+    campos_version = ('fecha_actualizacion',)
+
+    def list(self, request, *args, **kwargs):
+        # Se filtra una sola vez: la búsqueda consulta su índice al filtrar
+        queryset = self.filter_queryset(self.get_queryset())
+        self.total_filas = None
+        incluir_total = getattr(self.paginator, 'incluir_total', None)
+        if incluir_total is not None and not incluir_total(request):
+            return self.listar(queryset)
+
+        valores = queryset.aggregate(
+            total=Count('pk', distinct=True), **self.agregados_version
+        )
+        self.total_filas = valores['total']
+        return self.responder_condicional(
+            request, valores, debil=True, generar=lambda: self.listar(queryset),
+            con_fecha=False,
+        )
+
+    def listar(self, queryset):
+        """ListModelMixin.list sobre un queryset ya filtrado"""
+        pagina = self.paginate_queryset(queryset)
+        if pagina is not None:
+            return self.get_paginated_response(self.get_serializer(pagina, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        instancia = self.get_object()
+        valores = {campo: valor_de(instancia, campo) for campo in self.campos_version}
+        return self.responder_condicional(
+            request, valores, debil=False,
+            generar=lambda: Response(self.get_serializer(instancia).data),
+        )
+
+    def responder_condicional(self, request, valores, debil, generar, con_fecha=True):
+        etag = calcular_etag(request, valores, debil)
+        modificado = ultima_modificacion(valores) if con_fecha else None
+
+        respuesta = get_conditional_response(request, etag=etag, last_modified=modificado)
+        if respuesta is None:
+            respuesta = generar()
+            if respuesta.status_code != 200:
+                return respuesta
+
+        respuesta['ETag'] = etag
+        if modificado is not None:
+            respuesta['Last-Modified'] = http_date(modificado)
+        return respuesta
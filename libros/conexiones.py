@@ -0,0 +1,178 @@
+"""
+Conexiones a la base de datos en la frontera async/sync (Daphne/ASGI).
+
+Con ASGI cada petición HTTP corre su código síncrono en un hilo nuevo que
+muere al terminar, y channels.db.database_sync_to_async manda todas las
+llamadas de los consumers a un único hilo: o se abre una conexión por
+petición o las consultas de los WebSockets esperan en fila.
+
+Aquí el código síncrono corre en un pool de CONEXIONES_DB['HILOS'] hilos
+compartido por `database_sync_to_async` (los consumers) y por las vistas
+si asgi.py usa ASGIHandlerConPool. Cada hilo conserva su conexión
+CONN_MAX_AGE segundos y CONN_HEALTH_CHECKS la verifica antes de reusarla:
+hay a lo más HILOS conexiones por base de datos y casi nunca se abre una.
+
+Cada conexión abierta se cuenta en `metricas` (señal connection_created),
+por alias y por petición (ConexionesMiddleware).
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULTS = {
+    'HILOS': 10,
+}
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'CONEXIONES_DB', {})}
+
+
+# ===== POOL =====
+
+_lock = threading.Lock()
+_pool = {'ejecutor': None, 'hilos': 0}
+
+
+def _hilo_nuevo():
+    with _lock:
+        _pool['hilos'] += 1
+
+
+def ejecutor():
+    """Pool compartido; se crea con la primera llamada"""
+    with _lock:
+        if _pool['ejecutor'] is None:
+            _pool['ejecutor'] = ThreadPoolExecutor(
+                max_workers=configuracion()['HILOS'],
+                thread_name_prefix='db',
+                initializer=_hilo_nuevo,
+            )
+            _pool['hilos'] = 0
+        return _pool['ejecutor']
+
+
+def cerrar():
+    """Cerrar la conexión de cada hilo y terminar el pool"""
+    with _lock:
+        pool, hilos = _pool['ejecutor'], _pool['hilos']
+        _pool['ejecutor'] = None
+    if pool is None:
+        return
+    if hilos:
+        # Una tarea por hilo: ninguno toma dos mientras esperan en la barrera
+        barrera = threading.Barrier(hilos, timeout=5)
+
+        def cerrar_en_hilo():
+            try:
+                barrera.wait()
+            except threading.BrokenBarrierError:
+                pass
+            connections.close_all()
+
+        for _ in range(hilos):
+            pool.submit(cerrar_en_hilo)
+    pool.shutdown(wait=True)
+
+
+class PoolSyncToAsync(DatabaseSyncToAsync):
+    """
+    database_sync_to_async de channels (cierra las conexiones vencidas o
+    rotas antes y después) en el pool compartido en vez del hilo único
+    """
+
+    def __init__(self, func):
+        super().__init__(func, thread_sensitive=False)
+
+    async def __call__(self, *args, **kwargs):
+        # Al llamar y no al decorar: cerrar() puede reemplazar el pool
+        self._executor = ejecutor()
+        return await super().__call__(*args, **kwargs)
+
+
+# Mismo nombre que en channels para usarlo como decorador
+database_sync_to_async = PoolSyncToAsync
+
+
+class ASGIHandlerConPool(ASGIHandler):
+    """
+    ASGIHandler que corre la cadena de middleware y la vista (síncronas)
+    en un hilo del pool, que conserva su conexión entre peticiones
+    """
+
+    def load_middleware(self, is_async=False):
+        super().load_middleware(is_async=False)
+
+    async def get_response_async(self, request):
+        return await database_sync_to_async(self.get_response)(request)
+
+
+# ===== MÉTRICAS =====
+
+class Metricas:
+    """Conexiones abiertas en este proceso, por alias y por petición"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def registrar_apertura(self, alias):
+        with self.lock:
+            self.aperturas[alias] = self.aperturas.get(alias, 0) + 1
+
+    def registrar_peticion(self, aperturas):
+        with self.lock:
+            self.peticiones += 1
+            self.aperturas_peticiones += aperturas
+            self.maximo = max(self.maximo, aperturas)
+
+    def resumen(self):
+        with self.lock:
+            return {
+                'aperturas': dict(self.aperturas),
+                'peticiones': self.peticiones,
+                'aperturas_por_peticion': round(
+                    self.aperturas_peticiones / self.peticiones, 4
+                ) if self.peticiones else 0,
+                'maximo_por_peticion': self.maximo,
+            }
+
+    def reiniciar(self):
+        with self.lock:
+            self.aperturas = {}
+            self.peticiones = 0
+            self.aperturas_peticiones = 0
+            self.maximo = 0
+
+
+metricas = Metricas()
+
+# Aperturas de la petición en curso; el contexto viaja a los hilos del pool
+_peticion = ContextVar('aperturas_peticion', default=None)
+
+
+@contextmanager
+def contar_aperturas():
+    contador = [0]
+    token = _peticion.set(contador)
+    try:
+        yield contador
+    finally:
+        _peticion.reset(token)
+        metricas.registrar_peticion(contador[0])
+
+
+@receiver(connection_created)
+def _contar_apertura(sender, connection, **kwargs):
+    metricas.registrar_apertura(connection.alias)
+    contador = _peticion.get()
+    if contador is not None:
+        contador[0] += 1
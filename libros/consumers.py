@@ -1,65 +1,154 @@
-import json
+from collections import deque
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from .chat import almacen, cursor_de, limpiar_usuario, nuevo_mensaje, validar_sala
+from .chat import configuracion as configuracion_chat
+from .conexiones import database_sync_to_async
+from .contrapresion import ColaSalidaMixin
+from .json_rapido import dumps, loads
+from .protocolos import codificar, decodificar, negociar
 from .models import Libro
+from .notificaciones import configuracion, grupo_de_tema, validar_tema
 
 
-class NotificacionesConsumer(AsyncWebsocketConsumer):
-    """Consumer para notificaciones en tiempo real"""
+class NotificacionesConsumer(ColaSalidaMixin, AsyncWebsocketConsumer):
+    """
+    Consumer para notificaciones en tiempo real.
+    
+    Cada conexión recibe solo los temas a los que está suscrita (ver
+    notificaciones.py): 'todo' (por defecto, compatible con los clientes
+    anteriores), 'libro:<id>', 'categoria:<id>' o 'autor:<id>'. Se pueden
+    pedir al conectar (?temas=libro:1,categoria:2) o después:
+    
+        {"type": "suscribir", "temas": ["libro:1", "autor:3"]}
+        {"type": "desuscribir", "temas": ["todo"]}
+    
+    Los envíos pasan por la cola acotada de contrapresion.py: si el
+    cliente lee lento, solo el último estado de cada libro sigue pendiente.
+    
+    Con el subprotocolo 'biblioteca.msgpack' o 'biblioteca.cbor' los
+    frames son binarios y compactos (ver protocolos.py); JSON por defecto.
+    """
     
     async def connect(self):
         """Cuando un cliente se conecta"""
-        self.room_group_name = 'notificaciones'
+        self.suscripciones = set()
+        # Ids de los últimos eventos enviados: un libro llega una vez por
+        # cada tema suscrito que lo incluye
+        self.eventos_enviados = deque(maxlen=32)
         
-        # Unirse al grupo
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
+        subprotocolo, self.formato = negociar(self.scope.get('subprotocols'))
+        await self.accept(subprotocol=subprotocolo)
         
-        await self.accept()
+        temas = parse_qs(self.scope.get('query_string', b'').decode()).get('temas')
+        temas = temas[0].split(',') if temas and temas[0] else ['todo']
+        _, rechazados = await self.agregar_temas(temas)
         
         # Mensaje de bienvenida
-        await self.send(text_data=json.dumps({
+        await self.enviar({
             'type': 'connection',
-            'message': '✅ Conectado a notificaciones en tiempo real'
-        }))
+            'message': '✅ Conectado a notificaciones en tiempo real',
+            'temas': sorted(self.suscripciones),
+        })
+        if rechazados:
+            await self.enviar_error(rechazados)
     
     async def disconnect(self, close_code):
         """Cuando un cliente se desconecta"""
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        for tema in getattr(self, 'suscripciones', ()):
+            await self.channel_layer.group_discard(grupo_de_tema(tema), self.channel_name)
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """Recibir mensaje del cliente"""
-        data = json.loads(text_data)
+        data = decodificar(text_data, bytes_data, self.formato)
         message_type = data.get('type')
         
         if message_type == 'libro_update':
-            libro_id = data.get('libro_id')
-            await self.notificar_cambio_libro(libro_id)
-    
-    async def notificar_cambio_libro(self, libro_id):
-        """Notificar a todos sobre cambio en libro"""
-        libro_data = await self.get_libro_data(libro_id)
+            # Estado actual solo para quien lo pide: los cambios de stock
+            # los publica el servidor al confirmarse (notificaciones.py)
+            libro_data = await self.get_libro_data(data.get('libro_id'))
+            await self.enviar({'type': 'libro_actualizado', 'libro': libro_data})
         
-        # Broadcast a todo el grupo
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'libro_actualizado',
-                'libro': libro_data
-            }
-        )
+        elif message_type in ('suscribir', 'desuscribir'):
+            temas = data.get('temas')
+            if not isinstance(temas, list):
+                temas = [temas]
+            if message_type == 'suscribir':
+                _, rechazados = await self.agregar_temas(temas)
+            else:
+                rechazados = await self.quitar_temas(temas)
+            await self.enviar({
+                'type': 'suscripciones',
+                'temas': sorted(self.suscripciones),
+            })
+            if rechazados:
+                await self.enviar_error(rechazados)
+    
+    async def agregar_temas(self, temas):
+        """Unirse a los grupos de `temas` hasta MAX_SUSCRIPCIONES"""
+        maximo = configuracion()['MAX_SUSCRIPCIONES']
+        agregados, rechazados = [], {}
+        for tema in temas:
+            try:
+                tema = validar_tema(tema)
+            except ValueError as e:
+                rechazados[str(tema)] = str(e)
+                continue
+            if tema in self.suscripciones:
+                continue
+            if len(self.suscripciones) >= maximo:
+                rechazados[tema] = f'Máximo {maximo} suscripciones por conexión'
+                continue
+            await self.channel_layer.group_add(grupo_de_tema(tema), self.channel_name)
+            self.suscripciones.add(tema)
+            agregados.append(tema)
+        return agregados, rechazados
+    
+    async def quitar_temas(self, temas):
+        rechazados = {}
+        for tema in temas:
+            try:
+                tema = validar_tema(tema)
+            except ValueError as e:
+                rechazados[str(tema)] = str(e)
+                continue
+            if tema in self.suscripciones:
+                await self.channel_layer.group_discard(grupo_de_tema(tema), self.channel_name)
+                self.suscripciones.discard(tema)
+        return rechazados
+    
+    async def enviar(self, datos, clave=None):
+        """Enviar un mensaje en el formato de la conexión"""
+        await self.enviar_frame(codificar(datos, self.formato), clave)
+    
+    async def enviar_frame(self, frame, clave=None):
+        if self.formato == 'json':
+            await self.send(text_data=frame, clave=clave)
+        else:
+            await self.send(bytes_data=frame, clave=clave)
+    
+    async def enviar_error(self, rechazados):
+        await self.enviar({
+            'type': 'error',
+            'message': 'Temas rechazados',
+            'temas': rechazados,
+        })
     
     async def libro_actualizado(self, event):
         """Enviar notificación al cliente"""
-        await self.send(text_data=json.dumps({
-            'type': 'libro_actualizado',
-            'libro': event['libro']
-        }))
+        evento = event.get('evento')
+        if evento is not None:
+            if evento in self.eventos_enviados:
+                return
+            self.eventos_enviados.append(evento)
+        # Frames ya codificados al publicar (notificaciones.evento_libro)
+        frames = event.get('frames')
+        if frames is None:
+            libro = event['libro']
+            await self.enviar({'type': 'libro_actualizado', 'libro': libro}, clave=('libro', libro['id']))
+            return
+        await self.enviar_frame(frames[self.formato], clave=('libro', event['libro_id']))
     
     @database_sync_to_async
     def get_libro_data(self, libro_id):
@@ -76,12 +165,34 @@ class NotificacionesConsumer(AsyncWebsocketConsumer):
             return None
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
-    """Consumer para chat de biblioteca"""
+class ChatConsumer(ColaSalidaMixin, AsyncWebsocketConsumer):
+    """
+    Consumer para chat de biblioteca.
+    
+    Con CHAT_PERSISTENTE['ACTIVO'] los mensajes se guardan en lotes (ver
+    chat.py), quien entra recibe los últimos en un mensaje 'historial' y
+    puede pedir los anteriores con el cursor `antes` del último 'historial'
+    recibido: {"type": "historial", "antes": <cursor>}.
+    
+    Salas de hasta 94 caracteres ASCII (el grupo es 'chat_<sala>'); otras
+    se rechazan al conectar. Los pedidos mal formados reciben un mensaje
+    {"type": "error"}.
+    """
+    
+    # Capa propia: más capacidad y caducidad que las notificaciones
+    channel_layer_alias = 'chat'
+    # Los mensajes no se coalescen: tanta cola como la capa
+    max_cola = 200
     
     async def connect(self):
-        self.room_name = self.scope['url_route']['kwargs']['room_name']
+        self.room_group_name = None
+        try:
+            self.room_name = validar_sala(self.scope['url_route']['kwargs']['room_name'])
+        except ValueError:
+            await self.close()
+            return
         self.room_group_name = f'chat_{self.room_name}'
+        self.persistente = configuracion_chat()['ACTIVO']
         
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -90,6 +201,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         await self.accept()
         
+        if self.persistente:
+            # De memoria si la sala ya está cargada en este proceso
+            mensajes = almacen.en_memoria(self.room_name)
+            if mensajes is None:
+                mensajes = await database_sync_to_async(almacen.historial)(self.room_name)
+            await self.enviar_historial(mensajes)
+        
         # Notificar que alguien se conectó
         await self.channel_layer.group_send(
             self.room_group_name,
@@ -100,37 +218,81 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
     
     async def disconnect(self, close_code):
+        if self.room_group_name is None:
+            return
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
     
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        message = data['message']
-        username = data.get('username', 'Anónimo')
+    async def receive(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            await self.enviar_error('Los mensajes deben ser JSON en un frame de texto')
+            return
+        try:
+            data = loads(text_data)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await self.enviar_error('Los mensajes deben ser un objeto JSON')
+            return
+        
+        if data.get('type') == 'historial':
+            if self.persistente:
+                try:
+                    mensajes = await database_sync_to_async(almacen.pagina)(
+                        self.room_name, data.get('antes')
+                    )
+                except ValueError as e:
+                    await self.enviar_error(str(e))
+                    return
+                await self.enviar_historial(mensajes)
+            return
         
-        # Enviar mensaje a todos en la sala
+        texto = data.get('message')
+        if not isinstance(texto, str):
+            await self.enviar_error('El mensaje debe ser texto')
+            return
+        mensaje = nuevo_mensaje(limpiar_usuario(data.get('username')), texto)
+        if self.persistente:
+            # Solo se encola: el lote se guarda en otro hilo
+            almacen.guardar(self.room_name, mensaje)
+        
+        # Enviar mensaje a todos en la sala, codificado una sola vez
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message',
-                'message': message,
-                'username': username
+                'mensaje': mensaje,
+                'texto': dumps({'type': 'message', **mensaje}),
             }
         )
     
     async def chat_message(self, event):
         """Recibir mensaje del grupo y enviarlo al WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'message',
-            'message': event['message'],
-            'username': event['username']
+        if 'texto' not in event:
+            # Evento sin codificar (p. ej. publicado desde fuera del consumer)
+            mensaje = {k: v for k, v in event.items() if k != 'type'}
+            await self.send(text_data=dumps({'type': 'message', **mensaje}))
+            return
+        if self.persistente:
+            almacen.recordar(self.room_name, event['mensaje'])
+        await self.send(text_data=event['texto'])
+    
+    async def enviar_historial(self, mensajes):
+        await self.send(text_data=dumps({
+            'type': 'historial',
+            'mensajes': mensajes,
+            # Para pedir la página anterior: {"type": "historial", "antes": ...}
+            'antes': cursor_de(mensajes[0]) if mensajes else None,
         }))
     
+    async def enviar_error(self, mensaje):
+        await self.send(text_data=dumps({'type': 'error', 'message': mensaje}))
+    
     async def user_join(self, event):
         """Usuario se unió"""
-        await self.send(text_data=json.dumps({
+        await self.send(text_data=dumps({
             'type': 'system',
             'message': event['message']
-        }))
\ No newline at end of file
+        }))
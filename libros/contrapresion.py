@@ -0,0 +1,160 @@
+"""
+Contrapresión para los consumers de WebSocket.
+
+Sin esto cada handler hace `await self.send(...)`: si el cliente lee
+lento (móvil con mala red) el envío se bloquea, el consumer deja de leer
+su canal y los mensajes se acumulan en la capa hasta que `capacity` los
+descarta. Con ColaSalidaMixin los handlers solo encolan y vuelven; una
+tarea por conexión escribe en el socket al ritmo del cliente.
+
+La cola de cada conexión tiene un máximo (MAX_COLA):
+- Los mensajes con `clave` (estado: el stock de un libro) reemplazan al
+  pendiente con la misma clave, conservando su posición (coalescidos).
+- Si la cola está llena se descarta el más antiguo (descartados).
+- Si sigue llena más de TOLERANCIA segundos el cliente no da abasto: se
+  cierra la conexión con el código 4008 (desconectados) y puede volver a
+  conectarse y pedir el estado actual.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+DEFAULTS = {
+    'MAX_COLA': 100,
+    'TOLERANCIA': 5.0,
+}
+
+# Código de cierre para los consumers lentos (rango 4000-4999 de la aplicación)
+CODIGO_LENTO = 4008
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'SALIDA_WEBSOCKET', {})}
+
+
+class Metricas:
+    """Mensajes coalescidos, descartados y conexiones cerradas por consumer"""
+
+    EVENTOS = ('coalescidos', 'descartados', 'desconectados')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.contadores = Counter()
+
+    def registrar(self, consumer, evento, cantidad=1):
+        with self.lock:
+            self.contadores[(consumer, evento)] += cantidad
+
+    def resumen(self):
+        with self.lock:
+            consumers = sorted({consumer for consumer, _ in self.contadores})
+            return {
+                consumer: {evento: self.contadores[(consumer, evento)] for evento in self.EVENTOS}
+                for consumer in consumers
+            }
+
+    def reiniciar(self):
+        with self.lock:
+            self.contadores.clear()
+
+
+metricas = Metricas()
+
+
+class ColaSalida:
+    """Cola acotada de mensajes pendientes de una conexión"""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.pendientes = OrderedDict()
+        self.secuencia = itertools.count()
+        self.hay_mensajes = asyncio.Event()
+        # Desde cuándo está llena sin vaciarse (None si no lo está)
+        self.llena_desde = None
+
+    def __len__(self):
+        return len(self.pendientes)
+
+    def agregar(self, mensaje, clave=None):
+        """Encolar; devuelve 'coalescido', 'descartado' o None"""
+        resultado = None
+        if clave is not None and clave in self.pendientes:
+            self.pendientes[clave] = mensaje
+            resultado = 'coalescido'
+        else:
+            if len(self.pendientes) >= self.maximo:
+                self.pendientes.popitem(last=False)
+                resultado = 'descartado'
+                if self.llena_desde is None:
+                    self.llena_desde = time.monotonic()
+            self.pendientes[('seq', next(self.secuencia)) if clave is None else clave] = mensaje
+        self.hay_mensajes.set()
+        return resultado
+
+    async def siguiente(self):
+        while not self.pendientes:
+            self.hay_mensajes.clear()
+            await self.hay_mensajes.wait()
+        _, mensaje = self.pendientes.popitem(last=False)
+        if len(self.pendientes) <= self.maximo // 2:
+            # El cliente se puso al día: reiniciar la tolerancia
+            self.llena_desde = None
+        return mensaje
+
+    def saturada(self, tolerancia):
+        return self.llena_desde is not None and time.monotonic() - self.llena_desde > tolerancia
+
+    def vaciar(self):
+        self.pendientes.clear()
+
+
+class ColaSalidaMixin:
+    """
+    Para AsyncWebsocketConsumer: `send` encola y una tarea escribe en el
+    socket. `send(..., clave=...)` marca un mensaje de estado que se puede
+    coalescer. Los atributos max_cola y tolerancia (None: settings) se
+    pueden ajustar por consumer.
+    """
+
+    max_cola = None
+    tolerancia = None
+
+    async def send(self, text_data=None, bytes_data=None, close=False, clave=None):
+        if getattr(self, 'cola_salida', None) is None:
+            config = configuracion()
+            self.cola_salida = ColaSalida(self.max_cola or config['MAX_COLA'])
+            self.escritor = asyncio.ensure_future(self._escribir())
+        if getattr(self, 'cerrado_por_lento', False):
+            return
+
+        resultado = self.cola_salida.agregar((text_data, bytes_data, close), clave)
+        if resultado == 'coalescido':
+            metricas.registrar(type(self).__name__, 'coalescidos')
+        elif resultado == 'descartado':
+            metricas.registrar(type(self).__name__, 'descartados')
+            tolerancia = self.tolerancia if self.tolerancia is not None else configuracion()['TOLERANCIA']
+            if self.cola_salida.saturada(tolerancia):
+                await self.cerrar_por_lento()
+
+    async def _escribir(self):
+        while True:
+            text_data, bytes_data, close = await self.cola_salida.siguiente()
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def cerrar_por_lento(self):
+        """Cerrar la conexión de un cliente que no da abasto"""
+        self.cerrado_por_lento = True
+        metricas.registrar(type(self).__name__, 'desconectados')
+        self.cola_salida.vaciar()
+        self.escritor.cancel()
+        await self.close(code=CODIGO_LENTO)
+
+    async def websocket_disconnect(self, message):
+        escritor = getattr(self, 'escritor', None)
+        if escritor is not None:
+            escritor.cancel()
+        await super().websocket_disconnect(message)
@@ -0,0 +1,167 @@
+"""
+Análisis de costo y profundidad de consultas GraphQL antes de ejecutarlas.
+
+El costo estima cuántos objetos va a resolver la consulta: cada campo
+que devuelve un objeto pesa 1 (los escalares 0, configurable por campo),
+y todo lo que cuelga de una lista se multiplica por su tamaño esperado:
+`first` en las connections (o el máximo del servidor si no se envía) y
+un tamaño por defecto en las listas sin paginar (p. ej. AutorType.libros).
+
+Configuración en settings.GRAPHQL_COSTO (ver DEFAULTS).
+"""
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode, FragmentDefinitionNode, FragmentSpreadNode, GraphQLError,
+    OperationType, get_named_type, get_nullable_type, get_operation_ast,
+    is_leaf_type, is_list_type,
+)
+from graphql.utilities import value_from_ast_untyped
+
+DEFAULTS = {
+    'PROFUNDIDAD_MAXIMA': 10,
+    'COSTO_MAXIMO': 5000,
+    # Tamaño supuesto de las listas sin argumento `first`
+    'TAMANO_LISTA': 20,
+    # Pesos por campo: {'LibroType.prestamos': 3}
+    'PESOS': {},
+}
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_COSTO', {})}
+
+
+class CostoConsulta:
+    """Resultado del análisis de una operación"""
+
+    def __init__(self, costo, profundidad, config):
+        self.costo = costo
+        self.profundidad = profundidad
+        self.costo_maximo = config['COSTO_MAXIMO']
+        self.profundidad_maxima = config['PROFUNDIDAD_MAXIMA']
+
+    @property
+    def errores(self):
+        errores = []
+        if self.profundidad > self.profundidad_maxima:
+            errores.append(GraphQLError(
+                f'La consulta tiene profundidad {self.profundidad}; '
+                f'el máximo permitido es {self.profundidad_maxima}',
+                extensions={'code': 'PROFUNDIDAD_EXCEDIDA'},
+            ))
+        if self.costo > self.costo_maximo:
+            errores.append(GraphQLError(
+                f'La consulta tiene un costo estimado de {self.costo}; '
+                f'el máximo permitido es {self.costo_maximo}',
+                extensions={'code': 'COSTO_EXCEDIDO'},
+            ))
+        return errores
+
+    def como_extension(self):
+        return {
+            'costo': self.costo,
+            'costoMaximo': self.costo_maximo,
+            'profundidad': self.profundidad,
+            'profundidadMaxima': self.profundidad_maxima,
+        }
+
+
+def analizar_costo(schema, document, variables=None, operation_name=None):
+    """
+    Calcular costo y profundidad de la operación `operation_name` de un
+    documento ya validado. Devuelve None si no hay operación que analizar.
+    """
+    operacion = get_operation_ast(document, operation_name)
+    if operacion is None:
+        return None
+
+    raiz = {
+        OperationType.QUERY: schema.query_type,
+        OperationType.MUTATION: schema.mutation_type,
+        OperationType.SUBSCRIPTION: schema.subscription_type,
+    }[operacion.operation]
+
+    config = configuracion()
+    analizador = _Analizador(schema, document, variables or {}, config)
+    costo, profundidad = analizador.seleccion(raiz, operacion.selection_set, 0)
+    return CostoConsulta(costo, profundidad, config)
+
+
+class _Analizador:
+
+    def __init__(self, schema, document, variables, config):
+        self.schema = schema
+        self.variables = variables
+        self.config = config
+        self.fragmentos = {
+            definicion.name.value: definicion
+            for definicion in document.definitions
+            if isinstance(definicion, FragmentDefinitionNode)
+        }
+
+    def seleccion(self, tipo, seleccion, profundidad, tamano_edges=None, visitados=()):
+        """(costo, profundidad máxima) de un selection set sobre `tipo`"""
+        costo = 0
+        profundidad_max = profundidad
+        for nodo in seleccion.selections:
+            if isinstance(nodo, FieldNode):
+                c, p = self.campo(tipo, nodo, profundidad + 1, tamano_edges, visitados)
+            else:
+                fragmento, anidados = nodo, visitados
+                if isinstance(nodo, FragmentSpreadNode):
+                    nombre = nodo.name.value
+                    if nombre in visitados or nombre not in self.fragmentos:
+                        continue
+                    fragmento = self.fragmentos[nombre]
+                    anidados = visitados + (nombre,)
+                subtipo = tipo
+                if fragmento.type_condition is not None:
+                    subtipo = self.schema.get_type(fragmento.type_condition.name.value)
+                c, p = self.seleccion(
+                    subtipo, fragmento.selection_set, profundidad, tamano_edges, anidados
+                )
+            costo += c
+            profundidad_max = max(profundidad_max, p)
+        return costo, profundidad_max
+
+    def campo(self, tipo, nodo, profundidad, tamano_edges, visitados):
+        nombre = nodo.name.value
+        # Introspección (__typename, __schema de GraphiQL) no se cobra
+        if nombre.startswith('__') or not hasattr(tipo, 'fields'):
+            return 0, profundidad - 1
+        definicion = tipo.fields.get(nombre)
+        if definicion is None:
+            return 0, profundidad
+
+        tipo_campo = get_named_type(definicion.type)
+        peso = self.config['PESOS'].get(
+            f'{tipo.name}.{nombre}', 0 if is_leaf_type(tipo_campo) else 1
+        )
+
+        multiplicador = 1
+        if nombre == 'edges' and tamano_edges is not None:
+            multiplicador = tamano_edges
+        elif is_list_type(get_nullable_type(definicion.type)):
+            multiplicador = self.config['TAMANO_LISTA']
+
+        # Connections: el tamaño de página aplica a sus `edges`
+        siguiente_edges = None
+        if 'first' in definicion.args:
+            siguiente_edges = self.argumento(nodo, 'first')
+            if siguiente_edges is None:
+                siguiente_edges = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+        costo_hijos, profundidad_max = 0, profundidad
+        if nodo.selection_set is not None:
+            costo_hijos, profundidad_max = self.seleccion(
+                tipo_campo, nodo.selection_set, profundidad, siguiente_edges, visitados
+            )
+        return multiplicador * (peso + costo_hijos), profundidad_max
+
+    def argumento(self, nodo, nombre):
+        for argumento in nodo.arguments or ():
+            if argumento.name.value == nombre:
+                valor = value_from_ast_untyped(argumento.value, self.variables)
+                return valor if isinstance(valor, int) and valor >= 0 else None
+        return None
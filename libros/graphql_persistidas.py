@@ -0,0 +1,212 @@
+"""
+Consultas persistidas (APQ) y caché de documentos GraphQL ya validados.
+
+Protocolo de Apollo: el cliente envía
+`extensions={"persistedQuery": {"version": 1, "sha256Hash": "<hash>"}}`
+sin el texto de la consulta. Si el servidor no conoce el hash responde
+PersistedQueryNotFound y el cliente reintenta enviando hash + consulta,
+que queda registrada. Como la petición ya no lleva el texto, puede ir por
+GET (`/graphql/?extensions=...&variables=...`) y ser cacheable.
+
+Todo documento, persistido o no, se guarda parseado y validado en un LRU
+por proceso indexado por su hash, así que las consultas repetidas no se
+vuelven a parsear ni validar.
+
+Modo lista permitida (GRAPHQL_APQ['SOLO_REGISTRADAS']): solo se ejecutan
+los hashes de GRAPHQL_APQ['CONSULTAS_REGISTRADAS'], un dict o la ruta de
+un JSON {hash: consulta}; se rechaza el texto libre y el registro APQ.
+El hash de cada consulta se obtiene con `hash_consulta(texto)`.
+
+El proyecto trae graphql_consultas.json con las consultas del catálogo.
+Para registrar otra se agrega al JSON la entrada
+`hash_consulta(texto): texto` (p. ej. desde `python manage.py shell`)
+con el texto idéntico al que envía el cliente: el hash es del texto exacto.
+Con el modo activo, el manifiesto se lee al arrancar (LibrosConfig.ready):
+si falta o no es un JSON {hash: consulta} el proceso no inicia.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import caches
+from graphql import GraphQLError, parse, validate
+
+DEFAULTS = {
+    # Documentos parseados y validados que se guardan por proceso
+    'TAMANO_CACHE_DOCUMENTOS': 500,
+    # Caché de Django donde se registran las consultas APQ (hash -> texto)
+    'CACHE': 'default',
+    'TTL': 60 * 60 * 24,
+    'SOLO_REGISTRADAS': False,
+    'CONSULTAS_REGISTRADAS': {},
+    # Cache-Control max-age de las respuestas GET de consultas persistidas
+    'MAX_AGE_GET': 0,
+}
+
+PREFIJO_CACHE = 'graphql:apq:'
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'GRAPHQL_APQ', {})}
+
+
+def hash_consulta(consulta):
+    return hashlib.sha256(consulta.encode('utf-8')).hexdigest()
+
+
+class ErrorConsultaPersistida(Exception):
+    """Error del protocolo APQ, convertible a GraphQLError"""
+
+    def __init__(self, mensaje, codigo):
+        super().__init__(mensaje)
+        self.error = GraphQLError(mensaje, extensions={'code': codigo})
+
+
+# Los clientes de Apollo reconocen estos mensajes literalmente
+NO_ENCONTRADA = ('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+NO_SOPORTADA = ('PersistedQueryNotSupported', 'PERSISTED_QUERY_NOT_SUPPORTED')
+
+
+def extension_persistida(request, data):
+    """
+    `extensions.persistedQuery` de la petición (cuerpo JSON o querystring
+    en GET), o None si no viene.
+    """
+    extensiones = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensiones, str):
+        try:
+            extensiones = json.loads(extensiones)
+        except ValueError:
+            raise ErrorConsultaPersistida('Extensions inválidas', 'BAD_REQUEST')
+    if not isinstance(extensiones, dict):
+        return None
+    persistida = extensiones.get('persistedQuery')
+    if persistida is None:
+        return None
+    if not isinstance(persistida, dict) or persistida.get('version') != 1:
+        raise ErrorConsultaPersistida(*NO_SOPORTADA)
+    if not isinstance(persistida.get('sha256Hash'), str):
+        raise ErrorConsultaPersistida('Falta sha256Hash', 'BAD_REQUEST')
+    return persistida
+
+
+def consultas_registradas(config):
+    registradas = config['CONSULTAS_REGISTRADAS']
+    if isinstance(registradas, dict):
+        return registradas
+    return _leer_manifiesto(str(registradas))
+
+
+_manifiestos = {}
+
+
+def _leer_manifiesto(ruta):
+    if ruta not in _manifiestos:
+        try:
+            with open(ruta, encoding='utf-8') as archivo:
+                consultas = json.load(archivo)
+        except (OSError, ValueError) as e:
+            raise ImproperlyConfigured(
+                f"GRAPHQL_APQ['CONSULTAS_REGISTRADAS']: no se pudo leer {ruta} ({e})"
+            ) from e
+        if not isinstance(consultas, dict) or not all(
+            isinstance(texto, str) for texto in consultas.values()
+        ):
+            raise ImproperlyConfigured(
+                f"GRAPHQL_APQ['CONSULTAS_REGISTRADAS']: {ruta} debe ser un JSON {{hash: consulta}}"
+            )
+        _manifiestos[ruta] = consultas
+    return _manifiestos[ruta]
+
+
+def verificar_configuracion():
+    """Leer el manifiesto al arrancar si el modo lista permitida está activo"""
+    config = configuracion()
+    if config['SOLO_REGISTRADAS']:
+        consultas_registradas(config)
+
+
+def resolver_consulta(persistida, consulta):
+    """
+    Texto de la consulta a ejecutar. `persistida` es la extensión APQ (o
+    None) y `consulta` el texto recibido (o None). Devuelve (hash, texto).
+    """
+    config = configuracion()
+
+    if config['SOLO_REGISTRADAS']:
+        registradas = consultas_registradas(config)
+        llave = persistida['sha256Hash'] if persistida else None
+        if llave not in registradas:
+            raise ErrorConsultaPersistida(
+                'Solo se permiten consultas registradas', 'PERSISTED_QUERY_NOT_ALLOWED'
+            )
+        return llave, registradas[llave]
+
+    if persistida is None:
+        return (hash_consulta(consulta) if consulta else None), consulta
+
+    llave = persistida['sha256Hash']
+    almacen = caches[config['CACHE']]
+    if consulta:
+        if hash_consulta(consulta) != llave:
+            raise ErrorConsultaPersistida(
+                'El sha256Hash no corresponde a la consulta', 'BAD_REQUEST'
+            )
+        almacen.set(PREFIJO_CACHE + llave, consulta, config['TTL'])
+        return llave, consulta
+
+    consulta = almacen.get(PREFIJO_CACHE + llave)
+    if consulta is None:
+        raise ErrorConsultaPersistida(*NO_ENCONTRADA)
+    return llave, consulta
+
+
+class CacheDocumentos:
+    """LRU hash -> DocumentNode ya validado contra el esquema"""
+
+    def __init__(self, tamano):
+        self.tamano = tamano
+        self.documentos = OrderedDict()
+        self.lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, llave, consulta, schema):
+        """
+        Devuelve (documento, errores). Solo se guardan los documentos
+        válidos; los errores de sintaxis o validación no entran al LRU.
+        """
+        llave = (id(schema), llave)
+        with self.lock:
+            documento = self.documentos.get(llave)
+            if documento is not None:
+                self.documentos.move_to_end(llave)
+                self.aciertos += 1
+                return documento, []
+            self.fallos += 1
+
+        try:
+            documento = parse(consulta)
+        except GraphQLError as e:
+            return None, [e]
+        errores = validate(schema, documento)
+        if errores:
+            return None, errores
+
+        with self.lock:
+            self.documentos[llave] = documento
+            self.documentos.move_to_end(llave)
+            while len(self.documentos) > self.tamano:
+                self.documentos.popitem(last=False)
+        return documento, []
+
+    def limpiar(self):
+        with self.lock:
+            self.documentos.clear()
+            self.aciertos = self.fallos = 0
+
+
+documentos = CacheDocumentos(configuracion()['TAMANO_CACHE_DOCUMENTOS'])
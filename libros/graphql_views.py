@@ -0,0 +1,123 @@
+from django.db import connection, transaction
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from django.utils.cache import patch_cache_control
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast
+
+from .graphql_costo import analizar_costo
+from .graphql_persistidas import (
+    ErrorConsultaPersistida, configuracion, documentos, extension_persistida,
+    resolver_consulta,
+)
+
+
+class BibliotecaGraphQLView(GraphQLView):
+    """
+    GraphQLView que analiza el costo y la profundidad de la consulta
+    antes de ejecutarla; rechaza las que excedan los límites de
+    settings.GRAPHQL_COSTO y reporta el costo en `extensions`.
+
+    Acepta consultas persistidas (APQ) por POST y GET y reutiliza los
+    documentos ya parseados y validados (ver graphql_persistidas.py).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        max_age = configuracion()['MAX_AGE_GET']
+        if max_age and getattr(request, 'graphql_cacheable', False) and response.status_code == 200:
+            patch_cache_control(response, public=True, max_age=max_age)
+        return response
+
+    def execute_graphql_request(
+        self, request, data, query, variables, operation_name, show_graphiql=False
+    ):
+        try:
+            persistida = extension_persistida(request, data)
+            llave, query = resolver_consulta(persistida, query)
+        except ErrorConsultaPersistida as e:
+            return ExecutionResult(errors=[e.error])
+
+        if not query:
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        graphql_schema = self.schema.graphql_schema
+        document, errores = documentos.obtener(llave, query, graphql_schema)
+        if errores:
+            return ExecutionResult(errors=errores)
+
+        operation_ast = get_operation_ast(document, operation_name)
+        if request.method.lower() == "get":
+            if operation_ast and operation_ast.operation != OperationType.QUERY:
+                if show_graphiql:
+                    return None
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["POST"],
+                        "Can only perform a {} operation from a POST request.".format(
+                            operation_ast.operation.value
+                        ),
+                    )
+                )
+
+        # Costo y profundidad antes de tocar la base de datos
+        costo = analizar_costo(graphql_schema, document, variables, operation_name)
+        if costo is not None:
+            request.costo_graphql = costo
+            if costo.errores:
+                return ExecutionResult(errors=costo.errores)
+
+        resultado = self.ejecutar_documento(
+            request, document, operation_ast, variables, operation_name
+        )
+        # Las consultas persistidas por GET se pueden guardar en caché HTTP
+        request.graphql_cacheable = (
+            persistida is not None
+            and request.method.lower() == "get"
+            and not resultado.errors
+        )
+        return resultado
+
+    def ejecutar_documento(self, request, document, operation_ast, variables, operation_name):
+        """Ejecutar un documento ya parseado y validado"""
+        try:
+            options = {
+                "schema": self.schema.graphql_schema,
+                "document": document,
+                "root_value": self.get_root_value(request),
+                "variable_values": variables,
+                "operation_name": operation_name,
+                "context_value": self.get_context(request),
+                "middleware": self.get_middleware(request),
+            }
+            if self.execution_context_class:
+                options["execution_context_class"] = self.execution_context_class
+
+            if (
+                operation_ast
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(**options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            return execute(**options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def json_encode(self, request, d, pretty=False):
+        costo = getattr(request, 'costo_graphql', None)
+        if costo is not None and isinstance(d, dict):
+            extensiones = dict(d.get('extensions') or {})
+            extensiones['costo'] = costo.como_extension()
+            d = {**d, 'extensions': extensiones}
+        return super().json_encode(request, d, pretty=pretty)
@@ -0,0 +1,123 @@
+"""
+JSON rápido para las respuestas de la API y los mensajes de WebSocket.
+
+`dumps` y `loads` usan el motor de JSON_RAPIDO['MOTOR'] ('ujson', el de
+requirements.txt, o 'json' de la biblioteca estándar) y producen lo mismo
+que JSONRenderer de DRF: separadores compactos, sin escapar no-ASCII,
+Decimal como número, fechas en ISO 8601 (con 'Z' para UTC) y error ante
+NaN o infinitos. Los tipos que el motor no conoce pasan por el
+JSONEncoder de DRF.
+
+Los renderers y parsers de DRF de aquí se activan en REST_FRAMEWORK; si
+se pide sangría (API navegable, `; indent=4`) se usa el de DRF.
+"""
+import json
+
+from django.conf import settings
+from rest_framework.utils import encoders
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover - ujson está en requirements.txt
+    ujson = None
+
+DEFAULTS = {
+    'MOTOR': 'ujson',
+}
+
+_codificador = encoders.JSONEncoder()
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'JSON_RAPIDO', {})}
+
+
+def _dumps_json(datos):
+    return json.dumps(
+        datos, cls=encoders.JSONEncoder, ensure_ascii=False,
+        allow_nan=False, separators=(',', ':'),
+    )
+
+
+def _dumps_ujson(datos):
+    try:
+        return ujson.dumps(
+            datos, ensure_ascii=False, escape_forward_slashes=False,
+            reject_bytes=False, allow_nan=False, default=_codificador.default,
+        )
+    except OverflowError as e:
+        # ujson rechaza NaN e infinitos con OverflowError; json con ValueError
+        raise ValueError(str(e)) from e
+
+
+def _loads_ujson(texto):
+    if isinstance(texto, bytes):
+        texto = texto.decode()
+    if 'NaN' in texto or 'Infinity' in texto:
+        # ujson los acepta: que la biblioteca estándar decida si son
+        # constantes (error) o están dentro de una cadena
+        return _loads_json(texto)
+    return ujson.loads(texto)
+
+
+def _loads_json(texto):
+    return json.loads(texto, parse_constant=_rechazar_constante)
+
+
+def _rechazar_constante(constante):
+    raise ValueError(f'Valor no válido en JSON: {constante}')
+
+
+MOTORES = {
+    'json': (_dumps_json, _loads_json),
+    'ujson': (_dumps_ujson, _loads_ujson),
+}
+
+
+def _motor():
+    nombre = configuracion()['MOTOR']
+    if nombre == 'ujson' and ujson is None:
+        nombre = 'json'
+    return MOTORES[nombre]
+
+
+def dumps(datos):
+    """Texto JSON compacto; ValueError si no se puede representar"""
+    texto = _motor()[0](datos)
+    # Igual que DRF: JSON que también es un subconjunto válido de JavaScript
+    return texto.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+
+
+def loads(texto):
+    """Datos de un texto (o bytes UTF-8) JSON; ValueError si no es válido"""
+    return _motor()[1](texto)
+
+
+# ===== DRF =====
+
+class JSONRapidoRenderer(JSONRenderer):
+    """JSONRenderer con el motor de JSON_RAPIDO"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data).encode()
+
+
+class JSONRapidoParser(JSONParser):
+    """JSONParser con el motor de JSON_RAPIDO"""
+
+    renderer_class = JSONRapidoRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return loads(stream.read().decode(encoding))
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
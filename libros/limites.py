@@ -0,0 +1,186 @@
+"""
+Límites de peticiones con GCRA (Generic Cell Rate Algorithm).
+
+Cada llave guarda un único valor, el TAT ("theoretical arrival time"):
+cuándo quedaría vacía la cubeta si no llegara nada más. Una política de
+`limite` peticiones por `periodo` segundos deja pasar ráfagas de hasta
+`limite` y después una petición cada `periodo / limite` segundos; es una
+ventana deslizante exacta, sin los reinicios bruscos de una ventana fija.
+A diferencia del contador anterior (get + set que reiniciaba el TTL en
+cada petición), un cliente constante vuelve a tener cupo en cuanto
+transcurre el intervalo.
+
+Motores (RATE_LIMIT['MOTOR']):
+- 'redis': script Lua que lee y escribe el TAT en una sola operación
+  atómica, con la hora del servidor Redis. Exacto entre procesos y nodos.
+- 'local': el mismo algoritmo sobre la caché de Django, serializado con
+  un lock. Exacto entre hilos de un proceso; para un solo nodo.
+- None: 'redis' si la caché configurada es RedisCache, si no 'local'.
+
+Las políticas se eligen por prefijo de ruta (la primera que coincide) y
+cuentan por IP o por usuario autenticado.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+DEFAULTS = {
+    'MOTOR': None,
+    'CACHE': 'default',
+    'PREFIJO': 'limite',
+    'POLITICAS': [
+        {'ruta': '/api/auth/', 'limite': 20, 'periodo': 60, 'por': 'ip'},
+        {'ruta': '/api/', 'limite': 100, 'periodo': 3600, 'por': 'usuario'},
+    ],
+}
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'RATE_LIMIT', {})}
+
+
+class Politica:
+    """`limite` peticiones cada `periodo` segundos, contadas `por` ip o usuario"""
+
+    def __init__(self, ruta, limite, periodo, por='ip', nombre=None):
+        self.ruta = ruta
+        self.limite = limite
+        self.periodo = periodo
+        self.por = por
+        self.nombre = nombre or ruta
+        self.intervalo = periodo / limite
+
+    def aplica(self, ruta):
+        return ruta.startswith(self.ruta)
+
+    def encabezado(self):
+        """Valor de RateLimit-Policy, p. ej. '100;w=3600'"""
+        return f'{self.limite};w={self.periodo}'
+
+
+class Resultado:
+    """Decisión para una petición y los datos de los encabezados RateLimit-*"""
+
+    def __init__(self, politica, permitido, ocupado, espera):
+        self.politica = politica
+        self.permitido = permitido
+        # Segundos hasta que la cubeta se vacíe por completo
+        self.reinicio = max(ocupado, 0.0)
+        # Segundos hasta que vuelva a haber cupo (0 si se permitió)
+        self.espera = max(espera, 0.0)
+        libres = (politica.periodo - self.reinicio) / politica.intervalo
+        self.restantes = max(int(libres + 1e-9), 0)
+
+    def encabezados(self):
+        encabezados = {
+            'RateLimit-Limit': str(self.politica.limite),
+            'RateLimit-Remaining': str(self.restantes),
+            'RateLimit-Reset': str(math.ceil(self.reinicio)),
+            'RateLimit-Policy': self.politica.encabezado(),
+        }
+        if not self.permitido:
+            encabezados['Retry-After'] = str(max(math.ceil(self.espera), 1))
+        return encabezados
+
+
+def gcra(tat, ahora, politica):
+    """(permitido, nuevo_tat, ocupado, espera) a partir del TAT guardado"""
+    tat = max(tat or ahora, ahora)
+    nuevo = tat + politica.intervalo
+    permitido_desde = nuevo - politica.periodo
+    if ahora < permitido_desde:
+        return False, tat, tat - ahora, permitido_desde - ahora
+    return True, nuevo, nuevo - ahora, 0.0
+
+
+# ===== MOTORES =====
+
+class MotorLocal:
+    """
+    GCRA sobre la caché de Django con un lock del proceso: la lectura y
+    la escritura del TAT no se intercalan entre hilos. Entre procesos no
+    es atómico (cada uno tiene su lock), por eso es para un solo nodo.
+    """
+
+    def __init__(self, cache, reloj=time.time):
+        self.cache = cache
+        self.reloj = reloj
+        self.lock = threading.Lock()
+
+    def consumir(self, llave, politica):
+        with self.lock:
+            ahora = self.reloj()
+            permitido, tat, ocupado, espera = gcra(self.cache.get(llave), ahora, politica)
+            if permitido:
+                self.cache.set(llave, tat, math.ceil(ocupado))
+        return Resultado(politica, permitido, ocupado, espera)
+
+
+class MotorRedis:
+    """GCRA atómico en Redis: un EVALSHA por petición"""
+
+    SCRIPT = """
+    local intervalo = tonumber(ARGV[1])
+    local periodo = tonumber(ARGV[2])
+    local t = redis.call('TIME')
+    local ahora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+    local tat = tonumber(redis.call('GET', KEYS[1])) or ahora
+    if tat < ahora then
+        tat = ahora
+    end
+    local nuevo = tat + intervalo
+    local permitido_desde = nuevo - periodo
+    if ahora < permitido_desde then
+        return {0, tostring(tat - ahora), tostring(permitido_desde - ahora)}
+    end
+    redis.call('SET', KEYS[1], tostring(nuevo), 'PX', math.ceil((nuevo - ahora) * 1000))
+    return {1, tostring(nuevo - ahora), '0'}
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.script = None
+
+    def consumir(self, llave, politica):
+        llave = self.cache.make_and_validate_key(llave)
+        cliente = self.cache._cache.get_client(llave, write=True)
+        if self.script is None:
+            # Guarda el SHA; si el servidor no lo conoce se reenvía con EVAL
+            self.script = cliente.register_script(self.SCRIPT)
+        permitido, ocupado, espera = self.script(
+            keys=[llave], args=[politica.intervalo, politica.periodo], client=cliente,
+        )
+        return Resultado(politica, bool(int(permitido)), float(ocupado), float(espera))
+
+
+_motores = {}
+_lock_motores = threading.Lock()
+
+
+def obtener_motor():
+    config = configuracion()
+    cache = caches[config['CACHE']]
+    nombre = config['MOTOR'] or ('redis' if isinstance(cache, RedisCache) else 'local')
+    with _lock_motores:
+        clave = (nombre, config['CACHE'])
+        if clave not in _motores:
+            _motores[clave] = MotorRedis(cache) if nombre == 'redis' else MotorLocal(cache)
+        return _motores[clave]
+
+
+def politicas():
+    return [Politica(**datos) for datos in configuracion()['POLITICAS']]
+
+
+def politica_para(ruta):
+    return next((politica for politica in politicas() if politica.aplica(ruta)), None)
+
+
+def consumir(politica, identidad):
+    """Descontar una petición de `identidad` bajo `politica`"""
+    llave = f"{configuracion()['PREFIJO']}:{politica.nombre}:{identidad}"
+    return obtener_motor().consumir(llave, politica)
@@ -0,0 +1,202 @@
+"""
+DataLoaders por petición para el esquema GraphQL.
+
+Cada relación (libro -> autor, autor -> libros, ...) se resuelve con una
+sola consulta por nivel de la query, sin importar cuántas filas haya.
+
+La vista GraphQL de graphene-django es síncrona y graphql-core resuelve
+los elementos de una lista uno por uno, así que no hay un "tick" donde
+juntar las llaves. Por eso, quien obtiene una lista de objetos agenda de
+antemano las llaves de sus relaciones (`agendar`) y la primera carga
+resuelve todas las pendientes en un solo query. Las llaves foráneas que
+ya vienen en un JOIN (select_related) se guardan directo en la caché
+(`prime`) sin consulta extra. En contexto async, `aload` agrupa además
+todas las llaves pedidas en el mismo ciclo del event loop.
+"""
+import asyncio
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+
+from .models import Autor, Categoria, Libro, Prestamo
+
+
+# Llaves foráneas de Libro que conviene traer con JOIN
+LIBRO_RELACIONES = ('autor', 'categoria', 'creado_por')
+
+
+class DataLoader:
+    """Cache + lote de llaves pendientes para una función de carga por lotes"""
+
+    def __init__(self, cargar_lote, por_defecto=None):
+        # cargar_lote(llaves) -> {llave: valor}
+        self.cargar_lote = cargar_lote
+        self.por_defecto = por_defecto
+        self.cache = {}
+        self.pendientes = set()
+        self._tarea = None
+
+    def agendar(self, llaves):
+        """Anotar llaves que se pedirán pronto para cargarlas juntas"""
+        self.pendientes.update(
+            llave for llave in llaves
+            if llave is not None and llave not in self.cache
+        )
+
+    def prime(self, llave, valor):
+        """Guardar un valor ya obtenido por otra vía (p. ej. un JOIN)"""
+        self.cache.setdefault(llave, valor)
+        self.pendientes.discard(llave)
+
+    def load(self, llave):
+        """Carga síncrona: si falta, resuelve todas las pendientes de una vez"""
+        if llave is None:
+            return self._vacio()
+        if llave not in self.cache:
+            self.pendientes.add(llave)
+            self.despachar()
+        return self.cache[llave]
+
+    async def aload(self, llave):
+        """Carga async: agrupa las llaves pedidas en el mismo ciclo"""
+        if llave is None:
+            return self._vacio()
+        if llave not in self.cache:
+            self.pendientes.add(llave)
+            if self._tarea is None:
+                self._tarea = asyncio.ensure_future(self._despachar_async())
+            await asyncio.shield(self._tarea)
+        return self.cache[llave]
+
+    def despachar(self):
+        llaves, self.pendientes = self.pendientes, set()
+        if not llaves:
+            return
+        encontrados = self.cargar_lote(llaves)
+        for llave in llaves:
+            self.cache[llave] = encontrados.get(llave, self._vacio())
+
+    async def _despachar_async(self):
+        # Dejar que el resto de resolvers del nivel agenden sus llaves
+        await asyncio.sleep(0)
+        self._tarea = None
+        await sync_to_async(self.despachar)()
+
+    def _vacio(self):
+        return self.por_defecto() if self.por_defecto else None
+
+
+class Cargadores:
+    """Conjunto de DataLoaders de una petición"""
+
+    def __init__(self):
+        self.libro = DataLoader(self._cargar_libros_por_id)
+        self.autor = DataLoader(self._cargar_autores)
+        self.categoria = DataLoader(self._cargar_categorias)
+        self.usuario = DataLoader(self._cargar_usuarios)
+        self.libros_por_autor = DataLoader(
+            lambda ids: self._cargar_libros('autor_id', ids), por_defecto=list
+        )
+        self.libros_por_categoria = DataLoader(
+            lambda ids: self._cargar_libros('categoria_id', ids), por_defecto=list
+        )
+        self.prestamos_por_libro = DataLoader(
+            self._cargar_prestamos, por_defecto=list
+        )
+
+    # ----- Agendar relaciones de objetos ya cargados -----
+
+    def agendar_libros(self, libros):
+        """Agendar las relaciones de una lista de libros"""
+        for libro in libros:
+            self.libro.prime(libro.pk, libro)
+        self.agendar_autores(self._agendar_relacion(self.autor, libros, 'autor'))
+        self.agendar_categorias(
+            self._agendar_relacion(self.categoria, libros, 'categoria')
+        )
+        self._agendar_relacion(self.usuario, libros, 'creado_por')
+        self.prestamos_por_libro.agendar(libro.pk for libro in libros)
+        return libros
+
+    def agendar_autores(self, autores):
+        self.libros_por_autor.agendar(autor.pk for autor in autores)
+        return autores
+
+    def agendar_categorias(self, categorias):
+        self.libros_por_categoria.agendar(categoria.pk for categoria in categorias)
+        return categorias
+
+    def agendar_prestamos(self, prestamos):
+        self.agendar_libros(self._agendar_relacion(self.libro, prestamos, 'libro'))
+        return prestamos
+
+    def _agendar_relacion(self, cargador, objetos, nombre):
+        """
+        Precargar en `cargador` la llave foránea `nombre` de cada objeto
+        si ya vino en el JOIN, o agendarla si no. Devuelve los precargados.
+        """
+        precargados = []
+        for objeto in objetos:
+            campo = objeto._meta.get_field(nombre)
+            if campo.is_cached(objeto):
+                relacionado = campo.get_cached_value(objeto)
+                if relacionado is not None:
+                    cargador.prime(relacionado.pk, relacionado)
+                    precargados.append(relacionado)
+            else:
+                cargador.agendar([getattr(objeto, campo.attname)])
+        return precargados
+
+    # ----- Funciones de carga por lotes -----
+
+    def _cargar_libros_por_id(self, ids):
+        libros = Libro.objects.select_related(*LIBRO_RELACIONES).in_bulk(ids)
+        self.agendar_libros(list(libros.values()))
+        return libros
+
+    def _cargar_autores(self, ids):
+        autores = Autor.objects.in_bulk(ids)
+        self.agendar_autores(list(autores.values()))
+        return autores
+
+    def _cargar_categorias(self, ids):
+        categorias = Categoria.objects.in_bulk(ids)
+        self.agendar_categorias(list(categorias.values()))
+        return categorias
+
+    def _cargar_usuarios(self, ids):
+        return User.objects.in_bulk(ids)
+
+    def _cargar_libros(self, campo, ids):
+        agrupados = defaultdict(list)
+        libros = list(
+            Libro.objects
+            .filter(**{f'{campo}__in': ids})
+            .select_related(*LIBRO_RELACIONES)
+        )
+        for libro in self.agendar_libros(libros):
+            agrupados[getattr(libro, campo)].append(libro)
+        return agrupados
+
+    def _cargar_prestamos(self, libro_ids):
+        agrupados = defaultdict(list)
+        prestamos = list(Prestamo.objects.filter(libro_id__in=libro_ids))
+        for prestamo in self.agendar_prestamos(prestamos):
+            agrupados[prestamo.libro_id].append(prestamo)
+        return agrupados
+
+
+def obtener_cargadores(info):
+    """
+    Cargadores de la petición actual (se guardan en info.context).
+    Devuelve None si no hay contexto, p. ej. schema.execute() desde shell.
+    """
+    contexto = info.context
+    if contexto is None:
+        return None
+    cargadores = getattr(contexto, 'cargadores', None)
+    if cargadores is None:
+        cargadores = Cargadores()
+        contexto.cargadores = cargadores
+    return cargadores
@@ -1,8 +1,9 @@
-from django.core.cache import cache
 from django.http import JsonResponse, HttpResponsePermanentRedirect
 from django.conf import settings
 import logging
 
+from . import conexiones, limites, routers
+
 logger = logging.getLogger(__name__)
 
 
@@ -31,34 +32,44 @@ class SecurityMiddleware:
 
 
 class RateLimitMiddleware:
-    """Limitar requests por IP"""
+    """
+    Limitar requests por IP o por usuario según la ruta (libros/limites.py).
+    Agrega los encabezados RateLimit-* y Retry-After al responder 429.
+    """
     
     def __init__(self, get_response):
         self.get_response = get_response
-        self.limit = 100  # requests
-        self.period = 3600  # 1 hora en segundos
     
     def __call__(self, request):
-        ip = self.get_client_ip(request)
+        politica = limites.politica_para(request.path)
+        if politica is None:
+            return self.get_response(request)
         
-        # Solo para rutas /api/
-        if request.path.startswith('/api/'):
-            cache_key = f'rate_limit_{ip}'
-            requests_count = cache.get(cache_key, 0)
-            
-            if requests_count >= self.limit:
-                logger.warning(f'Rate limit exceeded for IP: {ip}')
-                return JsonResponse({
-                    'error': 'Rate limit exceeded',
-                    'detail': f'Máximo {self.limit} requests por hora'
-                }, status=429)
-            
-            # Incrementar contador
-            cache.set(cache_key, requests_count + 1, self.period)
+        identidad = self.get_identidad(request, politica)
+        resultado = limites.consumir(politica, identidad)
+        if not resultado.permitido:
+            logger.warning(f'Rate limit exceeded for {identidad} on {politica.nombre}')
+            response = JsonResponse({
+                'error': 'Rate limit exceeded',
+                'detail': f'Máximo {politica.limite} requests cada {politica.periodo} segundos'
+            }, status=429)
+        else:
+            response = self.get_response(request)
         
-        response = self.get_response(request)
+        for nombre, valor in resultado.encabezados().items():
+            response[nombre] = valor
         return response
     
+    def get_identidad(self, request, politica):
+        """
+        Usuario autenticado por sesión o, si no, la IP. Los tokens (JWT,
+        Token) se autentican después, en DRF: aquí cuentan por IP.
+        """
+        user = getattr(request, 'user', None)
+        if politica.por == 'usuario' and user is not None and user.is_authenticated:
+            return f'u{user.pk}'
+        return f'ip{self.get_client_ip(request)}'
+    
     def get_client_ip(self, request):
         """Obtener IP real del cliente"""
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -66,4 +77,47 @@ class RateLimitMiddleware:
             ip = x_forwarded_for.split(',')[0].strip()
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return ip
+
+
+class ReplicaMiddleware:
+    """
+    Alcance de lectura por petición para ReplicaRouter (libros/routers.py).
+    Tras una escritura deja una cookie corta para que las siguientes
+    peticiones del cliente lean de la primaria hasta que la réplica alcance.
+    """
+    
+    METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        config = routers.configuracion()
+        fijado = (
+            request.method not in self.METODOS_SEGUROS
+            or request.COOKIES.get(config['COOKIE']) == '1'
+        )
+        with routers.alcance(fijado) as alcance:
+            response = self.get_response(request)
+        
+        if alcance.escribio and config['ALIAS']:
+            response.set_cookie(
+                config['COOKIE'], '1', max_age=config['FIJAR_SEGUNDOS'],
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class ConexionesMiddleware:
+    """
+    Cuenta las conexiones a la base de datos que abre cada petición
+    (ver conexiones.metricas.resumen()).
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        with conexiones.contar_aperturas():
+            return self.get_response(request)
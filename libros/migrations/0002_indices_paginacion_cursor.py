@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 09:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='autor',
+            index=models.Index(fields=['apellido', 'nombre', 'id'], name='libros_auto_apellid_4fbbcd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['fecha_creacion', 'id'], name='libros_libr_fecha_c_fafa2e_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.11 on 2026-10-18 09:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0002_indices_paginacion_cursor'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['fecha_prestamo', 'id'], name='libros_pres_fecha_p_ae6e9f_idx'),
+        ),
+    ]
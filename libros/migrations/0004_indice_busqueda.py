@@ -0,0 +1,134 @@
+# Generated by Django 5.2.11 on 2026-10-18 10:12
+
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+
+from django.db import migrations, models
+
+
+# Índices FULLTEXT para BusquedaMySQL (mismas columnas que busqueda.CAMPOS)
+FULLTEXT = {
+    'libros_libro': ('titulo', 'subtitulo', 'isbn', 'descripcion'),
+    'libros_autor': ('nombre', 'apellido', 'biografia'),
+}
+
+# Copia de libros/busqueda.py al escribir la migración: los cambios
+# posteriores a ese módulo no deben cambiar lo que esta migración guarda
+CAMPOS = {
+    'libro': {'titulo': 3, 'subtitulo': 2, 'isbn': 1, 'descripcion': 1},
+    'autor': {'nombre': 2, 'apellido': 2, 'biografia': 1},
+}
+
+STOPWORDS = frozenset('''
+    a al algo ante antes como con contra cual de del desde donde durante e
+    el ella ellas ellos en entre era es esa ese eso esta este esto fue ha
+    hay la las le les lo los mas me mi mis muy no nos o os para pero por
+    que se ser si sin sobre son su sus tambien te tu un una uno unos unas
+    y ya
+'''.split())
+
+LARGO_MAXIMO_TERMINO = 64
+LOTE = 2000
+
+
+def tokenizar(texto):
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    normalizado = ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+    return [
+        termino[:LARGO_MAXIMO_TERMINO] for termino in re.findall(r'[a-z0-9]+', normalizado)
+        if termino not in STOPWORDS
+    ]
+
+
+def construir_indice(modelo, nombre, campos, documento, termino_modelo):
+    documentos, terminos = [], []
+
+    def guardar():
+        documento.objects.bulk_create(documentos, batch_size=LOTE)
+        termino_modelo.objects.bulk_create(terminos, batch_size=LOTE)
+        documentos.clear()
+        terminos.clear()
+
+    filas = modelo._base_manager.only('pk', *campos).order_by('pk')
+    for objeto in filas.iterator(chunk_size=LOTE):
+        frecuencias = Counter()
+        for campo, peso in campos.items():
+            for termino in tokenizar(getattr(objeto, campo)):
+                frecuencias[termino] += peso
+        longitud = sum(frecuencias.values())
+        firma = ' '.join(f'{t}:{n}' for t, n in sorted(frecuencias.items()))
+        documentos.append(documento(
+            modelo=nombre, objeto_id=objeto.pk, longitud=longitud,
+            firma=hashlib.md5(firma.encode()).hexdigest(),
+        ))
+        terminos.extend(
+            termino_modelo(
+                modelo=nombre, termino=termino, objeto_id=objeto.pk,
+                frecuencia=frecuencia, longitud=longitud,
+            )
+            for termino, frecuencia in frecuencias.items()
+        )
+        if len(documentos) >= LOTE:
+            guardar()
+    guardar()
+
+
+def crear_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        for tabla, columnas in FULLTEXT.items():
+            schema_editor.execute(
+                f'CREATE FULLTEXT INDEX {tabla}_busqueda ON {tabla} ({", ".join(columnas)})'
+            )
+        return
+
+    # Índice invertido para las filas que ya existen
+    documento = apps.get_model('libros', 'DocumentoBusqueda')
+    termino = apps.get_model('libros', 'TerminoBusqueda')
+    for nombre, campos in CAMPOS.items():
+        construir_indice(apps.get_model('libros', nombre), nombre, campos, documento, termino)
+
+
+def borrar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        for tabla in FULLTEXT:
+            schema_editor.execute(f'DROP INDEX {tabla}_busqueda ON {tabla}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0003_indice_prestamos_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=20)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('longitud', models.PositiveIntegerField()),
+                ('firma', models.CharField(max_length=32)),
+            ],
+            options={
+                'unique_together': {('modelo', 'objeto_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='TerminoBusqueda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=20)),
+                ('termino', models.CharField(max_length=64)),
+                ('objeto_id', models.PositiveBigIntegerField()),
+                ('frecuencia', models.PositiveIntegerField()),
+                ('longitud', models.PositiveIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['modelo', 'termino', 'objeto_id', 'frecuencia', 'longitud'], name='libros_term_modelo_bab378_idx'), models.Index(fields=['modelo', 'objeto_id'], name='libros_term_modelo_2e8772_idx')],
+            },
+        ),
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-18 10:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0004_indice_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autor',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
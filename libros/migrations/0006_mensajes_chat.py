@@ -0,0 +1,28 @@
+# Generated by Django 5.2.11 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libros', '0005_fecha_actualizacion_autor_categoria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MensajeChat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sala', models.CharField(max_length=100)),
+                ('uid', models.CharField(max_length=32, unique=True)),
+                ('usuario', models.CharField(max_length=150)),
+                ('mensaje', models.TextField()),
+                ('fecha', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Mensajes de chat',
+                'indexes': [models.Index(fields=['sala', 'fecha'], name='libros_mens_sala_5c5904_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, connections, router
+from django.db.models import Case, F, Func, Value, When
+from django.db.models.sql import UpdateQuery
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth.models import User
+from django.utils import timezone
 from decimal import Decimal
 
 
@@ -11,6 +14,7 @@ class Categoria(models.Model):
     descripcion = models.TextField(blank=True)
     activo = models.BooleanField(default=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = "Categorías"
@@ -30,11 +34,16 @@ class Autor(models.Model):
     biografia = models.TextField(blank=True)
     foto = models.URLField(blank=True, help_text="URL de la foto del autor")
     fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name_plural = "Autores"
         ordering = ['apellido', 'nombre']
         unique_together = ['nombre', 'apellido']  # No duplicar autor
+        indexes = [
+            # Paginación por cursor sobre el orden por defecto
+            models.Index(fields=['apellido', 'nombre', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
@@ -44,6 +53,131 @@ class Autor(models.Model):
         return f"{self.nombre} {self.apellido}"
 
 
+class LibroQuerySet(models.QuerySet):
+    """QuerySet de Libro con operaciones atómicas de inventario"""
+    
+    def ajustar_stock(self, libro_id, cantidad, estricto=False):
+        """
+        Suma `cantidad` al stock con un solo UPDATE condicional.
+        
+        El estado se deriva en la misma sentencia, así que no hay
+        lectura-modificación-escritura en Python ni actualizaciones
+        perdidas entre peticiones concurrentes.
+        - estricto=False: si el resultado es negativo queda en 0.
+        - estricto=True: solo descuenta si el libro está disponible y
+          hay ejemplares suficientes (nunca presta de más).
+        
+        Devuelve (stock, estado) nuevos, o None si no se actualizó
+        ninguna fila (no existe o no hay stock suficiente).
+        """
+        filas, valores = self._filas_y_valores_stock(
+            self.filter(pk=libro_id), cantidad, estricto
+        )
+        resultado = self._update_returning(libro_id, filas, valores)
+        if resultado is not None:
+            self._stock_cambiado({libro_id: dict(zip(self.CAMPOS_RETURNING, resultado))})
+            resultado = resultado[:2]
+        return resultado
+    
+    def ajustar_stock_grupo(self, libro_ids, cantidad, estricto=False):
+        """
+        Igual que ajustar_stock pero para varios libros con la misma
+        cantidad en un solo UPDATE. Devuelve cuántas filas se actualizaron.
+        """
+        filas, valores = self._filas_y_valores_stock(
+            self.filter(pk__in=libro_ids), cantidad, estricto
+        )
+        actualizadas = filas.update(**valores)
+        if actualizadas:
+            self._stock_cambiado({libro_id: {} for libro_id in libro_ids})
+        return actualizadas
+    
+    def _stock_cambiado(self, cambios):
+        """
+        Los UPDATE por queryset no disparan post_save: invalidar la caché
+        de respuestas y anunciar el stock por WebSocket aquí.
+        cambios: {libro_id: {campo: valor}} con los valores que se conozcan
+        """
+        from .cache_respuestas import invalidar
+        from .notificaciones import stock_cambiado
+        invalidar('libro')
+        stock_cambiado(cambios)
+    
+    def _filas_y_valores_stock(self, filas, cantidad, estricto):
+        """Condiciones y expresiones SET comunes a los ajustes de stock"""
+        if cantidad >= 0:
+            nuevo_stock = F('stock') + cantidad
+        else:
+            # Se evita el valor intermedio negativo: la columna es UNSIGNED en MySQL
+            nuevo_stock = Case(
+                When(stock__gt=-cantidad, then=F('stock') - (-cantidad)),
+                default=Value(0),
+            )
+            if estricto:
+                filas = filas.filter(estado=Libro.DISPONIBLE, stock__gte=-cantidad)
+        
+        # El orden importa: MySQL evalúa el SET de izquierda a derecha con
+        # los valores ya asignados, por eso `estado` se calcula antes que
+        # `stock` (así todos los motores leen el stock anterior).
+        valores = {
+            'estado': Case(
+                When(stock__lte=-cantidad, then=Value(Libro.PRESTADO)),
+                When(estado=Libro.PRESTADO, then=Value(Libro.DISPONIBLE)),
+                default=F('estado'),
+                output_field=models.CharField(),
+            ),
+            'stock': nuevo_stock,
+            'fecha_actualizacion': timezone.now(),
+        }
+        return filas, valores
+    
+    # Lo que devuelve el UPDATE: (stock, estado) y los temas de las notificaciones
+    CAMPOS_RETURNING = ('stock', 'estado', 'autor_id', 'categoria_id')
+    
+    def _update_returning(self, libro_id, filas, valores):
+        """
+        Ejecuta el UPDATE y obtiene los CAMPOS_RETURNING sin un SELECT
+        extra (en MySQL solo el stock)
+        """
+        # `filas.db` es el alias de lectura (una réplica con ReplicaRouter):
+        # el UPDATE va a la base de escritura, como en QuerySet.update()
+        alias = filas._db or router.db_for_write(self.model, **filas._hints)
+        connection = connections[alias]
+        vendor = connection.vendor
+        
+        if vendor == 'mysql':
+            # LAST_INSERT_ID(expr) deja el nuevo stock en el paquete OK
+            # del UPDATE; el cliente lo expone como cursor.lastrowid
+            valores['stock'] = Func(valores['stock'], function='LAST_INSERT_ID')
+        
+        query = filas.query.chain(UpdateQuery)
+        query.add_update_values(valores)
+        sql, params = query.get_compiler(alias).as_sql()
+        
+        returning = vendor in ('postgresql', 'sqlite')
+        if returning:
+            qn = connection.ops.quote_name
+            sql = f"{sql} RETURNING {', '.join(qn(c) for c in self.CAMPOS_RETURNING)}"
+        
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            if returning:
+                fila = cursor.fetchone()
+                return tuple(fila) if fila else None
+            if not cursor.rowcount:
+                return None
+            if vendor == 'mysql':
+                return cursor.lastrowid, None
+        
+        # Motores sin RETURNING ni LAST_INSERT_ID
+        return (
+            self.model._base_manager.using(alias)
+            .filter(pk=libro_id)
+            .values_list(*self.CAMPOS_RETURNING)
+            .first()
+        )
+
+
 class Libro(models.Model):
     """Modelo principal de libros"""
     
@@ -123,6 +257,8 @@ class Libro(models.Model):
         related_name='libros_creados'
     )
     
+    objects = LibroQuerySet.as_manager()
+    
     class Meta:
         verbose_name_plural = "Libros"
         ordering = ['-fecha_creacion']
@@ -130,26 +266,48 @@ class Libro(models.Model):
             models.Index(fields=['isbn']),
             models.Index(fields=['titulo']),
             models.Index(fields=['autor']),
+            # Paginación por cursor sobre el orden por defecto
+            models.Index(fields=['fecha_creacion', 'id']),
         ]
     
     def __str__(self):
         return f"{self.titulo} - {self.autor.nombre_completo}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        libro = super().from_db(db, field_names, values)
+        # Stock y estado en la base: notificar_stock (signals.py) solo
+        # anuncia los guardados que los cambian
+        libro.stock_guardado = (libro.__dict__.get('stock'), libro.__dict__.get('estado'))
+        return libro
+    
     @property
     def esta_disponible(self):
         """Verifica si el libro está disponible para préstamo"""
         return self.estado == self.DISPONIBLE and self.stock > 0
     
-    def actualizar_stock(self, cantidad):
-        """Actualiza el stock del libro"""
-        self.stock += cantidad
-        if self.stock < 0:
-            self.stock = 0
-        if self.stock == 0:
-            self.estado = self.PRESTADO
-        elif self.stock > 0 and self.estado == self.PRESTADO:
-            self.estado = self.DISPONIBLE
-        self.save()
+    def actualizar_stock(self, cantidad, estricto=False):
+        """
+        Actualiza el stock del libro de forma atómica en la base de datos
+        (ver LibroQuerySet.ajustar_stock). Devuelve False si no se aplicó.
+        """
+        resultado = Libro.objects.ajustar_stock(self.pk, cantidad, estricto=estricto)
+        if resultado is None:
+            return False
+        
+        self.stock, estado = resultado
+        if estado is None:
+            # MySQL solo devuelve el stock; se replica la regla del UPDATE
+            if self.stock == 0:
+                estado = self.PRESTADO
+            elif self.estado == self.PRESTADO:
+                estado = self.DISPONIBLE
+            else:
+                estado = self.estado
+        self.estado = estado
+        # El UPDATE ya se anunció (LibroQuerySet._stock_cambiado)
+        self.stock_guardado = (self.stock, self.estado)
+        return True
 
 
 class Prestamo(models.Model):
@@ -184,6 +342,10 @@ class Prestamo(models.Model):
     class Meta:
         verbose_name_plural = "Préstamos"
         ordering = ['-fecha_prestamo']
+        indexes = [
+            # Paginación por cursor de /api/prestamos/
+            models.Index(fields=['fecha_prestamo', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.libro.titulo} - {self.usuario.username}"
@@ -202,4 +364,63 @@ class Prestamo(models.Model):
         from django.utils import timezone
         if self.fecha_devolucion_real:
             return False
-        return timezone.now().date() > self.fecha_devolucion_esperada
\ No newline at end of file
+        return timezone.now().date() > self.fecha_devolucion_esperada
+
+
+class DocumentoBusqueda(models.Model):
+    """Documento indexado en el índice invertido de búsqueda (libros/busqueda.py)"""
+    
+    modelo = models.CharField(max_length=20)
+    objeto_id = models.PositiveBigIntegerField()
+    longitud = models.PositiveIntegerField()
+    # Huella del texto indexado: si no cambia no se reindexa
+    firma = models.CharField(max_length=32)
+    
+    class Meta:
+        unique_together = ['modelo', 'objeto_id']
+    
+    def __str__(self):
+        return f"{self.modelo}:{self.objeto_id}"
+
+
+class TerminoBusqueda(models.Model):
+    """Posting del índice invertido: término -> documento"""
+    
+    modelo = models.CharField(max_length=20)
+    termino = models.CharField(max_length=64)
+    objeto_id = models.PositiveBigIntegerField()
+    frecuencia = models.PositiveIntegerField()
+    # Copia de DocumentoBusqueda.longitud para puntuar sin otra consulta
+    longitud = models.PositiveIntegerField()
+    
+    class Meta:
+        indexes = [
+            # Cubre la consulta de búsqueda: no hay que leer la tabla
+            models.Index(fields=['modelo', 'termino', 'objeto_id', 'frecuencia', 'longitud']),
+            models.Index(fields=['modelo', 'objeto_id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.termino} -> {self.modelo}:{self.objeto_id}"
+
+
+class MensajeChat(models.Model):
+    """Mensaje de una sala de chat, guardado en lotes por libros/chat.py"""
+    
+    sala = models.CharField(max_length=100)
+    # Id asignado al recibirlo: evita duplicados entre memoria y base de datos
+    uid = models.CharField(max_length=32, unique=True)
+    usuario = models.CharField(max_length=150)
+    mensaje = models.TextField()
+    # Momento en que se recibió, no en que se guardó el lote
+    fecha = models.DateTimeField()
+    
+    class Meta:
+        verbose_name_plural = "Mensajes de chat"
+        indexes = [
+            # Últimos mensajes de una sala y páginas anteriores
+            models.Index(fields=['sala', 'fecha']),
+        ]
+    
+    def __str__(self):
+        return f"{self.sala}: {self.usuario}"
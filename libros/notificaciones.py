@@ -0,0 +1,248 @@
+"""
+Notificaciones de stock que empuja el servidor por ws/notificaciones/.
+
+Cada cambio de stock confirmado (post_save de Libro y los UPDATE de
+LibroQuerySet.ajustar_stock / ajustar_stock_grupo) se registra con
+`transaction.on_commit`: lo que se revierte nunca se anuncia. Los cambios
+se agrupan por libro durante una ventana corta y al vaciarla se publica
+un delta compacto por título:
+
+    {'type': 'libro_actualizado',
+     'libro': {'id', 'stock', 'disponible', 'autor', 'categoria'}}
+
+Los valores vienen del propio UPDATE (RETURNING) o de la instancia
+guardada cuando se conocen; los que faltan (p. ej. ajustes en grupo) se
+leen con una sola consulta por ventana. Los consumers solo reenvían el
+evento: ninguna consulta por cliente.
+
+Cada delta se publica en los grupos de sus temas: 'todo' (el grupo
+general, el único que existía antes), 'libro:<id>', 'categoria:<id>' y
+'autor:<id>'. Un cliente solo recibe los temas a los que está suscrito.
+
+La ventana se vacía en el event loop del servidor cuando el cambio viene
+de código síncrono que corre bajo él (vistas con ASGI, consumers): la
+InMemoryChannelLayer solo despierta a quien espera si se publica desde
+ese loop. Sin servidor ASGI (WSGI, comandos) se vacía en un hilo, y los
+avisos solo llegan a otros procesos con una capa compartida (Redis).
+"""
+import asyncio
+import logging
+import threading
+import uuid
+
+from asgiref.sync import SyncToAsync, async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections, transaction
+
+from .protocolos import frames_libro
+from .routers import leer_de_primaria
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Segundos durante los que se juntan los cambios de un mismo libro;
+    # 0 publica en cuanto se confirma la transacción
+    'VENTANA': 0.25,
+    # Grupo del tema 'todo'; los demás temas cuelgan de él
+    'GRUPO': 'notificaciones',
+    # Temas que puede tener a la vez una conexión
+    'MAX_SUSCRIPCIONES': 50,
+}
+
+# Campos de un cambio pendiente; los dos últimos deciden los temas
+CAMPOS = ('stock', 'estado', 'autor_id', 'categoria_id')
+TEMAS = ('libro', 'categoria', 'autor')
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'NOTIFICACIONES_STOCK', {})}
+
+
+def delta(libro_id, stock, estado, autor_id, categoria_id):
+    from .models import Libro
+
+    return {
+        'id': libro_id,
+        'stock': stock,
+        'disponible': estado == Libro.DISPONIBLE and stock > 0,
+        'autor': autor_id,
+        'categoria': categoria_id,
+    }
+
+
+# ===== TEMAS =====
+
+def validar_tema(tema):
+    """
+    Normalizar 'todo', 'libro:<id>', 'categoria:<id>' o 'autor:<id>'.
+    Lanza ValueError si el tema no es válido.
+    """
+    if tema == 'todo':
+        return tema
+    tipo, _, valor = str(tema).partition(':')
+    if tipo not in TEMAS or not valor.isdigit():
+        raise ValueError(f'Tema no válido: {tema}')
+    return f'{tipo}:{int(valor)}'
+
+
+def grupo_de_tema(tema):
+    """Nombre del grupo de la capa de canales para un tema válido"""
+    grupo = configuracion()['GRUPO']
+    if tema == 'todo':
+        return grupo
+    return f"{grupo}.{tema.replace(':', '.')}"
+
+
+def temas_de(libro):
+    """Temas en los que se publica el delta de un libro"""
+    temas = ['todo', f"libro:{libro['id']}", f"autor:{libro['autor']}"]
+    if libro['categoria'] is not None:
+        temas.append(f"categoria:{libro['categoria']}")
+    return temas
+
+
+class CoalescedorStock:
+    """Últimos valores conocidos por libro hasta vaciar la ventana"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pendientes = {}
+        self.temporizador = None
+
+    def agregar(self, cambios):
+        """cambios: {libro_id: {campo: valor}} con los CAMPOS que se conozcan"""
+        ventana = configuracion()['VENTANA']
+        with self.lock:
+            for libro_id, valores in cambios.items():
+                # El stock y el estado del último cambio reemplazan a los
+                # anteriores (si no los trae se leen al vaciar); el autor
+                # y la categoría se conservan
+                previos = self.pendientes.get(libro_id, {})
+                self.pendientes[libro_id] = {
+                    **{k: previos[k] for k in ('autor_id', 'categoria_id') if k in previos},
+                    **{k: v for k, v in valores.items() if v is not None or k == 'categoria_id'},
+                }
+            if ventana > 0 and self.temporizador is None:
+                bucle = bucle_del_servidor()
+                if bucle is not None:
+                    self.temporizador = bucle.call_soon_threadsafe(
+                        bucle.call_later, ventana, self._vaciar_en_bucle,
+                    )
+                else:
+                    self.temporizador = threading.Timer(ventana, self._vaciar_en_hilo)
+                    self.temporizador.daemon = True
+                    self.temporizador.start()
+        if ventana <= 0:
+            self.vaciar()
+
+    def _vaciar_en_bucle(self):
+        # Se guarda la tarea: el loop solo conserva una referencia débil
+        self.tarea = asyncio.get_running_loop().create_task(self.vaciar_async())
+
+    def _vaciar_en_hilo(self):
+        try:
+            self.vaciar()
+        finally:
+            # Conexiones que abrió este hilo para completar los valores
+            connections.close_all()
+
+    def _tomar(self):
+        with self.lock:
+            pendientes, self.pendientes = self.pendientes, {}
+            self.temporizador = None
+        return pendientes
+
+    def vaciar(self):
+        pendientes = self._tomar()
+        if not pendientes:
+            return
+        try:
+            publicar(self.completar(pendientes))
+        except Exception:
+            logger.exception('No se pudieron publicar %s cambios de stock', len(pendientes))
+
+    async def vaciar_async(self):
+        """vaciar() desde el loop del servidor: la consulta va al pool de hilos"""
+        from .conexiones import database_sync_to_async
+
+        pendientes = self._tomar()
+        capa = get_channel_layer()
+        if not pendientes or capa is None:
+            return
+        try:
+            await _enviar(capa, await database_sync_to_async(self.completar)(pendientes))
+        except Exception:
+            logger.exception('No se pudieron publicar %s cambios de stock', len(pendientes))
+
+    def completar(self, pendientes):
+        """Leer en una consulta los valores que no trajo el UPDATE"""
+        from .models import Libro
+
+        faltantes = [
+            pk for pk, valores in pendientes.items()
+            if any(campo not in valores for campo in CAMPOS)
+        ]
+        if faltantes:
+            # Recién confirmado: la réplica puede no tenerlo aún
+            with leer_de_primaria():
+                filas = list(Libro.objects.filter(pk__in=faltantes).values('pk', *CAMPOS))
+            for fila in filas:
+                pendientes[fila.pop('pk')] = fila
+        return [
+            delta(pk, *(valores[campo] for campo in CAMPOS))
+            for pk, valores in pendientes.items()
+            # Los libros borrados antes de vaciar no se encuentran
+            if all(campo in valores for campo in CAMPOS)
+        ]
+
+
+coalescedor = CoalescedorStock()
+
+
+def bucle_del_servidor():
+    """
+    Event loop que espera a este hilo si corre bajo sync_to_async (asgiref
+    lo anota al entrar al hilo), o None
+    """
+    bucle = getattr(SyncToAsync.threadlocal, 'main_event_loop', None)
+    if bucle is None or not bucle.is_running():
+        return None
+    return bucle
+
+
+def publicar(deltas):
+    capa = get_channel_layer()
+    if capa is None:
+        return
+    async_to_sync(_enviar)(capa, deltas)
+
+
+def evento_libro(libro):
+    """
+    Mensaje de grupo con los frames ya codificados en cada subprotocolo
+    (protocolos.py): se serializa una vez por cambio y no una vez por cliente
+    """
+    return {
+        'type': 'libro_actualizado',
+        # Quien está suscrito a varios temas del mismo libro recibe el
+        # evento una vez por grupo: el id permite descartar las copias
+        'evento': uuid.uuid4().hex,
+        'libro_id': libro['id'],
+        'frames': frames_libro(libro),
+    }
+
+
+async def _enviar(capa, deltas):
+    for libro in deltas:
+        evento = evento_libro(libro)
+        for tema in temas_de(libro):
+            await capa.group_send(grupo_de_tema(tema), evento)
+
+
+def stock_cambiado(cambios):
+    """
+    Registrar cambios de stock para anunciarlos cuando (y si) se confirma
+    la transacción actual. cambios: {libro_id: {campo: valor}}
+    """
+    transaction.on_commit(lambda: coalescedor.agregar(cambios))
@@ -0,0 +1,240 @@
+"""
+Paginación por llave (keyset / cursor).
+
+En vez de OFFSET, cada página continúa desde los valores de ordenamiento
+de la última fila vista: `WHERE (orden) > (valores del cursor)`. El costo
+de una página no depende de qué tan profunda sea. El ordenamiento debe
+ser estable y terminar en una columna única (normalmente `id`), y sus
+columnas no deben aceptar NULL.
+
+PaginacionCursor aplica lo mismo a los listados de la API REST.
+
+Si la vista ya contó las filas (`total_filas`, ver condicional.py) ambas
+paginaciones usan ese total en vez de repetir el COUNT(*).
+"""
+import base64
+import json
+from decimal import Decimal
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se puede decodificar"""
+
+
+def codificar_cursor(objeto, orden):
+    """Cursor opaco con los valores de ordenamiento de `objeto`"""
+    valores = []
+    for campo in orden:
+        valor = getattr(objeto, campo.lstrip('-'))
+        if hasattr(valor, 'isoformat'):
+            valor = valor.isoformat()
+        elif isinstance(valor, Decimal):
+            valor = str(valor)
+        valores.append(valor)
+    datos = json.dumps(valores, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(datos).decode()
+
+
+def decodificar_cursor(cursor, modelo, orden):
+    """Valores de ordenamiento del cursor, ya convertidos al tipo del campo"""
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise CursorInvalido('Cursor inválido') from e
+    if not isinstance(valores, list) or len(valores) != len(orden):
+        raise CursorInvalido('Cursor inválido')
+    try:
+        return [
+            modelo._meta.get_field(campo.lstrip('-')).to_python(valor)
+            for campo, valor in zip(orden, valores)
+        ]
+    except Exception as e:
+        raise CursorInvalido('Cursor inválido') from e
+
+
+def filtro_despues_de(orden, valores):
+    """
+    Q de las filas que van después de `valores` según `orden`:
+    a >= va AND ((a > va) OR (a = va AND b > vb) OR ...)
+    """
+    condicion = Q()
+    for i, campo in enumerate(orden):
+        nombre = campo.lstrip('-')
+        operador = 'lt' if campo.startswith('-') else 'gt'
+        iguales = {
+            anterior.lstrip('-'): valor
+            for anterior, valor in zip(orden[:i], valores[:i])
+        }
+        condicion |= Q(**iguales, **{f'{nombre}__{operador}': valores[i]})
+    # Cota redundante sobre la primera columna: permite al motor recorrer
+    # el índice como rango en vez de evaluar el OR fila por fila
+    primera = orden[0]
+    operador = 'lte' if primera.startswith('-') else 'gte'
+    return Q(**{f'{primera.lstrip("-")}__{operador}': valores[0]}) & condicion
+
+
+def invertir_orden(orden):
+    """Mismo ordenamiento en sentido contrario (para ir a la página anterior)"""
+    return tuple(
+        campo[1:] if campo.startswith('-') else f'-{campo}' for campo in orden
+    )
+
+
+def paginar(queryset, orden, primeros, despues=None):
+    """
+    Página de `primeros` filas después del cursor `despues`.
+    Devuelve (filas, hay_mas); se pide una fila extra para saber si hay más.
+    """
+    queryset = queryset.order_by(*orden)
+    if despues:
+        valores = decodificar_cursor(despues, queryset.model, orden)
+        queryset = queryset.filter(filtro_despues_de(orden, valores))
+    filas = list(queryset[:primeros + 1])
+    return filas[:primeros], len(filas) > primeros
+
+
+class PaginadorConTotal(Paginator):
+    """Paginator de Django con el total ya conocido"""
+
+    def __init__(self, *args, total=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if total is not None:
+            # `count` es cached_property: asignarlo evita el COUNT(*)
+            self.count = total
+
+
+class PaginacionNumerada(PageNumberPagination):
+    """PageNumberPagination que reutiliza el total contado por la vista"""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            PaginadorConTotal, total=getattr(view, 'total_filas', None)
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class PaginacionCursor(BasePagination):
+    """
+    Paginación por cursor para la API REST, sin OFFSET.
+
+    El orden es el del queryset (el `ordering` del viewset o el que pida el
+    cliente con ?ordering=) terminado en la llave primaria. Parámetros:
+    - ?cursor= / ?antes=: los arman los enlaces `next` y `previous`
+    - ?page_size=: tamaño de página, hasta `max_page_size`
+    - ?count=false: omitir el COUNT(*) del total
+
+    Si el cliente pide ?page= o el orden usa columnas que aceptan NULL o
+    de otra tabla, se responde con PageNumberPagination como antes.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    anterior_query_param = 'antes'
+    count_query_param = 'count'
+    respaldo_class = PaginacionNumerada
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.respaldo = None
+        orden = self.obtener_orden(queryset)
+        if orden is None or 'page' in request.query_params:
+            self.respaldo = self.respaldo_class()
+            self.respaldo.page_size = self.get_page_size(request)
+            return self.respaldo.paginate_queryset(queryset, request, view)
+
+        if self.incluir_total(request):
+            self.total = getattr(view, 'total_filas', None)
+            if self.total is None:
+                self.total = queryset.count()
+        else:
+            self.total = None
+        tamano = self.get_page_size(request)
+        despues = request.query_params.get(self.cursor_query_param)
+        antes = request.query_params.get(self.anterior_query_param)
+        try:
+            if antes:
+                filas, hay_mas = paginar(queryset, invertir_orden(orden), tamano, antes)
+                filas.reverse()
+            else:
+                filas, hay_mas = paginar(queryset, orden, tamano, despues)
+        except CursorInvalido:
+            raise NotFound('Cursor inválido')
+
+        # Hacia atrás, `hay_mas` indica si existe una página anterior
+        hay_siguiente = bool(antes) or hay_mas
+        hay_anterior = hay_mas if antes else bool(despues)
+        self.siguiente = codificar_cursor(filas[-1], orden) if filas and hay_siguiente else None
+        self.anterior = codificar_cursor(filas[0], orden) if filas and hay_anterior else None
+        return filas
+
+    def obtener_orden(self, queryset):
+        """
+        Orden del queryset terminado en la llave primaria, o None si no
+        sirve para paginar por llave.
+        """
+        opciones = queryset.model._meta
+        pk = opciones.pk.name
+        orden = []
+        for campo in queryset.query.order_by or opciones.ordering:
+            if not isinstance(campo, str):
+                return None
+            signo = '-' if campo.startswith('-') else ''
+            nombre = campo.lstrip('-')
+            nombre = pk if nombre == 'pk' else nombre
+            try:
+                modelo_campo = opciones.get_field(nombre)
+            except FieldDoesNotExist:
+                return None
+            if modelo_campo.null or modelo_campo.is_relation:
+                return None
+            orden.append(signo + nombre)
+            if nombre == pk:
+                return tuple(orden)
+        if not orden:
+            return None
+        orden.append(f'-{pk}' if orden[0].startswith('-') else pk)
+        return tuple(orden)
+
+    def get_page_size(self, request):
+        try:
+            tamano = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(tamano, self.max_page_size) if tamano > 0 else self.page_size
+
+    def incluir_total(self, request):
+        valor = request.query_params.get(self.count_query_param, 'true')
+        return valor.lower() not in ('0', 'false', 'no')
+
+    def enlace(self, parametro, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.cursor_query_param)
+        url = remove_query_param(url, self.anterior_query_param)
+        return replace_query_param(url, parametro, cursor)
+
+    def get_paginated_response(self, data):
+        if self.respaldo is not None:
+            return self.respaldo.get_paginated_response(data)
+        respuesta = {}
+        if self.total is not None:
+            respuesta['count'] = self.total
+        respuesta['next'] = self.enlace(self.cursor_query_param, self.siguiente)
+        respuesta['previous'] = self.enlace(self.anterior_query_param, self.anterior)
+        respuesta['results'] = data
+        return Response(respuesta)
+
+    def get_paginated_response_schema(self, schema):
+        return self.respaldo_class().get_paginated_response_schema(schema)
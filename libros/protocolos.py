@@ -0,0 +1,71 @@
+"""
+Subprotocolos de ws/notificaciones/ (encabezado Sec-WebSocket-Protocol).
+
+- 'biblioteca.json' o ninguno: frames de texto JSON, como siempre.
+- 'biblioteca.msgpack' y 'biblioteca.cbor': frames binarios. Los cambios
+  de stock van como arreglo posicional, sin nombres de campo:
+
+      [1, id, stock, disponible, autor, categoria]
+
+  (1 = libro_actualizado). Los demás mensajes (conexión, suscripciones,
+  errores) son el mismo diccionario que en JSON, codificado en binario.
+  El cliente puede enviar sus mensajes en el mismo formato o en JSON.
+
+Si el cliente ofrece varios se usa el primero que el servidor conoce.
+"""
+import cbor2
+import msgpack
+
+from .json_rapido import dumps, loads
+
+SUBPROTOCOLOS = {
+    'biblioteca.json': 'json',
+    'biblioteca.msgpack': 'msgpack',
+    'biblioteca.cbor': 'cbor',
+}
+
+FORMATOS_BINARIOS = {
+    'msgpack': (lambda datos: msgpack.packb(datos, use_bin_type=True), msgpack.unpackb),
+    'cbor': (cbor2.dumps, cbor2.loads),
+}
+
+# Primer elemento de los frames compactos
+LIBRO_ACTUALIZADO = 1
+
+
+def negociar(solicitados):
+    """(subprotocolo aceptado o None, formato) para los que ofrece el cliente"""
+    for subprotocolo in solicitados or ():
+        if subprotocolo in SUBPROTOCOLOS:
+            return subprotocolo, SUBPROTOCOLOS[subprotocolo]
+    return None, 'json'
+
+
+def compacto(libro):
+    """Cambio de stock como arreglo posicional"""
+    return [
+        LIBRO_ACTUALIZADO, libro['id'], libro['stock'], libro['disponible'],
+        libro['autor'], libro['categoria'],
+    ]
+
+
+def frames_libro(libro):
+    """Frame de un cambio de stock en cada formato, para codificarlo una vez"""
+    frames = {'json': dumps({'type': 'libro_actualizado', 'libro': libro})}
+    for formato, (codificar, _) in FORMATOS_BINARIOS.items():
+        frames[formato] = codificar(compacto(libro))
+    return frames
+
+
+def codificar(datos, formato):
+    """Mensaje de control (diccionario) en el formato de la conexión"""
+    if formato == 'json':
+        return dumps(datos)
+    return FORMATOS_BINARIOS[formato][0](datos)
+
+
+def decodificar(texto=None, binario=None, formato='json'):
+    """Mensaje del cliente: texto JSON o binario en el formato negociado"""
+    if texto is not None or formato == 'json':
+        return loads(texto if texto is not None else binario)
+    return FORMATOS_BINARIOS[formato][1](binario)
@@ -0,0 +1,90 @@
+"""
+Lecturas del catálogo en réplicas de solo lectura.
+
+ReplicaRouter manda las lecturas de los modelos de REPLICAS['MODELOS']
+(Libro, Autor, Categoria) a una de las réplicas de REPLICAS['ALIAS'];
+todo lo demás (Prestamo, usuarios, sesiones) y todas las escrituras van a
+la primaria. Sin réplicas configuradas no cambia nada.
+
+Leer lo que uno mismo escribió ("read-your-writes"): dentro de un
+alcance (uno por petición, ver ReplicaMiddleware) las lecturas van a la
+primaria
+- si el método no es seguro (POST, PUT, PATCH, DELETE),
+- desde la primera escritura en adelante,
+- si la petición trae la cookie que se deja tras escribir, durante
+  FIJAR_SEGUNDOS (lo que tarda en replicarse),
+- y siempre dentro de una transacción de la primaria.
+Fuera de una petición (hilos, tareas) se puede usar `leer_de_primaria()`.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARIA = DEFAULT_DB_ALIAS
+
+DEFAULTS = {
+    'ALIAS': [],
+    'MODELOS': ['libros.Libro', 'libros.Autor', 'libros.Categoria'],
+    'FIJAR_SEGUNDOS': 5,
+    'COOKIE': 'fijar_primaria',
+}
+
+
+def configuracion():
+    return {**DEFAULTS, **getattr(settings, 'REPLICAS', {})}
+
+
+class Alcance:
+    """Estado de lectura de una petición"""
+
+    def __init__(self, fijado=False):
+        # True: las lecturas van a la primaria
+        self.fijado = fijado
+        self.escribio = False
+
+
+_alcance = ContextVar('alcance_replicas', default=None)
+
+
+@contextmanager
+def alcance(fijado=False):
+    token = _alcance.set(Alcance(fijado))
+    try:
+        yield _alcance.get()
+    finally:
+        _alcance.reset(token)
+
+
+def leer_de_primaria():
+    """Alcance en el que todas las lecturas van a la primaria"""
+    return alcance(fijado=True)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        config = configuracion()
+        if not config['ALIAS']:
+            return None
+        if model._meta.label not in config['MODELOS']:
+            # También cuando se llega desde un objeto leído en una réplica
+            return PRIMARIA
+        actual = _alcance.get()
+        if (actual is not None and actual.fijado) or connections[PRIMARIA].in_atomic_block:
+            return PRIMARIA
+        return random.choice(config['ALIAS'])
+
+    def db_for_write(self, model, **hints):
+        actual = _alcance.get()
+        if actual is not None:
+            actual.fijado = actual.escribio = True
+        return PRIMARIA
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {PRIMARIA, *configuracion()['ALIAS']}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
@@ -1,20 +1,49 @@
 import graphene
+from django.contrib.auth.models import User
 from graphene_django import DjangoObjectType
-from .models import Libro, Autor, Categoria
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+from .busqueda import filtrar
+from .loaders import LIBRO_RELACIONES, obtener_cargadores
+from .models import Libro, Autor, Categoria, Prestamo
+from .paginacion import CursorInvalido, codificar_cursor, paginar
+
+
+def cargar(info, cargador, llave, respaldo):
+    """
+    Resolver una relación con el DataLoader de la petición; sin
+    contexto (p. ej. schema.execute() en shell) usa el acceso normal.
+    """
+    cargadores = obtener_cargadores(info)
+    if cargadores is None:
+        return respaldo()
+    return getattr(cargadores, cargador).load(llave)
 
 
 # ===== TYPES (Tipos de Datos) =====
 
+class UserType(DjangoObjectType):
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name')
+
+
 class AutorType(DjangoObjectType):
     class Meta:
         model = Autor
         fields = '__all__'
+    
+    def resolve_libros(self, info):
+        return cargar(info, 'libros_por_autor', self.pk, self.libros.all)
 
 
 class CategoriaType(DjangoObjectType):
     class Meta:
         model = Categoria
         fields = '__all__'
+    
+    def resolve_libros(self, info):
+        return cargar(info, 'libros_por_categoria', self.pk, self.libros.all)
 
 
 class LibroType(DjangoObjectType):
@@ -26,14 +55,135 @@ class LibroType(DjangoObjectType):
     
     def resolve_esta_disponible(self, info):
         return self.esta_disponible
+    
+    def resolve_autor(self, info):
+        return cargar(info, 'autor', self.autor_id, lambda: self.autor)
+    
+    def resolve_categoria(self, info):
+        return cargar(info, 'categoria', self.categoria_id, lambda: self.categoria)
+    
+    def resolve_creado_por(self, info):
+        return cargar(info, 'usuario', self.creado_por_id, lambda: self.creado_por)
+    
+    def resolve_prestamos(self, info):
+        return cargar(info, 'prestamos_por_libro', self.pk, self.prestamos.all)
+
+
+class PrestamoType(DjangoObjectType):
+    class Meta:
+        model = Prestamo
+        # Sin usuario ni notas: el endpoint GraphQL es público
+        fields = ('id', 'libro', 'fecha_prestamo', 'fecha_devolucion_esperada',
+                  'fecha_devolucion_real', 'estado')
+    
+    def resolve_libro(self, info):
+        return cargar(info, 'libro', self.libro_id, lambda: self.libro)
+
+
+# ===== CONNECTIONS (Listas paginadas) =====
+
+# Ordenamientos estables (terminan en id) para la paginación por cursor
+ORDEN_LIBROS = ('-fecha_creacion', '-id')
+ORDEN_AUTORES = ('apellido', 'nombre', 'id')
+
+
+class ConexionBase(graphene.relay.Connection):
+    """Connection estilo Relay con totalCount calculado solo si se pide"""
+    
+    class Meta:
+        abstract = True
+    
+    total_count = graphene.Int()
+    
+    def resolve_total_count(self, info):
+        return self.queryset.count()
+
+
+class LibroConnection(ConexionBase):
+    class Meta:
+        node = LibroType
+
+
+class AutorConnection(ConexionBase):
+    class Meta:
+        node = AutorType
+
+
+def campo_conexion(conexion, **argumentos):
+    """Campo con `first`/`after` (solo hacia adelante)"""
+    return graphene.Field(
+        conexion,
+        first=graphene.Int(),
+        after=graphene.String(),
+        **argumentos
+    )
+
+
+def resolver_conexion(conexion, queryset, orden, first=None, after=None, preparar=None):
+    """Una página por llave (keyset) de `queryset` envuelta en `conexion`"""
+    maximo = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    if first is None:
+        first = maximo
+    if first < 0:
+        raise GraphQLError('`first` debe ser mayor o igual a 0')
+    if first > maximo:
+        raise GraphQLError(
+            f'Se pidieron {first} registros; el máximo por página es {maximo}'
+        )
+    
+    try:
+        filas, hay_mas = paginar(queryset, orden, first, after)
+    except CursorInvalido as e:
+        raise GraphQLError(str(e))
+    if preparar:
+        filas = preparar(filas)
+    
+    edges = [
+        conexion.Edge(node=fila, cursor=codificar_cursor(fila, orden))
+        for fila in filas
+    ]
+    resultado = conexion(
+        edges=edges,
+        page_info=graphene.relay.PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_next_page=hay_mas,
+            has_previous_page=bool(after),
+        ),
+    )
+    resultado.queryset = queryset
+    return resultado
 
 
 # ===== QUERIES (Consultas) =====
 
+def lista_libros(info, libros):
+    """
+    Traer autor/categoría/creador con JOIN y registrar la lista en los
+    DataLoaders para que los niveles siguientes se carguen por lotes
+    """
+    libros = libros.select_related(*LIBRO_RELACIONES)
+    cargadores = obtener_cargadores(info)
+    if cargadores is None:
+        return libros
+    return cargadores.agendar_libros(list(libros))
+
+
+def pagina_libros(info, libros, first, after):
+    """Connection de libros con sus relaciones registradas en los DataLoaders"""
+    cargadores = obtener_cargadores(info)
+    return resolver_conexion(
+        LibroConnection,
+        libros.select_related(*LIBRO_RELACIONES),
+        ORDEN_LIBROS, first, after,
+        preparar=cargadores.agendar_libros if cargadores else None,
+    )
+
+
 class Query(graphene.ObjectType):
-    # Queries simples
-    all_libros = graphene.List(LibroType)
-    all_autores = graphene.List(AutorType)
+    # Queries simples (paginadas por cursor)
+    all_libros = campo_conexion(LibroConnection)
+    all_autores = campo_conexion(AutorConnection)
     all_categorias = graphene.List(CategoriaType)
     
     # Queries con argumentos
@@ -48,48 +198,60 @@ class Query(graphene.ObjectType):
         autor_id=graphene.Int(required=True)
     )
     
-    libros_disponibles = graphene.List(LibroType)
+    libros_disponibles = campo_conexion(LibroConnection)
     
-    buscar_libros = graphene.List(
-        LibroType,
+    buscar_libros = campo_conexion(
+        LibroConnection,
         titulo=graphene.String(required=True)
     )
     
     # Resolvers
-    def resolve_all_libros(self, info):
-        return Libro.objects.filter(activo=True)
+    def resolve_all_libros(self, info, first=None, after=None):
+        return pagina_libros(info, Libro.objects.filter(activo=True), first, after)
     
-    def resolve_all_autores(self, info):
-        return Autor.objects.all()
+    def resolve_all_autores(self, info, first=None, after=None):
+        cargadores = obtener_cargadores(info)
+        return resolver_conexion(
+            AutorConnection, Autor.objects.all(), ORDEN_AUTORES, first, after,
+            preparar=cargadores.agendar_autores if cargadores else None,
+        )
     
     def resolve_all_categorias(self, info):
-        return Categoria.objects.all()
+        categorias = list(Categoria.objects.all())
+        cargadores = obtener_cargadores(info)
+        if cargadores:
+            cargadores.agendar_categorias(categorias)
+        return categorias
     
     def resolve_libro(self, info, id=None, isbn=None):
         if id:
-            return Libro.objects.get(pk=id)
-        if isbn:
-            return Libro.objects.get(isbn=isbn)
-        return None
+            libros = Libro.objects.filter(pk=id)
+        elif isbn:
+            libros = Libro.objects.filter(isbn=isbn)
+        else:
+            return None
+        for libro in lista_libros(info, libros):
+            return libro
+        raise Libro.DoesNotExist('Libro no encontrado')
     
     def resolve_libros_por_autor(self, info, autor_id):
-        return Libro.objects.filter(
+        return lista_libros(info, Libro.objects.filter(
             autor_id=autor_id,
             activo=True
-        )
+        ))
     
-    def resolve_libros_disponibles(self, info):
-        return Libro.objects.filter(
+    def resolve_libros_disponibles(self, info, first=None, after=None):
+        return pagina_libros(info, Libro.objects.filter(
             estado=Libro.DISPONIBLE,
             stock__gt=0,
             activo=True
-        )
+        ), first, after)
     
-    def resolve_buscar_libros(self, info, titulo):
-        return Libro.objects.filter(
-            titulo__icontains=titulo,
-            activo=True
-        )
+    def resolve_buscar_libros(self, info, titulo, first=None, after=None):
+        # Índice de búsqueda; el orden sigue siendo el de la connection
+        # para que los cursores sean estables
+        libros = filtrar(Libro.objects.filter(activo=True), titulo, ordenar=False)
+        return pagina_libros(info, libros, first, after)
 
 
 # ===== MUTATIONS (Modificaciones) =====
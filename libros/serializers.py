@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from django.db.models import Count, Q
 from .models import Categoria, Autor, Libro, Prestamo
 from django.contrib.auth.models import User
 
@@ -8,8 +9,8 @@ class CategoriaSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Categoria
-        fields = ['id', 'nombre', 'descripcion', 'activo', 'fecha_creacion']
-        read_only_fields = ['id', 'fecha_creacion']
+        fields = ['id', 'nombre', 'descripcion', 'activo', 'fecha_creacion', 'fecha_actualizacion']
+        read_only_fields = ['id', 'fecha_creacion', 'fecha_actualizacion']
 
 
 class AutorSerializer(serializers.ModelSerializer):
@@ -22,10 +23,20 @@ class AutorSerializer(serializers.ModelSerializer):
         model = Autor
         fields = ['id', 'nombre', 'apellido', 'nombre_completo', 
                  'fecha_nacimiento', 'pais_origen', 'biografia', 
-                 'foto', 'total_libros', 'fecha_creacion']
-        read_only_fields = ['id', 'fecha_creacion']
+                 'foto', 'total_libros', 'fecha_creacion', 'fecha_actualizacion']
+        read_only_fields = ['id', 'fecha_creacion', 'fecha_actualizacion']
+    
+    @staticmethod
+    def anotar_queryset(queryset):
+        """Calcular total_libros en la misma consulta del listado"""
+        return queryset.annotate(
+            total_libros=Count('libros', filter=Q(libros__activo=True))
+        )
     
     def get_total_libros(self, obj):
+        # Sin anotación (p. ej. recién creado) se cuenta aparte
+        if hasattr(obj, 'total_libros'):
+            return obj.total_libros
         return obj.libros.filter(activo=True).count()
 
 
@@ -82,7 +93,8 @@ class PrestamoSerializer(serializers.ModelSerializer):
             'fecha_prestamo', 'fecha_devolucion_esperada', 'fecha_devolucion_real',
             'estado', 'dias_prestamo', 'esta_atrasado', 'notas'
         ]
-        read_only_fields = ['id', 'fecha_prestamo']
+        # El usuario siempre es el de la petición (ver perform_create)
+        read_only_fields = ['id', 'usuario', 'fecha_prestamo']
     
     def validate(self, data):
         """Validar que el libro esté disponible antes de prestar"""
@@ -107,4 +119,30 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'date_joined']
     
     def get_total_prestamos(self, obj):
-        return obj.prestamos.count()
\ No newline at end of file
+        return obj.prestamos.count()
+
+
+class PrestamoLoteSerializer(serializers.Serializer):
+    """Entrada para préstamo en lote (mostrador de circulación)"""
+    
+    MAX_LIBROS = 200
+    
+    libros = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_LIBROS,
+    )
+    fecha_devolucion_esperada = serializers.DateField()
+    notas = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class DevolucionLoteSerializer(serializers.Serializer):
+    """Entrada para devolución en lote"""
+    
+    MAX_PRESTAMOS = 200
+    
+    prestamos = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_PRESTAMOS,
+    )
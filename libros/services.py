@@ -0,0 +1,197 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from .models import Libro, Prestamo
+
+
+class ConflictoInventario(APIException):
+    """El inventario cambió entre la validación y la actualización del lote"""
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'El inventario cambió durante la operación, intenta de nuevo'
+    default_code = 'conflicto_inventario'
+
+
+class PrestamoService:
+    """Operaciones de préstamo y devolución con el mínimo de consultas"""
+
+    NO_DISPONIBLE = 'Este libro no está disponible para préstamo'
+
+    @classmethod
+    def prestar(cls, serializer, usuario):
+        """
+        Reservar un ejemplar y registrar el préstamo en una transacción.
+
+        La reserva es un solo UPDATE condicional (no hay ventana entre
+        verificar disponibilidad y descontar). Si no quedan ejemplares no
+        se inserta nada; si el INSERT falla, se revierte la reserva.
+        """
+        libro = serializer.validated_data['libro']
+
+        with transaction.atomic():
+            if not libro.actualizar_stock(-1, estricto=True):
+                raise serializers.ValidationError({'libro': cls.NO_DISPONIBLE})
+            return serializer.save(usuario=usuario)
+
+    @classmethod
+    def devolver(cls, prestamo):
+        """
+        Marcar el préstamo como devuelto y reponer el ejemplar.
+
+        El cambio de estado es condicional, así dos devoluciones
+        simultáneas del mismo préstamo solo suman stock una vez.
+        Devuelve False si el préstamo ya estaba devuelto.
+        """
+        fecha = timezone.now()
+
+        with transaction.atomic():
+            actualizados = (
+                Prestamo.objects
+                .filter(pk=prestamo.pk)
+                .exclude(estado=Prestamo.DEVUELTO)
+                .update(estado=Prestamo.DEVUELTO, fecha_devolucion_real=fecha)
+            )
+            if not actualizados:
+                return False
+
+            prestamo.libro.actualizar_stock(1)
+
+        prestamo.estado = Prestamo.DEVUELTO
+        prestamo.fecha_devolucion_real = fecha
+        return True
+
+    @classmethod
+    def prestar_lote(cls, libro_ids, usuario, fecha_devolucion_esperada, notas=''):
+        """
+        Prestar varios libros a un usuario con un número fijo de consultas:
+        un SELECT para validar, un UPDATE por cada cantidad distinta de
+        ejemplares pedidos (normalmente uno) y un bulk_create (más un
+        SELECT de los ids en los motores que no los devuelven, como MySQL).
+
+        Un mismo id puede repetirse para llevar varios ejemplares.
+        Devuelve una lista de (libro_id, prestamo o None, error o None)
+        en el mismo orden de la solicitud.
+        """
+        pedidos = Counter(libro_ids)
+
+        with transaction.atomic():
+            libros = (
+                Libro.objects.filter(activo=True)
+                .select_for_update()
+                .in_bulk(list(pedidos))
+            )
+
+            # Ejemplares que sí se pueden prestar de cada libro
+            aceptados = {}
+            for libro_id, cantidad in pedidos.items():
+                libro = libros.get(libro_id)
+                if libro is None:
+                    continue
+                disponibles = libro.stock if libro.estado == Libro.DISPONIBLE else 0
+                aceptados[libro_id] = min(cantidad, disponibles)
+
+            grupos = defaultdict(list)
+            for libro_id, cantidad in aceptados.items():
+                if cantidad:
+                    grupos[cantidad].append(libro_id)
+            for cantidad, ids in grupos.items():
+                actualizados = Libro.objects.ajustar_stock_grupo(
+                    ids, -cantidad, estricto=True
+                )
+                if actualizados != len(ids):
+                    raise ConflictoInventario()
+
+            resultados = []
+            nuevos = []
+            for libro_id in libro_ids:
+                if libro_id not in libros:
+                    resultados.append((libro_id, None, 'Libro no encontrado'))
+                elif not aceptados[libro_id]:
+                    resultados.append((libro_id, None, cls.NO_DISPONIBLE))
+                else:
+                    aceptados[libro_id] -= 1
+                    prestamo = Prestamo(
+                        libro=libros[libro_id],
+                        usuario=usuario,
+                        fecha_devolucion_esperada=fecha_devolucion_esperada,
+                        notas=notas,
+                    )
+                    nuevos.append(prestamo)
+                    resultados.append((libro_id, prestamo, None))
+
+            Prestamo.objects.bulk_create(nuevos)
+            if nuevos and nuevos[0].pk is None:
+                cls._asignar_ids(nuevos, usuario)
+
+        return resultados
+
+    @staticmethod
+    def _asignar_ids(nuevos, usuario):
+        """
+        Leer los ids que el bulk_create no devolvió, dentro de la misma
+        transacción. Los libros siguen bloqueados (select_for_update), así
+        que los últimos préstamos del usuario para esos libros son los
+        recién insertados, con ids crecientes en el orden del INSERT.
+        """
+        filas = list(
+            Prestamo.objects
+            .filter(usuario=usuario, libro_id__in={p.libro_id for p in nuevos})
+            .order_by('-pk')
+            .values_list('pk', 'libro_id')[:len(nuevos)]
+        )
+        filas.reverse()
+        if [libro_id for _, libro_id in filas] != [p.libro_id for p in nuevos]:
+            raise ConflictoInventario()
+        for prestamo, (pk, _) in zip(nuevos, filas):
+            prestamo.pk = pk
+
+    @classmethod
+    def devolver_lote(cls, prestamo_ids, queryset=None):
+        """
+        Devolver varios préstamos: un SELECT, un UPDATE de préstamos y un
+        UPDATE de stock por cada cantidad distinta de ejemplares devueltos.
+
+        Devuelve una lista de (prestamo_id, prestamo o None, error o None)
+        en el mismo orden de la solicitud.
+        """
+        if queryset is None:
+            queryset = Prestamo.objects.select_related('libro', 'usuario')
+        fecha = timezone.now()
+
+        with transaction.atomic():
+            prestamos = queryset.select_for_update().in_bulk(set(prestamo_ids))
+
+            resultados = []
+            devueltos = []
+            for prestamo_id in prestamo_ids:
+                prestamo = prestamos.get(prestamo_id)
+                if prestamo is None:
+                    resultados.append((prestamo_id, None, 'Préstamo no encontrado'))
+                elif prestamo.estado == Prestamo.DEVUELTO:
+                    resultados.append((prestamo_id, None, 'Este préstamo ya fue devuelto'))
+                else:
+                    prestamo.estado = Prestamo.DEVUELTO
+                    prestamo.fecha_devolucion_real = fecha
+                    devueltos.append(prestamo)
+                    resultados.append((prestamo_id, prestamo, None))
+
+            if devueltos:
+                actualizados = (
+                    Prestamo.objects
+                    .filter(pk__in=[p.pk for p in devueltos])
+                    .exclude(estado=Prestamo.DEVUELTO)
+                    .update(estado=Prestamo.DEVUELTO, fecha_devolucion_real=fecha)
+                )
+                if actualizados != len(devueltos):
+                    raise ConflictoInventario()
+
+            grupos = defaultdict(list)
+            for libro_id, cantidad in Counter(p.libro_id for p in devueltos).items():
+                grupos[cantidad].append(libro_id)
+            for cantidad, ids in grupos.items():
+                Libro.objects.ajustar_stock_grupo(ids, cantidad)
+
+        return resultados
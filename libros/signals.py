@@ -0,0 +1,94 @@
+"""
+Receptores de señales de los modelos de la biblioteca.
+Se conectan en LibrosConfig.ready().
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .autocompletado import indice as indice_autocompletado
+from .busqueda import obtener_backend
+from .cache_respuestas import invalidar
+from .models import Autor, Categoria, Libro, Prestamo
+from .notificaciones import stock_cambiado
+
+
+# ===== ÍNDICE DE BÚSQUEDA =====
+
+@receiver(post_save, sender=Libro)
+@receiver(post_save, sender=Autor)
+def indexar_para_busqueda(sender, instance, **kwargs):
+    obtener_backend().indexar(instance)
+
+
+@receiver(post_delete, sender=Libro)
+@receiver(post_delete, sender=Autor)
+def desindexar_de_busqueda(sender, instance, **kwargs):
+    obtener_backend().desindexar(sender, instance.pk)
+
+
+# ===== AUTOCOMPLETADO =====
+# El índice vive en memoria: solo se toca si la transacción se confirma
+
+@receiver(post_save, sender=Libro)
+def actualizar_autocompletado_libro(sender, instance, **kwargs):
+    transaction.on_commit(lambda: indice_autocompletado.actualizar_libro(instance))
+
+
+@receiver(post_delete, sender=Libro)
+def quitar_autocompletado_libro(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: indice_autocompletado.quitar_libro(pk))
+
+
+@receiver(post_save, sender=Autor)
+def actualizar_autocompletado_autor(sender, instance, **kwargs):
+    transaction.on_commit(lambda: indice_autocompletado.actualizar_autor(instance))
+
+
+@receiver(post_delete, sender=Autor)
+def quitar_autocompletado_autor(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: indice_autocompletado.quitar_autor(pk))
+
+
+# ===== CACHÉ DE RESPUESTAS =====
+# Los libros se serializan con el nombre del autor y de la categoría, y
+# los préstamos cambian su stock: todos invalidan los listados de libros
+
+NAMESPACES_AFECTADOS = {
+    Libro: ('libro',),
+    Autor: ('autor', 'libro'),
+    Categoria: ('categoria', 'libro'),
+    Prestamo: ('libro',),
+}
+
+
+@receiver(post_save, sender=Libro)
+@receiver(post_save, sender=Autor)
+@receiver(post_save, sender=Categoria)
+@receiver(post_save, sender=Prestamo)
+@receiver(post_delete, sender=Libro)
+@receiver(post_delete, sender=Autor)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Prestamo)
+def invalidar_respuestas(sender, **kwargs):
+    invalidar(*NAMESPACES_AFECTADOS[sender])
+
+
+# ===== NOTIFICACIONES DE STOCK =====
+
+@receiver(post_save, sender=Libro)
+def notificar_stock(sender, instance, created, **kwargs):
+    # Editar el título o el precio no cambia lo que ven los clientes
+    actual = (instance.stock, instance.estado)
+    anterior = getattr(instance, 'stock_guardado', None)
+    instance.stock_guardado = actual
+    if not created and anterior == actual:
+        return
+    stock_cambiado({instance.pk: {
+        'stock': instance.stock,
+        'estado': instance.estado,
+        'autor_id': instance.autor_id,
+        'categoria_id': instance.categoria_id,
+    }})
@@ -1,3 +1,2709 @@
-from django.test import TestCase
+"""
+Pruebas de la app libros
+Ejecutar con: python manage.py test libros --settings=biblioteca_project.settings_test
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.backends.utils import CursorWrapper
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import http_date
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from .busqueda import obtener_backend
+from .models import Autor, Categoria, Libro, MensajeChat, Prestamo
+
+
+def crear_libro(stock=5, **extra):
+    """Crear un libro mínimo para las pruebas"""
+    datos = {
+        'titulo': 'Ficciones',
+        'isbn': '9780802130303',
+        'stock': stock,
+        'precio': Decimal('220.00'),
+    }
+    datos.update(extra)
+    if 'autor' not in datos:
+        datos['autor'], _ = Autor.objects.get_or_create(
+            nombre='Jorge Luis', apellido='Borges'
+        )
+    return Libro.objects.create(**datos)
+
+
+# ===== STOCK =====
+
+class ActualizarStockTests(TestCase):
+    """Reglas de Libro.actualizar_stock"""
+
+    def test_restar_hasta_cero_marca_prestado(self):
+        libro = crear_libro(stock=1)
+        self.assertTrue(libro.actualizar_stock(-1))
+        self.assertEqual((libro.stock, libro.estado), (0, Libro.PRESTADO))
+        libro.refresh_from_db()
+        self.assertEqual((libro.stock, libro.estado), (0, Libro.PRESTADO))
+
+    def test_sumar_vuelve_a_disponible(self):
+        libro = crear_libro(stock=0, estado=Libro.PRESTADO)
+        self.assertTrue(libro.actualizar_stock(2))
+        libro.refresh_from_db()
+        self.assertEqual((libro.stock, libro.estado), (2, Libro.DISPONIBLE))
+
+    def test_sumar_conserva_mantenimiento(self):
+        libro = crear_libro(stock=1, estado=Libro.MANTENIMIENTO)
+        libro.actualizar_stock(3)
+        libro.refresh_from_db()
+        self.assertEqual((libro.stock, libro.estado), (4, Libro.MANTENIMIENTO))
+
+    def test_no_estricto_queda_en_cero(self):
+        libro = crear_libro(stock=3)
+        self.assertTrue(libro.actualizar_stock(-5))
+        libro.refresh_from_db()
+        self.assertEqual((libro.stock, libro.estado), (0, Libro.PRESTADO))
+
+    def test_estricto_no_presta_de_mas(self):
+        libro = crear_libro(stock=1)
+        self.assertFalse(libro.actualizar_stock(-2, estricto=True))
+        libro.refresh_from_db()
+        self.assertEqual(libro.stock, 1)
+
+    def test_un_solo_update_sin_select(self):
+        libro = crear_libro(stock=5)
+        with self.assertNumQueries(1):
+            libro.actualizar_stock(-1)
+        self.assertEqual(libro.stock, 4)
+
+
+class StockConcurrenteTests(TransactionTestCase):
+    """Prueba de estrés: préstamos y devoluciones desde varios hilos"""
+
+    HILOS = 8
+    OPERACIONES_POR_HILO = 250
+
+    def _en_hilos(self, trabajo):
+        errores = []
+
+        def ejecutar(indice):
+            try:
+                trabajo(indice)
+            except Exception as e:  # pragma: no cover - se reporta abajo
+                errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [
+            threading.Thread(target=ejecutar, args=(i,))
+            for i in range(self.HILOS)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+
+    def test_sin_actualizaciones_perdidas(self):
+        stock_inicial = 10
+        libro = crear_libro(stock=stock_inicial)
+        prestados = [0] * self.HILOS
+        devueltos = [0] * self.HILOS
+
+        def trabajo(indice):
+            en_mano = 0
+            for i in range(self.OPERACIONES_POR_HILO):
+                if en_mano and i % 2:
+                    Libro.objects.ajustar_stock(libro.pk, 1)
+                    en_mano -= 1
+                    devueltos[indice] += 1
+                elif Libro.objects.ajustar_stock(libro.pk, -1, estricto=True):
+                    en_mano += 1
+                    prestados[indice] += 1
+
+        self._en_hilos(trabajo)
+
+        libro.refresh_from_db()
+        esperado = stock_inicial - sum(prestados) + sum(devueltos)
+        self.assertGreaterEqual(esperado, 0)
+        self.assertEqual(libro.stock, esperado)
+        self.assertEqual(libro.estado == Libro.PRESTADO, libro.stock == 0)
+
+    def test_nunca_presta_de_mas(self):
+        stock_inicial = 100
+        libro = crear_libro(stock=stock_inicial)
+        prestados = [0] * self.HILOS
+
+        def trabajo(indice):
+            for _ in range(self.OPERACIONES_POR_HILO):
+                if Libro.objects.ajustar_stock(libro.pk, -1, estricto=True):
+                    prestados[indice] += 1
+
+        self._en_hilos(trabajo)
+
+        libro.refresh_from_db()
+        self.assertEqual(sum(prestados), stock_inicial)
+        self.assertEqual((libro.stock, libro.estado), (0, Libro.PRESTADO))
+
+
+# ===== PRÉSTAMOS =====
+
+class PrestamoServiceTests(TestCase):
+    """Creación y devolución de préstamos vía API"""
+
+    # Consultas SQL por préstamo (sin contar SAVEPOINT/RELEASE):
+    # antes: 4 -> SELECT libro + SELECT usuario + INSERT préstamo + UPDATE
+    # libro (save() de todas las columnas), sin protección entre validar
+    # y descontar.
+    # ahora: 3 -> SELECT libro + UPDATE condicional + INSERT, en una transacción.
+    CONSULTAS_POR_PRESTAMO = 3
+    CONSULTAS_POR_DEVOLUCION = 3  # SELECT préstamo + UPDATE préstamo + UPDATE libro
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('lector', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def _prestar(self, libro):
+        return self.client.post('/api/prestamos/', {
+            'libro': libro.pk,
+            'fecha_devolucion_esperada': '2030-01-01',
+        }, format='json')
+
+    def _consultas_sql(self, contexto):
+        return [
+            q['sql'] for q in contexto.captured_queries
+            if 'SAVEPOINT' not in q['sql']
+        ]
+
+    def test_presupuesto_de_consultas_por_prestamo(self):
+        libro = crear_libro(stock=2)
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self._prestar(libro)
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.assertEqual(
+            len(self._consultas_sql(contexto)), self.CONSULTAS_POR_PRESTAMO
+        )
+        libro.refresh_from_db()
+        self.assertEqual(libro.stock, 1)
+
+    def test_sin_ejemplares_no_crea_prestamo(self):
+        libro = crear_libro(stock=1)
+        self.assertEqual(self._prestar(libro).status_code, 201)
+        respuesta = self._prestar(libro)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('libro', respuesta.data)
+        self.assertEqual(Prestamo.objects.count(), 1)
+
+    def test_insert_fallido_revierte_reserva(self):
+        libro = crear_libro(stock=1)
+        with mock.patch.object(
+            serializers.ModelSerializer, 'save', side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self._prestar(libro)
+        libro.refresh_from_db()
+        self.assertEqual((libro.stock, libro.estado), (1, Libro.DISPONIBLE))
+
+    def test_devolver_repone_stock_una_sola_vez(self):
+        libro = crear_libro(stock=1)
+        prestamo_id = self._prestar(libro).data['id']
+        url = f'/api/prestamos/{prestamo_id}/devolver/'
+
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.post(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['estado'], 'devuelto')
+        self.assertEqual(
+            len(self._consultas_sql(contexto)), self.CONSULTAS_POR_DEVOLUCION
+        )
+
+        self.assertEqual(self.client.post(url).status_code, 400)
+        libro.refresh_from_db()
+        self.assertEqual((libro.stock, libro.estado), (1, Libro.DISPONIBLE))
+
+
+class PrestamoLoteTests(TestCase):
+    """POST /api/prestamos/bulk/ y /api/prestamos/bulk-devolver/"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('mostrador', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.autor = Autor.objects.create(nombre='Isabel', apellido='Allende')
+
+    def _crear_libros(self, cantidad, stock=1):
+        Libro.objects.bulk_create([
+            Libro(
+                titulo=f'Libro {i}', isbn=f'{9780000000000 + i}',
+                autor=self.autor, stock=stock, precio=Decimal('100.00'),
+            )
+            for i in range(cantidad)
+        ])
+        return list(Libro.objects.order_by('pk').values_list('pk', flat=True))
+
+    def _prestar_lote(self, ids):
+        return self.client.post('/api/prestamos/bulk/', {
+            'libros': ids,
+            'fecha_devolucion_esperada': '2030-01-01',
+        }, format='json')
+
+    def _consultas_lote(self, ids):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self._prestar_lote(ids)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['fallidos'], 0)
+        return len(contexto.captured_queries)
+
+    def test_numero_constante_de_consultas(self):
+        ids = self._crear_libros(110)
+        pocas = self._consultas_lote(ids[:10])
+        muchas = self._consultas_lote(ids[10:110])
+        self.assertEqual(pocas, muchas)
+        self.assertEqual(Prestamo.objects.count(), 110)
+        self.assertFalse(Libro.objects.filter(stock__gt=0).exists())
+
+    def test_resultado_por_libro(self):
+        disponible, agotado = self._crear_libros(2)
+        Libro.objects.filter(pk=agotado).update(stock=0, estado=Libro.PRESTADO)
+
+        respuesta = self._prestar_lote([disponible, agotado, 999999, disponible])
+
+        self.assertEqual(respuesta.data['exitosos'], 1)
+        self.assertEqual(
+            [item['ok'] for item in respuesta.data['resultados']],
+            [True, False, False, False],
+        )
+        prestamo = respuesta.data['resultados'][0]['prestamo']
+        self.assertEqual(prestamo['usuario'], self.usuario.pk)
+        self.assertEqual(Prestamo.objects.count(), 1)
+
+    def test_varios_ejemplares_del_mismo_libro(self):
+        libro_id, = self._crear_libros(1, stock=3)
+        respuesta = self._prestar_lote([libro_id] * 4)
+        self.assertEqual(respuesta.data['exitosos'], 3)
+        libro = Libro.objects.get(pk=libro_id)
+        self.assertEqual((libro.stock, libro.estado), (0, Libro.PRESTADO))
+
+    def test_ids_sin_returning_en_bulk_create(self):
+        # Como MySQL: el INSERT múltiple no devuelve los ids
+        ids = self._crear_libros(3)
+        features = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', False):
+            respuesta = self._prestar_lote([ids[0], ids[1], 999999, ids[2]])
+        self.assertEqual(respuesta.data['exitosos'], 3)
+        prestamos = [
+            item['prestamo'] for item in respuesta.data['resultados'] if item['ok']
+        ]
+        self.assertEqual(
+            [(p['id'], p['libro']) for p in prestamos],
+            list(Prestamo.objects.order_by('pk').values_list('pk', 'libro_id')),
+        )
+
+    def test_devolver_lote(self):
+        ids = self._crear_libros(3)
+        prestamos = [
+            item['prestamo']['id']
+            for item in self._prestar_lote(ids).data['resultados']
+        ]
+
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.post('/api/prestamos/bulk-devolver/', {
+                'prestamos': prestamos + [prestamos[0]],
+            }, format='json')
+        self.assertEqual(respuesta.data['exitosos'], 3)
+        self.assertFalse(respuesta.data['resultados'][-1]['ok'])
+        # SELECT + UPDATE préstamos + UPDATE stock (+ SAVEPOINT/RELEASE)
+        self.assertLessEqual(len(contexto.captured_queries), 5)
+
+        self.assertEqual(
+            Prestamo.objects.filter(estado=Prestamo.DEVUELTO).count(), 3
+        )
+        self.assertEqual(
+            Libro.objects.filter(stock=1, estado=Libro.DISPONIBLE).count(), 3
+        )
+
+
+# ===== CONSULTAS POR LISTADO =====
+
+class ConsultasConstantesMixin:
+    """
+    Verifica que un endpoint haga el mismo número de consultas sin
+    importar cuántas filas devuelva (detecta N+1).
+    """
+
+    def contar_consultas(self, metodo, url, **kwargs):
+        # Cada medición parte de la caché vacía (p. ej. estadísticas de búsqueda)
+        cache.clear()
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = getattr(self.client, metodo)(url, **kwargs)
+        self.assertLess(respuesta.status_code, 400, respuesta.content[:500])
+        return len(contexto.captured_queries), respuesta
+
+    def assertConsultasNoCrecen(self, url, sembrar, metodo='get', **kwargs):
+        """`sembrar(n)` agrega n filas más al resultado del endpoint"""
+        sembrar(1)
+        pocas, _ = self.contar_consultas(metodo, url, **kwargs)
+        sembrar(9)
+        muchas, respuesta = self.contar_consultas(metodo, url, **kwargs)
+        self.assertEqual(
+            pocas, muchas,
+            f'{url}: {pocas} consultas con 1 fila, {muchas} con 10'
+        )
+        return muchas, respuesta
+
+
+class ConteosAnotadosTests(ConsultasConstantesMixin, TestCase):
+    """total_libros de autores anotado en la consulta, sin consultas por fila"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.creados = 0
+
+    def _sembrar_autores(self, n):
+        for _ in range(n):
+            i = self.creados
+            self.creados += 1
+            autor = Autor.objects.create(nombre=f'Autor {i}', apellido='Prueba')
+            crear_libro(isbn=f'{9780000000000 + 2 * i}', autor=autor)
+            crear_libro(
+                isbn=f'{9780000000001 + 2 * i}', autor=autor, activo=False
+            )
+
+    def test_listado_de_autores(self):
+        consultas, respuesta = self.assertConsultasNoCrecen(
+            '/api/autores/', self._sembrar_autores
+        )
+        self.assertLessEqual(consultas, 2)  # COUNT de paginación + listado
+        self.assertEqual(
+            {a['total_libros'] for a in respuesta.data['results']}, {1}
+        )
+
+    def test_detalle_y_fallback_sin_anotacion(self):
+        from .serializers import AutorSerializer
+
+        self._sembrar_autores(1)
+        autor = Autor.objects.get()
+        self.assertEqual(AutorSerializer(autor).data['total_libros'], 1)
+        respuesta = self.client.get(f'/api/autores/{autor.pk}/')
+        self.assertEqual(respuesta.data['total_libros'], 1)
+
+
+# ===== REGRESIÓN DE CONSULTAS POR ENDPOINT =====
+
+# Multiplicador del volumen de datos sembrado en cada paso; subirlo hace
+# la prueba más lenta pero más sensible. Ej: ESCALA_PRUEBAS=20
+ESCALA = int(os.environ.get('ESCALA_PRUEBAS', '1'))
+
+
+def cargar_datos_base():
+    """Reusar los datos de populate_db.py (usuarios, autores, libros...)"""
+    import populate_db
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        populate_db.crear_usuarios()
+        populate_db.crear_autores()
+        populate_db.crear_categorias()
+        populate_db.crear_libros()
+        populate_db.crear_prestamos()
+
+
+class Catalogo:
+    """Genera libros, autores y préstamos sintéticos a demanda"""
+
+    def __init__(self):
+        self.creados = 0
+        self.categorias = list(Categoria.objects.all())
+        self.usuario = User.objects.get(username='juan_perez')
+
+    def libros(self, n, autor=None):
+        nuevos = []
+        for _ in range(n * ESCALA):
+            i = self.creados
+            self.creados += 1
+            nuevos.append(Libro(
+                titulo=f'Sintético {i}',
+                isbn=f'{9791000000000 + i}',
+                autor=autor or Autor.objects.create(
+                    nombre=f'Autor {i}', apellido='Sintético'
+                ),
+                categoria=self.categorias[i % len(self.categorias)],
+                stock=3,
+                precio=Decimal('99.90'),
+                creado_por=self.usuario,
+            ))
+        nuevos = Libro.objects.bulk_create(nuevos)
+        # bulk_create no dispara post_save: indexar para la búsqueda
+        for libro in nuevos:
+            obtener_backend().indexar(libro)
+        return nuevos
+
+    def prestamos(self, n):
+        return Prestamo.objects.bulk_create([
+            Prestamo(
+                libro=libro, usuario=self.usuario,
+                fecha_devolucion_esperada='2030-01-01',
+            )
+            for libro in self.libros(n)
+        ])
+
+
+class RegresionConsultasTests(ConsultasConstantesMixin, TestCase):
+    """
+    Cada endpoint de api_urls.py, /graphql/ y ws/ debe hacer un número
+    acotado de consultas que no crezca con el tamaño del resultado.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cargar_datos_base()
+
+    def setUp(self):
+        cache.clear()
+        self.catalogo = Catalogo()
+        self.admin = User.objects.get(username='admin')
+        self.client = APIClient()
+
+    def autenticar(self):
+        self.client.force_authenticate(self.admin)
+
+    def assertListado(self, url, maximo, sembrar=None):
+        """Listados: constantes al crecer el resultado y bajo un máximo"""
+        consultas, respuesta = self.assertConsultasNoCrecen(
+            url, sembrar or self.catalogo.libros
+        )
+        self.assertLessEqual(consultas, maximo, url)
+        return respuesta
+
+    def assertConsultas(self, metodo, url, maximo, **kwargs):
+        consultas, respuesta = self.contar_consultas(metodo, url, **kwargs)
+        self.assertLessEqual(consultas, maximo, url)
+        return respuesta
+
+    # ----- REST: catálogo -----
+
+    def test_libros(self):
+        self.assertListado('/api/libros/', 2)
+        # Búsqueda: 3 consultas al índice (términos, estadísticas, postings)
+        self.assertListado('/api/libros/?search=Sint', 5)
+        self.assertListado('/api/libros/?ordering=precio', 2)
+        self.assertListado('/api/libros/disponibles/', 1)
+        libro = Libro.objects.first()
+        self.assertConsultas('get', f'/api/libros/{libro.pk}/', 1)
+
+    def test_actualizar_stock(self):
+        self.autenticar()
+        libro = Libro.objects.first()
+        self.assertConsultas(
+            'post', f'/api/libros/{libro.pk}/actualizar_stock/', 2,
+            data={'cantidad': 2}, format='json',
+        )
+
+    def test_autores(self):
+        self.assertListado('/api/autores/', 2)
+        autor = Autor.objects.first()
+        self.assertListado(
+            f'/api/autores/{autor.pk}/libros/', 2,
+            sembrar=lambda n: self.catalogo.libros(n, autor=autor),
+        )
+        self.assertConsultas('get', f'/api/autores/{autor.pk}/', 1)
+
+    def test_categorias(self):
+        def sembrar(n):
+            Categoria.objects.bulk_create([
+                Categoria(nombre=f'Categoría {self.catalogo.creados}-{i}')
+                for i in range(n * ESCALA)
+            ])
+            self.catalogo.creados += 1
+
+        self.assertListado('/api/categorias/', 2, sembrar=sembrar)
+        categoria = Categoria.objects.first()
+        self.assertConsultas('get', f'/api/categorias/{categoria.pk}/', 1)
+
+    # ----- REST: préstamos -----
+
+    def test_prestamos(self):
+        self.autenticar()
+        self.assertListado('/api/prestamos/', 2, sembrar=self.catalogo.prestamos)
+        self.assertListado(
+            f'/api/prestamos/?usuario={self.catalogo.usuario.pk}', 3,
+            sembrar=self.catalogo.prestamos,
+        )
+        prestamo = Prestamo.objects.first()
+        self.assertConsultas('get', f'/api/prestamos/{prestamo.pk}/', 1)
+        self.assertConsultas('post', f'/api/prestamos/{prestamo.pk}/devolver/', 5)
+
+        libro = self.catalogo.libros(1)[0]
+        self.assertConsultas('post', '/api/prestamos/', 5, data={
+            'libro': libro.pk, 'fecha_devolucion_esperada': '2030-01-01',
+        }, format='json')
+
+    def test_prestamos_en_lote(self):
+        self.autenticar()
+        for n in (1, 10):
+            ids = [libro.pk for libro in self.catalogo.libros(n)]
+            respuesta = self.assertConsultas('post', '/api/prestamos/bulk/', 6, data={
+                'libros': ids, 'fecha_devolucion_esperada': '2030-01-01',
+            }, format='json')
+            prestamos = [r['prestamo']['id'] for r in respuesta.data['resultados']]
+            self.assertConsultas(
+                'post', '/api/prestamos/bulk-devolver/', 5,
+                data={'prestamos': prestamos}, format='json',
+            )
+
+    # ----- REST: otras rutas -----
+
+    def test_rutas_sin_listado(self):
+        self.autenticar()
+        self.assertConsultas('get', '/api/intensiva/', 0)
+
+        datos_google = {'titulo': 'Ficciones', 'isbn_13': '9780802130303'}
+        with mock.patch(
+            'libros.api_views.GoogleBooksAPI.buscar_libro', return_value=datos_google
+        ):
+            self.assertConsultas('post', '/api/importar-libro/', 0,
+                                 data={'isbn': '9780802130303'}, format='json')
+
+        self.client.force_authenticate(None)
+        self.assertConsultas('get', '/api/auth/google/redirect/', 0)
+        self.assertConsultas('get', '/api/auth/google/callback/', 0)
+
+    def test_jwt(self):
+        respuesta = self.assertConsultas('post', '/api/auth/jwt/login/', 3, data={
+            'username': 'admin', 'password': 'admin123',
+        }, format='json')
+        self.assertConsultas('post', '/api/token/verify/', 0,
+                             data={'token': respuesta.data['access']}, format='json')
+        self.assertConsultas('post', '/api/token/refresh/', 1,
+                             data={'refresh': respuesta.data['refresh']}, format='json')
+
+    # ----- GraphQL -----
+
+    def assertGraphQL(self, consulta, maximo, sembrar=None, variables=None):
+        datos = {'query': consulta, 'variables': variables or {}}
+        sembrar = sembrar or self.catalogo.libros
+        consultas, respuesta = self.assertConsultasNoCrecen(
+            '/graphql/', sembrar, metodo='post', data=datos, format='json'
+        )
+        self.assertNotIn('errors', respuesta.json(), consulta)
+        self.assertLessEqual(consultas, maximo, consulta)
+        return respuesta.json()['data']
+
+    LIBRO_CAMPOS = '''
+        id titulo stock estaDisponible
+        autor { id nombre }
+        categoria { nombre }
+    '''
+
+    def test_graphql_listados(self):
+        pagina = 'edges { cursor node { %s } } pageInfo { hasNextPage endCursor }'
+        libros = pagina % self.LIBRO_CAMPOS
+        self.assertGraphQL('{ allLibros(first: 10) { %s } }' % libros, 1)
+        self.assertGraphQL('{ librosDisponibles(first: 10) { %s } }' % libros, 1)
+        self.assertGraphQL(
+            '{ buscarLibros(titulo: "sint", first: 10) { %s } }' % libros, 4
+        )
+        self.assertGraphQL(
+            '{ allAutores(first: 10) { %s } }' % (pagina % 'id nombre apellido'), 1
+        )
+        self.assertGraphQL('{ allCategorias { id nombre } }', 1)
+
+        autor = Autor.objects.first()
+        self.assertGraphQL(
+            'query($id: Int!) { librosPorAutor(autorId: $id) { %s } }'
+            % self.LIBRO_CAMPOS, 1,
+            sembrar=lambda n: self.catalogo.libros(n, autor=autor),
+            variables={'id': autor.pk},
+        )
+
+    def test_graphql_detalle_y_mutacion(self):
+        libro = Libro.objects.first()
+        self.assertConsultas('post', '/graphql/', 1, data={
+            'query': '{ libro(id: %d) { %s } }' % (libro.pk, self.LIBRO_CAMPOS),
+        }, format='json')
+        respuesta = self.assertConsultas('post', '/graphql/', 5, data={
+            'query': '''mutation {
+                actualizarStockLibro(libroId: %d, cantidad: 1) {
+                    mensaje libro { id stock }
+                }
+            }''' % libro.pk,
+        }, format='json')
+        self.assertNotIn('errors', respuesta.json())
+
+
+@contextlib.contextmanager
+def consultas_en_todos_los_hilos():
+    """SQL de cualquier hilo: los consumers consultan desde el pool de conexiones.py"""
+    consultas = []
+    original = CursorWrapper._execute
+
+    def registrar(self, sql, params, *args):
+        consultas.append(sql)
+        return original(self, sql, params, *args)
+
+    with mock.patch.object(CursorWrapper, '_execute', registrar):
+        yield consultas
+
+
+class RegresionConsultasWebSocketTests(TransactionTestCase):
+    """
+    Consumers de ws/: database_sync_to_async cierra conexiones viejas,
+    por eso no pueden correr dentro de la transacción de TestCase.
+    """
+
+    def setUp(self):
+        cargar_datos_base()
+
+    def tearDown(self):
+        from .chat import almacen
+        almacen.olvidar()
+
+    def test_websocket_notificaciones(self):
+        libro = Libro.objects.first()
+
+        async def sesion():
+            from channels.routing import URLRouter
+            from channels.testing import WebsocketCommunicator
+            from .routing import websocket_urlpatterns
+
+            ws = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), '/ws/notificaciones/'
+            )
+            conectado, _ = await ws.connect()
+            self.assertTrue(conectado)
+            await ws.receive_json_from()
+            await ws.send_json_to({'type': 'libro_update', 'libro_id': libro.pk})
+            mensaje = await ws.receive_json_from()
+            await ws.disconnect()
+            return mensaje
+
+        with consultas_en_todos_los_hilos() as consultas:
+            mensaje = async_to_sync(sesion)()
+        self.assertEqual(mensaje['libro']['id'], libro.pk)
+        self.assertLessEqual(len(consultas), 1)
+
+    def test_websocket_chat(self):
+        async def sesion():
+            from channels.routing import URLRouter
+            from channels.testing import WebsocketCommunicator
+            from .routing import websocket_urlpatterns
+
+            ws = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns), '/ws/chat/general/'
+            )
+            await ws.connect()
+            await ws.receive_json_from()
+            await ws.receive_json_from()
+            await ws.send_json_to({'message': 'hola', 'username': 'ana'})
+            mensaje = await ws.receive_json_from()
+            await ws.disconnect()
+            return mensaje
+
+        with consultas_en_todos_los_hilos() as consultas:
+            mensaje = async_to_sync(sesion)()
+        self.assertEqual(mensaje['message'], 'hola')
+        # Solo la carga del historial de la sala; los mensajes se guardan en lote
+        self.assertEqual(len(consultas), 1)
+
+
+# ===== GRAPHQL: DATALOADERS =====
+
+class DataLoaderTests(TestCase):
+    """Una consulta por nivel de relación sin importar el número de filas"""
+
+    CONSULTA_ANIDADA = '''{
+        allLibros { edges { node {
+            titulo
+            creadoPor { username }
+            categoria { nombre libros { titulo } }
+            autor {
+                nombre
+                libros {
+                    titulo
+                    categoria { nombre }
+                    prestamos { estado libro { titulo autor { apellido } } }
+                }
+            }
+        } } }
+    }'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cargar_datos_base()
+
+    def setUp(self):
+        cache.clear()
+        self.catalogo = Catalogo()
+
+    def _ejecutar(self, consulta):
+        from types import SimpleNamespace
+        from .schema import schema
+
+        with CaptureQueriesContext(connection) as contexto:
+            resultado = schema.execute(consulta, context_value=SimpleNamespace())
+        self.assertIsNone(resultado.errors)
+        return len(contexto.captured_queries), resultado.data
+
+    def test_consulta_anidada_no_crece(self):
+        pocas, _ = self._ejecutar(self.CONSULTA_ANIDADA)
+        self.catalogo.prestamos(20)
+        muchas, datos = self._ejecutar(self.CONSULTA_ANIDADA)
+        self.assertEqual(pocas, muchas)
+        # libros + libros por categoría + libros por autor + préstamos
+        self.assertEqual(muchas, 4)
+        self.assertEqual(
+            len(datos['allLibros']['edges']), Libro.objects.filter(activo=True).count()
+        )
+
+    def test_mismo_resultado_sin_cargadores(self):
+        from .schema import schema
+
+        _, con_cargadores = self._ejecutar(self.CONSULTA_ANIDADA)
+        sin_cargadores = schema.execute(self.CONSULTA_ANIDADA).data
+        self.assertEqual(con_cargadores, sin_cargadores)
+
+    def test_aload_agrupa_llaves_del_mismo_ciclo(self):
+        import asyncio
+        from .loaders import DataLoader
+
+        lotes = []
+
+        def cargar_lote(llaves):
+            lotes.append(sorted(llaves))
+            return {llave: llave * 10 for llave in llaves}
+
+        cargador = DataLoader(cargar_lote)
+
+        async def cargar():
+            return await asyncio.gather(*(cargador.aload(i) for i in (1, 2, 3, 2)))
+
+        self.assertEqual(async_to_sync(cargar)(), [10, 20, 30, 20])
+        self.assertEqual(lotes, [[1, 2, 3]])
+        self.assertEqual(cargador.load(3), 30)
+        self.assertEqual(len(lotes), 1)
+
+
+class ConexionesGraphQLTests(TestCase):
+    """Paginación por cursor de allLibros, allAutores, librosDisponibles y buscarLibros"""
+
+    CONSULTA = '''query($first: Int, $after: String) {
+        allLibros(first: $first, after: $after) {
+            %s
+            pageInfo { hasNextPage hasPreviousPage endCursor }
+            edges { cursor node { id } }
+        }
+    }'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cargar_datos_base()
+        Catalogo().libros(25)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _pagina(self, first=None, after=None, total=False):
+        consulta = self.CONSULTA % ('totalCount' if total else '')
+        respuesta = self.client.post('/graphql/', {
+            'query': consulta, 'variables': {'first': first, 'after': after},
+        }, format='json')
+        return respuesta.json()
+
+    def test_recorrer_todas_las_paginas(self):
+        vistos = []
+        cursor = None
+        while True:
+            pagina = self._pagina(first=7, after=cursor)['data']['allLibros']
+            vistos += [edge['node']['id'] for edge in pagina['edges']]
+            self.assertEqual(pagina['pageInfo']['hasPreviousPage'], cursor is not None)
+            if not pagina['pageInfo']['hasNextPage']:
+                break
+            cursor = pagina['pageInfo']['endCursor']
+
+        esperados = [
+            str(pk) for pk in Libro.objects.filter(activo=True)
+            .order_by('-fecha_creacion', '-id').values_list('pk', flat=True)
+        ]
+        self.assertEqual(vistos, esperados)
+
+    def test_pagina_profunda_sin_offset_ni_count(self):
+        primera = self._pagina(first=20)['data']['allLibros']
+        with CaptureQueriesContext(connection) as contexto:
+            self._pagina(first=5, after=primera['pageInfo']['endCursor'])
+        self.assertEqual(len(contexto.captured_queries), 1)
+        sql = contexto.captured_queries[0]['sql'].upper()
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_total_count_solo_si_se_pide(self):
+        with CaptureQueriesContext(connection) as contexto:
+            datos = self._pagina(first=5, total=True)['data']['allLibros']
+        self.assertEqual(datos['totalCount'], Libro.objects.filter(activo=True).count())
+        self.assertEqual(len(contexto.captured_queries), 2)
+
+    def test_limite_del_servidor(self):
+        from graphene_django.settings import graphene_settings
+
+        maximo = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        self.assertIn('errors', self._pagina(first=maximo + 1))
+        self.assertNotIn('errors', self._pagina(first=maximo))
+        self.assertIn('errors', self._pagina(first=5, after='no-es-un-cursor'))
+
+    def test_otras_conexiones(self):
+        for campo, argumentos in (
+            ('allAutores', '(first: 3)'),
+            ('librosDisponibles', '(first: 3)'),
+            ('buscarLibros', '(titulo: "sint", first: 3)'),
+        ):
+            respuesta = self.client.post('/graphql/', {
+                'query': '{ %s%s { totalCount pageInfo { hasNextPage } edges { node { id } } } }'
+                % (campo, argumentos),
+            }, format='json').json()
+            self.assertNotIn('errors', respuesta, campo)
+            self.assertEqual(len(respuesta['data'][campo]['edges']), 3, campo)
+            self.assertTrue(respuesta['data'][campo]['pageInfo']['hasNextPage'], campo)
+
+
+# ===== GRAPHQL: COSTO Y PROFUNDIDAD =====
+
+@override_settings(GRAPHQL_COSTO={'PROFUNDIDAD_MAXIMA': 6, 'COSTO_MAXIMO': 500, 'TAMANO_LISTA': 10})
+class CostoGraphQLTests(TestCase):
+    """Las consultas se rechazan antes de ejecutarse si exceden los límites"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cargar_datos_base()
+        Catalogo().libros(5)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _consultar(self, consulta, variables=None):
+        return self.client.post('/graphql/', {
+            'query': consulta, 'variables': variables or {},
+        }, format='json')
+
+    def test_costo_en_extensions(self):
+        respuesta = self._consultar('{ allLibros(first: 5) { edges { node { titulo autor { nombre } } } } }')
+        datos = respuesta.json()
+        self.assertNotIn('errors', datos)
+        # allLibros 1 + 5 x (edge 1 + node 1 + autor 1)
+        self.assertEqual(datos['extensions']['costo']['costo'], 1 + 5 * 3)
+        self.assertEqual(datos['extensions']['costo']['profundidad'], 5)
+
+    def test_first_por_variable(self):
+        consulta = 'query($n: Int) { allLibros(first: $n) { edges { node { id } } } }'
+        costo = self._consultar(consulta, {'n': 3}).json()['extensions']['costo']
+        self.assertEqual(costo['costo'], 1 + 3 * 2)
+
+    def test_consulta_profunda_rechazada_sin_consultas(self):
+        consulta = '''{ allAutores(first: 1) { edges { node {
+            libros { autor { libros { autor { nombre } } } }
+        } } } }'''
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self._consultar(consulta)
+        self.assertEqual(respuesta.status_code, 400)
+        errores = respuesta.json()['errors']
+        self.assertEqual(errores[0]['extensions']['code'], 'PROFUNDIDAD_EXCEDIDA')
+        self.assertEqual(len(contexto.captured_queries), 0)
+
+    def test_consulta_costosa_rechazada(self):
+        consulta = '''{ allLibros(first: 100) { edges { node {
+            prestamos { libro { titulo } }
+        } } } }'''
+        respuesta = self._consultar(consulta)
+        self.assertEqual(respuesta.status_code, 400)
+        codigos = [error['extensions']['code'] for error in respuesta.json()['errors']]
+        self.assertEqual(codigos, ['COSTO_EXCEDIDO'])
+
+    def test_fragmentos_cuentan(self):
+        directa = self._consultar(
+            '{ allLibros(first: 4) { edges { node { autor { nombre } } } } }'
+        ).json()['extensions']['costo']
+        con_fragmento = self._consultar('''
+            fragment F on LibroType { autor { nombre } }
+            { allLibros(first: 4) { edges { node { ...F } } } }
+        ''').json()['extensions']['costo']
+        self.assertEqual(directa, con_fragmento)
+
+    def test_introspeccion_no_se_bloquea(self):
+        from graphql import get_introspection_query
+
+        respuesta = self._consultar(get_introspection_query())
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn('errors', respuesta.json())
+
+
+# ===== GRAPHQL: CONSULTAS PERSISTIDAS =====
+
+class ConsultasPersistidasTests(TestCase):
+    """APQ por POST y GET, caché de documentos y modo lista permitida"""
+
+    CONSULTA = '{ allLibros(first: 2) { edges { node { titulo } } } }'
+
+    @classmethod
+    def setUpTestData(cls):
+        cargar_datos_base()
+        Catalogo().libros(3)
+
+    def setUp(self):
+        from .graphql_persistidas import documentos, hash_consulta
+
+        cache.clear()
+        documentos.limpiar()
+        self.documentos = documentos
+        self.hash = hash_consulta(self.CONSULTA)
+        self.client = APIClient()
+
+    def _extension(self, llave=None):
+        return {'persistedQuery': {'version': 1, 'sha256Hash': llave or self.hash}}
+
+    def _post(self, **datos):
+        return self.client.post('/graphql/', datos, format='json').json()
+
+    def test_registro_y_uso_por_hash(self):
+        respuesta = self._post(extensions=self._extension())
+        self.assertEqual(respuesta['errors'][0]['message'], 'PersistedQueryNotFound')
+
+        registrada = self._post(query=self.CONSULTA, extensions=self._extension())
+        self.assertNotIn('errors', registrada)
+
+        por_hash = self._post(extensions=self._extension())
+        self.assertEqual(por_hash['data'], registrada['data'])
+
+    def test_hash_que_no_corresponde(self):
+        respuesta = self._post(query=self.CONSULTA, extensions=self._extension('0' * 64))
+        self.assertEqual(respuesta['errors'][0]['extensions']['code'], 'BAD_REQUEST')
+
+    def test_get_con_hash_es_cacheable(self):
+        self._post(query=self.CONSULTA, extensions=self._extension())
+        parametros = {'extensions': json.dumps(self._extension())}
+        with self.settings(GRAPHQL_APQ={'MAX_AGE_GET': 60}):
+            respuesta = self.client.get('/graphql/', parametros, HTTP_ACCEPT='application/json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('max-age=60', respuesta['Cache-Control'])
+        self.assertEqual(len(respuesta.json()['data']['allLibros']['edges']), 2)
+
+    def test_documento_se_parsea_una_vez(self):
+        for _ in range(3):
+            self.assertNotIn('errors', self._post(query=self.CONSULTA))
+        self.assertEqual((self.documentos.fallos, self.documentos.aciertos), (1, 2))
+
+    def test_consultas_invalidas_no_entran_al_cache(self):
+        for _ in range(2):
+            self.assertIn('errors', self._post(query='{ noExiste }'))
+        self.assertEqual(len(self.documentos.documentos), 0)
+
+    def test_solo_registradas(self):
+        with self.settings(GRAPHQL_APQ={
+            'SOLO_REGISTRADAS': True,
+            'CONSULTAS_REGISTRADAS': {self.hash: self.CONSULTA},
+        }):
+            self.assertNotIn('errors', self._post(extensions=self._extension()))
+            for respuesta in (
+                self._post(query=self.CONSULTA),
+                self._post(extensions=self._extension('f' * 64)),
+            ):
+                self.assertEqual(
+                    respuesta['errors'][0]['extensions']['code'],
+                    'PERSISTED_QUERY_NOT_ALLOWED',
+                )
+
+    def test_manifiesto_del_proyecto(self):
+        from django.conf import settings
+        from .graphql_persistidas import hash_consulta
+
+        with open(settings.BASE_DIR / 'graphql_consultas.json', encoding='utf-8') as archivo:
+            consultas = json.load(archivo)
+        consulta = next(texto for texto in consultas.values() if 'allCategorias' in texto)
+        with self.settings(GRAPHQL_APQ={
+            'SOLO_REGISTRADAS': True,
+            'CONSULTAS_REGISTRADAS': settings.BASE_DIR / 'graphql_consultas.json',
+        }):
+            respuesta = self._post(extensions=self._extension(hash_consulta(consulta)))
+        self.assertNotIn('errors', respuesta)
+        self.assertTrue(respuesta['data']['allCategorias'])
+
+    def test_manifiesto_faltante_o_invalido(self):
+        import tempfile
+        from django.core.exceptions import ImproperlyConfigured
+        from .graphql_persistidas import verificar_configuracion
+
+        with tempfile.TemporaryDirectory() as directorio:
+            invalido = os.path.join(directorio, 'invalido.json')
+            with open(invalido, 'w', encoding='utf-8') as archivo:
+                archivo.write('["no es un dict"]')
+            for ruta in (os.path.join(directorio, 'no_existe.json'), invalido):
+                with self.subTest(ruta=ruta), self.settings(GRAPHQL_APQ={
+                    'SOLO_REGISTRADAS': True, 'CONSULTAS_REGISTRADAS': ruta,
+                }):
+                    with self.assertRaisesMessage(ImproperlyConfigured, ruta):
+                        verificar_configuracion()
+        # Sin el modo activo no se lee
+        with self.settings(GRAPHQL_APQ={'CONSULTAS_REGISTRADAS': '/no/existe.json'}):
+            verificar_configuracion()
+
+
+# ===== REST: PAGINACIÓN POR CURSOR =====
+
+class PaginacionCursorRestTests(TestCase):
+    """/api/libros/ y /api/prestamos/ paginan por llave, sin OFFSET"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cargar_datos_base()
+        cls.catalogo = Catalogo()
+        cls.catalogo.libros(23)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def _recorrer(self, url, atras=False):
+        vistos = []
+        while url:
+            datos = self.client.get(url).json()
+            vistos += [fila['id'] for fila in datos['results']]
+            url = datos['previous'] if atras else datos['next']
+        return vistos
+
+    def test_recorrer_hacia_adelante_y_atras(self):
+        vistos = self._recorrer('/api/libros/?page_size=7')
+        esperados = list(
+            Libro.objects.filter(activo=True)
+            .order_by('-fecha_creacion', '-id').values_list('pk', flat=True)
+        )
+        self.assertEqual(vistos, esperados)
+
+        # Desde la última página hasta la primera con `previous`
+        url = '/api/libros/?page_size=7'
+        while True:
+            datos = self.client.get(url).json()
+            if not datos['next']:
+                break
+            url = datos['next']
+        ultima = [fila['id'] for fila in datos['results']]
+        anteriores = self._recorrer(datos['previous'], atras=True)
+        self.assertEqual(len(anteriores) + len(ultima), len(esperados))
+        self.assertEqual(set(anteriores) | set(ultima), set(esperados))
+
+    def test_pagina_profunda_sin_offset_y_sin_count(self):
+        datos = self.client.get('/api/libros/?page_size=20&count=false').json()
+        self.assertNotIn('count', datos)
+        self.assertIn('count=false', datos['next'])
+        with CaptureQueriesContext(connection) as contexto:
+            self.client.get(datos['next'])
+        self.assertEqual(len(contexto.captured_queries), 1)
+        sql = contexto.captured_queries[0]['sql'].upper()
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_tamano_de_pagina_acotado(self):
+        datos = self.client.get('/api/libros/?page_size=1000').json()
+        self.assertEqual(datos['count'], Libro.objects.filter(activo=True).count())
+        self.assertLessEqual(len(datos['results']), 100)
+        self.assertEqual(len(self.client.get('/api/libros/?page_size=3').json()['results']), 3)
+
+    def test_ordenamiento_del_cliente(self):
+        vistos = self._recorrer('/api/libros/?ordering=precio&page_size=4')
+        esperados = list(
+            Libro.objects.filter(activo=True)
+            .order_by('precio', 'id').values_list('pk', flat=True)
+        )
+        self.assertEqual(vistos, esperados)
+
+    def test_respaldo_por_numero_de_pagina(self):
+        # ?page= y órdenes sobre columnas NULL siguen con PageNumberPagination
+        datos = self.client.get('/api/libros/?page=2').json()
+        self.assertIn('count', datos)
+        self.assertIn('page=3', datos['next'])
+        datos = self.client.get('/api/libros/?ordering=fecha_publicacion').json()
+        self.assertIn('page=2', datos['next'])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get('/api/libros/?cursor=xyz').status_code, 404)
+
+    def test_prestamos(self):
+        self.catalogo.prestamos(12)
+        self.client.force_authenticate(User.objects.get(username='admin'))
+        vistos = self._recorrer('/api/prestamos/?page_size=5')
+        esperados = list(
+            Prestamo.objects.order_by('-fecha_prestamo', '-id').values_list('pk', flat=True)
+        )
+        self.assertEqual(vistos, esperados)
+
+
+# ===== BÚSQUEDA =====
+
+class BusquedaTests(TestCase):
+    """Índice invertido: normalización, prefijos, BM25 y mantenimiento incremental"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = Autor.objects.create(nombre='Gabriel', apellido='García Márquez')
+        cls.soledad = crear_libro(
+            titulo='Cien años de soledad', isbn='9780307474728', autor=cls.autor,
+            descripcion='La historia de la familia Buendía en Macondo.',
+        )
+        cls.coronel = crear_libro(
+            titulo='El coronel no tiene quien le escriba', isbn='9780060751562',
+            autor=cls.autor, descripcion='Un coronel espera su pensión; soledad y dignidad.',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def ids(self, texto, modelo=Libro):
+        from .busqueda import buscar
+
+        return [pk for pk, _ in buscar(modelo, texto)]
+
+    def test_acentos_y_mayusculas(self):
+        self.assertEqual(self.ids('CIEN AÑOS'), [self.soledad.pk])
+        self.assertEqual(self.ids('anos'), [self.soledad.pk])
+        self.assertEqual(self.ids('buendia'), [self.soledad.pk])
+
+    def test_prefijo_en_el_ultimo_termino(self):
+        self.assertEqual(self.ids('cien a'), [self.soledad.pk])
+        self.assertEqual(self.ids('coro'), [self.coronel.pk])
+        self.assertEqual(self.ids('97803074'), [self.soledad.pk])
+        # Solo el último término es prefijo
+        self.assertEqual(self.ids('cie soledad'), [])
+
+    def test_todos_los_terminos_y_stopwords(self):
+        self.assertEqual(self.ids('soledad macondo'), [self.soledad.pk])
+        self.assertEqual(self.ids('el de la soledad'), self.ids('soledad'))
+        self.assertEqual(self.ids('la'), [])
+
+    def test_ranking_bm25_prefiere_el_titulo(self):
+        # 'soledad' está en el título de uno y en la descripción del otro
+        self.assertEqual(self.ids('soledad'), [self.soledad.pk, self.coronel.pk])
+
+    def test_mantenimiento_incremental(self):
+        libro = crear_libro(titulo='Memoria de mis putas tristes', autor=self.autor)
+        self.assertEqual(self.ids('tristes'), [libro.pk])
+
+        libro.titulo = 'Del amor y otros demonios'
+        libro.save()
+        self.assertEqual(self.ids('tristes'), [])
+        self.assertEqual(self.ids('demonios'), [libro.pk])
+
+        # Guardar sin cambiar el texto no reescribe el índice
+        with CaptureQueriesContext(connection) as contexto:
+            obtener_backend().indexar(libro)
+        self.assertEqual(len(contexto.captured_queries), 1)
+
+        libro.delete()
+        self.assertEqual(self.ids('demonios'), [])
+
+    def test_autores(self):
+        self.assertEqual(self.ids('garcia marq', Autor), [self.autor.pk])
+
+    def test_reconstruir(self):
+        Libro.objects.filter(pk=self.soledad.pk).update(titulo='Crónica de una muerte anunciada')
+        self.assertEqual(self.ids('cronica'), [])
+        obtener_backend().reconstruir(Libro)
+        self.assertEqual(self.ids('cronica'), [self.soledad.pk])
+        self.assertEqual(self.ids('coronel'), [self.coronel.pk])
+
+    def sembrar(self, titulos, activo=True):
+        Libro.objects.bulk_create([
+            Libro(
+                titulo=titulo, isbn=f'{9790000000000 + i}', autor=self.autor,
+                stock=1, precio=Decimal('100.00'), activo=activo,
+            )
+            for i, titulo in enumerate(titulos)
+        ])
+        obtener_backend().reconstruir(Libro)
+
+    def test_filtros_de_la_vista_antes_de_limitar(self):
+        # Más de LIMITE_RESULTADOS inactivos, todos más relevantes
+        self.sembrar(['Soledad, soledad, soledad'] * 510, activo=False)
+        datos = self.client.get('/api/libros/?search=soledad').json()
+        self.assertEqual(datos['count'], 2)
+        self.assertEqual(
+            [fila['id'] for fila in datos['results']], [self.soledad.pk, self.coronel.pk]
+        )
+
+    def test_prefijo_con_todas_sus_expansiones(self):
+        self.sembrar([f'Zafiro{i:02d}' for i in range(60)])
+        self.assertEqual(len(self.ids('zafiro')), 60)
+        datos = self.client.get('/api/libros/?search=zafi&page_size=1').json()
+        self.assertEqual(datos['count'], 60)
+
+    def test_api_rest_ordena_por_relevancia(self):
+        datos = self.client.get('/api/libros/?search=soledad').json()
+        self.assertEqual(
+            [fila['id'] for fila in datos['results']], [self.soledad.pk, self.coronel.pk]
+        )
+        datos = self.client.get('/api/libros/?search=soledad&ordering=-titulo').json()
+        self.assertEqual(
+            [fila['id'] for fila in datos['results']], [self.coronel.pk, self.soledad.pk]
+        )
+        datos = self.client.get('/api/autores/?search=gabri').json()
+        self.assertEqual([fila['id'] for fila in datos['results']], [self.autor.pk])
+
+    def test_graphql(self):
+        respuesta = self.client.post('/graphql/', {
+            'query': '{ buscarLibros(titulo: "anos sole", first: 5) { edges { node { id } } } }',
+        }, format='json').json()
+        self.assertEqual(
+            [e['node']['id'] for e in respuesta['data']['buscarLibros']['edges']],
+            [str(self.soledad.pk)],
+        )
+
+
+# ===== AUTOCOMPLETADO =====
+
+class AutocompletadoTests(TestCase):
+    """/api/libros/autocomplete/ desde el índice de prefijos en memoria"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.autor = Autor.objects.create(nombre='Gabriel', apellido='García Márquez')
+        cls.soledad = crear_libro(
+            titulo='Cien años de soledad', isbn='9780307474728', autor=cls.autor,
+        )
+        cls.cronica = crear_libro(
+            titulo='Crónica de una muerte anunciada', isbn='9780307475350', autor=cls.autor,
+        )
+        cls.ficciones = crear_libro()
+
+    def setUp(self):
+        from .autocompletado import indice
+
+        cache.clear()
+        indice.cargado = False
+        indice.reconstruccion = None
+        self.indice = indice
+        self.client = APIClient()
+
+    def ids(self, q, **params):
+        respuesta = self.client.get('/api/libros/autocomplete/', {'q': q, **params})
+        self.assertEqual(respuesta.status_code, 200)
+        return [fila['id'] for fila in respuesta.json()]
+
+    def test_prefijos_de_titulo_autor_e_isbn(self):
+        self.assertEqual(self.ids('CRÓN'), [self.cronica.pk])
+        self.assertEqual(self.ids('cien anos'), [self.soledad.pk])
+        self.assertEqual(self.ids('garcia marq'), [self.soledad.pk, self.cronica.pk])
+        self.assertEqual(self.ids('gabriel g'), [self.soledad.pk, self.cronica.pk])
+        self.assertEqual(self.ids('97803074747'), [self.soledad.pk])
+        self.assertEqual(self.ids('zzz'), [])
+        self.assertEqual(self.ids(''), [])
+        self.assertEqual(len(self.ids('9780', limite=2)), 2)
+        # Límite fuera de rango o no numérico: el mínimo o el valor por defecto
+        self.assertEqual(len(self.ids('9780', limite=0)), 1)
+        self.assertEqual(len(self.ids('9780', limite=-5)), 1)
+        self.assertEqual(len(self.ids('9780', limite='muchos')), 3)
+        self.assertEqual(self.indice.buscar('9780', limite=0), [])
+
+    def test_respuesta_compacta_y_sin_consultas(self):
+        self.ids('c')
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get('/api/libros/autocomplete/', {'q': 'cien'})
+        self.assertEqual(len(contexto.captured_queries), 0)
+        self.assertEqual(respuesta.json(), [{
+            'id': self.soledad.pk, 'titulo': 'Cien años de soledad',
+            'autor': 'Gabriel García Márquez',
+        }])
+
+    def test_signals_mantienen_el_indice(self):
+        self.ids('c')
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo = crear_libro(titulo='El otoño del patriarca', isbn='9780060882860',
+                                autor=self.autor)
+        self.assertEqual(self.ids('el otono'), [nuevo.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            nuevo.titulo = 'Del amor y otros demonios'
+            nuevo.save()
+        self.assertEqual(self.ids('el otono'), [])
+        self.assertEqual(self.ids('del amor'), [nuevo.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.soledad.activo = False
+            self.soledad.save()
+            nuevo.delete()
+        self.assertEqual(self.ids('del amor'), [])
+        self.assertEqual(self.ids('cien'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.autor.apellido = 'Márquez'
+            self.autor.save()
+        self.assertEqual(self.ids('marquez'), [self.cronica.pk])
+        self.assertEqual(self.ids('crónica')[0], self.cronica.pk)
+
+    def test_cambios_de_otro_proceso(self):
+        from .autocompletado import IndicePrefijos
+
+        self.ids('c')
+        # Otro proceso guardó un libro y publicó el cambio
+        self.ficciones.titulo = 'El Aleph'
+        IndicePrefijos().actualizar_libro(self.ficciones)
+        self.assertEqual(self.ids('el aleph'), [])  # aún no toca revisar
+        self.indice.revisado = 0
+        with CaptureQueriesContext(connection) as contexto:
+            self.assertEqual(self.ids('el aleph'), [self.ficciones.pk])
+        self.assertEqual(len(contexto), 0)
+        self.assertIsNone(self.indice.reconstruccion)
+
+    def test_cambio_perdido_reconstruye_en_segundo_plano(self):
+        from .autocompletado import LLAVE_VERSION, IndicePrefijos
+
+        self.ids('c')
+        # Otro proceso incrementó la versión pero su cambio ya no está
+        cache.add(LLAVE_VERSION, 0, None)
+        cache.incr(LLAVE_VERSION)
+        self.indice.revisado = 0
+        self.assertEqual(self.ids('cien'), [self.soledad.pk])
+        self.assertIsNone(self.indice.reconstruccion)  # puede llegar todavía
+
+        leida = threading.Event()
+        seguir = threading.Event()
+
+        def cargar_de_bd(nuevo):
+            nuevo.cargar([(self.ficciones.pk, 'El Aleph', self.ficciones.isbn,
+                           self.ficciones.autor_id)], [])
+            nuevo.version = cache.get(LLAVE_VERSION)
+            leida.set()
+            seguir.wait(5)
+
+        with mock.patch.object(IndicePrefijos, 'cargar_de_bd', autospec=True,
+                               side_effect=cargar_de_bd):
+            self.indice.revisado = 0
+            self.assertEqual(self.ids('cien'), [self.soledad.pk])
+            hilo = self.indice.reconstruccion
+            self.assertTrue(leida.wait(5))
+            # El índice anterior responde mientras se construye el nuevo
+            self.assertEqual(self.ids('cien'), [self.soledad.pk])
+            seguir.set()
+            hilo.join(5)
+        self.assertEqual(self.ids('cien'), [])
+        self.assertEqual(self.ids('el aleph'), [self.ficciones.pk])
+
+    def test_claves_ordenadas_con_cambios_pendientes(self):
+        from . import autocompletado
+
+        pares = {(f'clave {i % 50:02d}', i) for i in range(200)}
+        claves = autocompletado.ClavesOrdenadas(pares)
+        with mock.patch.object(autocompletado, 'MAX_PENDIENTES', 16):
+            for i in range(0, 200, 3):
+                claves.quitar(f'clave {i % 50:02d}', i)
+                pares.discard((f'clave {i % 50:02d}', i))
+            for i in range(200, 260):
+                claves.agregar(f'clave {i % 70:02d}', i)
+                pares.add((f'clave {i % 70:02d}', i))
+            claves.agregar('clave 03', 3)
+            pares.add(('clave 03', 3))
+            for prefijo in ('', 'clave 0', 'clave 3', 'clave 65', 'otra'):
+                with self.subTest(prefijo=prefijo):
+                    self.assertEqual(
+                        list(claves.prefijo(prefijo)),
+                        [pk for clave, pk in sorted(pares) if clave.startswith(prefijo)],
+                    )
+
+
+# ===== CACHÉ DE RESPUESTAS =====
+
+class CacheRespuestasTests(TestCase):
+    """Listados del catálogo servidos desde caché e invalidados por señales"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Novela')
+        cls.libro = crear_libro(categoria=cls.categoria)
+
+    def setUp(self):
+        from .cache_respuestas import metricas
+
+        cache.clear()
+        metricas.reiniciar()
+        self.metricas = metricas
+        self.client = APIClient()
+
+    def get(self, url, **params):
+        respuesta = self.client.get(url, params)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta
+
+    def test_acierto_sin_consultas(self):
+        for url in (
+            '/api/libros/', '/api/libros/disponibles/', '/api/categorias/',
+            f'/api/categorias/{self.categoria.pk}/',
+            f'/api/autores/{self.libro.autor_id}/libros/',
+        ):
+            with self.subTest(url=url):
+                primera = self.get(url)
+                self.assertEqual(primera['X-Cache'], 'MISS')
+                with CaptureQueriesContext(connection) as contexto:
+                    segunda = self.get(url)
+                self.assertEqual(segunda['X-Cache'], 'HIT')
+                self.assertEqual(len(contexto), 0)
+                self.assertEqual(segunda.json(), primera.json())
+
+    def test_llave_normaliza_el_orden_de_los_parametros(self):
+        self.get('/api/libros/', estado='disponible', autor=self.libro.autor_id)
+        respuesta = self.client.get(
+            f'/api/libros/?autor={self.libro.autor_id}&estado=disponible'
+        )
+        self.assertEqual(respuesta['X-Cache'], 'HIT')
+        self.assertEqual(self.get('/api/libros/', estado='prestado')['X-Cache'], 'MISS')
+
+    def test_invalidacion_al_guardar(self):
+        self.get('/api/libros/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.libro.titulo = 'El Aleph'
+            self.libro.save()
+        respuesta = self.get('/api/libros/')
+        self.assertEqual(respuesta['X-Cache'], 'MISS')
+        self.assertEqual(respuesta.json()['results'][0]['titulo'], 'El Aleph')
+
+        # El nombre de la categoría aparece en los libros
+        self.get('/api/categorias/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.categoria.nombre = 'Cuento'
+            self.categoria.save()
+        self.assertEqual(self.get('/api/categorias/')['X-Cache'], 'MISS')
+        self.assertEqual(self.get('/api/libros/')['X-Cache'], 'MISS')
+
+    def test_invalidacion_por_ajuste_de_stock(self):
+        self.assertEqual(len(self.get('/api/libros/disponibles/').json()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Libro.objects.ajustar_stock(self.libro.pk, -self.libro.stock)
+        self.assertEqual(self.get('/api/libros/disponibles/').json(), [])
+
+        # Sin commit la versión no cambia
+        self.get('/api/libros/disponibles/')
+        Libro.objects.ajustar_stock_grupo([self.libro.pk], 3)
+        self.assertEqual(self.get('/api/libros/disponibles/')['X-Cache'], 'HIT')
+
+    def test_metricas_de_aciertos(self):
+        from .cache_respuestas import respuesta_cacheada
+
+        eventos = []
+
+        def registrar(sender, vista, acierto, **kwargs):
+            eventos.append((vista, acierto))
+
+        respuesta_cacheada.connect(registrar)
+        self.addCleanup(respuesta_cacheada.disconnect, registrar)
+
+        for _ in range(4):
+            self.get('/api/libros/')
+        self.get('/api/categorias/')
+
+        self.assertEqual(eventos[:2], [('LibroViewSet.list', False), ('LibroViewSet.list', True)])
+        self.assertEqual(self.metricas.resumen(), {
+            'CategoriaViewSet.list': {'aciertos': 0, 'fallos': 1, 'tasa_aciertos': 0.0},
+            'LibroViewSet.list': {'aciertos': 3, 'fallos': 1, 'tasa_aciertos': 0.75},
+        })
+
+
+# ===== GET CONDICIONAL =====
+
+class GetCondicionalTests(TestCase):
+    """ETag / Last-Modified y respuestas 304 en el catálogo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categoria = Categoria.objects.create(nombre='Novela')
+        cls.libro = crear_libro(categoria=cls.categoria)
+        cls.autor = cls.libro.autor
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get(self, url, **encabezados):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = self.client.get(url, **encabezados)
+        respuesta.consultas = len(contexto)
+        return respuesta
+
+    def assertNoModificado(self, url, etag, consultas):
+        cache.clear()
+        respuesta = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304, url)
+        self.assertEqual(respuesta['ETag'], etag)
+        self.assertEqual(respuesta.content, b'')
+        self.assertLessEqual(respuesta.consultas, consultas, url)
+
+    def test_detalle_etag_fuerte(self):
+        url = f'/api/libros/{self.libro.pk}/'
+        respuesta = self.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        self.assertIn('Last-Modified', respuesta)
+        self.assertNoModificado(url, etag, consultas=1)
+
+        respuesta = self.get(url, HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified'])
+        self.assertEqual(respuesta.status_code, 304)
+
+        # El nombre del autor se serializa con el libro
+        self.autor.apellido = 'Acevedo'
+        self.autor.save()
+        respuesta = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+        self.assertEqual(self.get('/api/libros/0/', HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+    def test_listado_etag_debil(self):
+        url = '/api/libros/?ordering=precio'
+        respuesta = self.get(url)
+        etag = respuesta['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        # El agregado reemplaza al COUNT(*) del paginador
+        self.assertEqual(respuesta.consultas, 2)
+        self.assertEqual(respuesta.json()['count'], 1)
+        self.assertNoModificado(url, etag, consultas=1)
+
+        # Otros parámetros, otra versión
+        self.assertNotEqual(self.get('/api/libros/?ordering=-precio')['ETag'], etag)
+
+        Libro.objects.ajustar_stock(self.libro.pk, -1)
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_listado_cambia_al_borrar(self):
+        otro = crear_libro(titulo='El Aleph', isbn='9780142437889', autor=self.autor)
+        respuesta = self.get('/api/libros/')
+        etag = respuesta['ETag']
+        # Borrar no mueve MAX(fecha_actualizacion): el listado no da fecha
+        self.assertNotIn('Last-Modified', respuesta)
+        Libro.objects.filter(pk=otro.pk).delete()
+        cache.clear()
+        self.assertEqual(self.get('/api/libros/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        respuesta = self.get('/api/libros/', HTTP_IF_MODIFIED_SINCE=http_date(time.time()))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['count'], 1)
+
+    def test_autor_depende_de_sus_libros(self):
+        for url in ('/api/autores/', f'/api/autores/{self.autor.pk}/'):
+            with self.subTest(url=url):
+                etag = self.get(url)['ETag']
+                self.assertNoModificado(url, etag, consultas=1)
+                Libro.objects.filter(pk=self.libro.pk).update(activo=False)
+                self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+                Libro.objects.filter(pk=self.libro.pk).update(activo=True)
+
+    def test_categorias_y_cache_de_respuestas(self):
+        url = f'/api/categorias/{self.categoria.pk}/'
+        etag = self.get(url)['ETag']
+        # Acierto en la caché de respuestas: el 304 sale sin consultas
+        respuesta = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta['X-Cache'], 'HIT')
+        self.assertEqual(respuesta.consultas, 0)
+
+        self.categoria.nombre = 'Cuento'
+        self.categoria.save()
+        cache.clear()
+        respuesta = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+
+# ===== RÉPLICAS DE LECTURA =====
+
+@override_settings(REPLICAS={'ALIAS': ['replica']}, CACHE_RESPUESTAS={'ACTIVO': False})
+class ReplicasTests(TransactionTestCase):
+    """
+    ReplicaRouter con una réplica que nunca se sincroniza: cada base tiene
+    su propio nombre para la categoría y así se ve de dónde se leyó
+    """
+
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        from . import routers
+
+        self.routers = routers
+        self.categoria = Categoria.objects.create(nombre='Primaria')
+        Categoria.objects.using('replica').create(pk=self.categoria.pk, nombre='Réplica')
+        self.usuario = User.objects.create_user('lector', password='x')
+        self.client = APIClient()
+
+    def nombre(self, **extra):
+        respuesta = self.client.get(f'/api/categorias/{self.categoria.pk}/', **extra)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()['nombre']
+
+    def test_lecturas_del_catalogo_en_la_replica(self):
+        self.assertEqual(self.nombre(), 'Réplica')
+        self.assertEqual(Categoria.objects.get(pk=self.categoria.pk).nombre, 'Réplica')
+
+    def test_leer_lo_escrito_tras_escribir(self):
+        self.client.force_authenticate(self.usuario)
+        respuesta = self.client.patch(
+            f'/api/categorias/{self.categoria.pk}/', {'nombre': 'Editada'}, format='json'
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['nombre'], 'Editada')
+        cookie = respuesta.cookies['fijar_primaria']
+        self.assertEqual(cookie['max-age'], 5)
+        self.assertTrue(cookie['httponly'])
+
+        # APIClient reenvía la cookie: la siguiente lectura va a la primaria
+        self.assertEqual(self.nombre(), 'Editada')
+        self.client.cookies.clear()
+        self.assertEqual(self.nombre(), 'Réplica')
+
+    def test_sin_escrituras_no_hay_cookie(self):
+        respuesta = self.client.get('/api/categorias/')
+        self.assertNotIn('fijar_primaria', respuesta.cookies)
+
+    def test_primaria_fuera_del_catalogo_y_en_transacciones(self):
+        router = self.routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Categoria), 'replica')
+        self.assertEqual(router.db_for_read(Prestamo), 'default')
+        self.assertEqual(router.db_for_read(User), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Libro), 'default')
+        with self.routers.leer_de_primaria():
+            self.assertEqual(Categoria.objects.get(pk=self.categoria.pk).nombre, 'Primaria')
+
+    def test_escribir_fija_el_alcance(self):
+        with self.routers.alcance() as alcance:
+            self.assertEqual(Categoria.objects.get(pk=self.categoria.pk).nombre, 'Réplica')
+            Categoria.objects.create(nombre='Cuento')
+            self.assertTrue(alcance.escribio)
+            self.assertEqual(Categoria.objects.get(pk=self.categoria.pk).nombre, 'Primaria')
+        self.assertFalse(Categoria.objects.using('replica').filter(nombre='Cuento').exists())
+
+    def test_ajustar_stock_fuera_de_una_peticion(self):
+        libro = crear_libro(stock=3)
+        libro.autor.save(using='replica')
+        libro.save(using='replica')
+        # Sin alcance ni transacción: las lecturas irían a la réplica
+        self.assertEqual(Libro.objects.ajustar_stock(libro.pk, -1), (2, Libro.DISPONIBLE))
+        self.assertTrue(libro.actualizar_stock(-1))
+        self.assertEqual(Libro.objects.using('default').get(pk=libro.pk).stock, 1)
+        self.assertEqual(Libro.objects.using('replica').get(pk=libro.pk).stock, 3)
+
+    def test_cache_se_llena_desde_la_primaria(self):
+        with self.settings(CACHE_RESPUESTAS={'ACTIVO': True}):
+            cache.clear()
+            self.assertEqual(self.nombre(), 'Primaria')
+            self.assertEqual(self.nombre(), 'Primaria')
+
+    def test_sin_replicas_no_enruta(self):
+        with self.settings(REPLICAS={'ALIAS': []}):
+            self.assertIsNone(self.routers.ReplicaRouter().db_for_read(Categoria))
+            self.client.force_authenticate(self.usuario)
+            respuesta = self.client.post('/api/categorias/', {'nombre': 'Ensayo'}, format='json')
+            self.assertEqual(respuesta.status_code, 201)
+            self.assertNotIn('fijar_primaria', respuesta.cookies)
+
+
+# ===== CONEXIONES =====
+
+@override_settings(CONEXIONES_DB={'HILOS': 3}, CACHE_RESPUESTAS={'ACTIVO': False})
+class ConexionesTests(TransactionTestCase):
+    """Conexiones que abre el pool de conexiones.py bajo carga concurrente"""
+
+    def setUp(self):
+        from . import conexiones
+
+        self.conexiones = conexiones
+        conexiones.cerrar()
+        self.addCleanup(conexiones.cerrar)
+        cache.clear()
+        self.categoria = Categoria.objects.create(nombre='Novela')
+        conexiones.metricas.reiniciar()
+
+    def configurar(self, **valores):
+        """CONN_MAX_AGE y CONN_HEALTH_CHECKS de las conexiones que se abran"""
+        parche = mock.patch.dict(connections.settings['default'], valores)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def cargar(self, llamadas):
+        """Llamadas concurrentes como las de los consumers; hilos usados"""
+        @self.conexiones.database_sync_to_async
+        def consultar():
+            Categoria.objects.filter(pk=self.categoria.pk).exists()
+            return threading.current_thread().name
+
+        async def carga():
+            return await asyncio.gather(*(consultar() for _ in range(llamadas)))
+
+        return set(async_to_sync(carga)())
+
+    def aperturas(self):
+        return self.conexiones.metricas.resumen()['aperturas'].get('default', 0)
+
+    def test_pool_acotado_con_conexiones_persistentes(self):
+        self.configurar(CONN_MAX_AGE=60)
+        self.assertLessEqual(len(self.cargar(50)), 3)
+        self.assertLessEqual(self.aperturas(), 3)
+        # La segunda ráfaga reusa las mismas conexiones
+        self.cargar(50)
+        self.assertLessEqual(self.aperturas(), 3)
+
+    def test_sin_conexiones_persistentes_una_por_llamada(self):
+        self.configurar(CONN_MAX_AGE=0)
+        self.cargar(50)
+        self.assertEqual(self.aperturas(), 50)
+
+    @override_settings(CONEXIONES_DB={'HILOS': 1})
+    def test_health_check_reemplaza_la_conexion_rota(self):
+        self.configurar(CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True)
+        self.cargar(5)
+        self.assertEqual(self.aperturas(), 1)
+        with mock.patch.object(type(connections['default']), 'is_usable', return_value=False):
+            self.cargar(3)
+        self.assertEqual(self.aperturas(), 4)
+
+    def test_peticiones_http_en_el_pool(self):
+        from channels.testing import HttpCommunicator
+
+        self.configurar(CONN_MAX_AGE=60)
+        aplicacion = self.conexiones.ASGIHandlerConPool()
+
+        async def carga():
+            peticiones = [
+                HttpCommunicator(
+                    aplicacion, 'GET', f'/api/categorias/{self.categoria.pk}/',
+                    headers=[(b'host', b'testserver')],
+                )
+                for _ in range(20)
+            ]
+            respuestas = await asyncio.gather(*(p.get_response(timeout=5) for p in peticiones))
+            for peticion in peticiones:
+                await peticion.send_input({'type': 'http.disconnect'})
+                await peticion.wait(timeout=5)
+            return respuestas
+
+        respuestas = async_to_sync(carga)()
+        self.assertEqual({r['status'] for r in respuestas}, {200})
+        self.assertEqual(json.loads(respuestas[0]['body'])['nombre'], 'Novela')
+        resumen = self.conexiones.metricas.resumen()
+        self.assertEqual(resumen['peticiones'], 20)
+        self.assertLessEqual(resumen['aperturas']['default'], 3)
+        self.assertLessEqual(resumen['maximo_por_peticion'], 1)
+
+
+# ===== LÍMITES DE PETICIONES =====
+
+class LimitesTests(TestCase):
+    """GCRA del RateLimitMiddleware: ventana deslizante, políticas y encabezados"""
+
+    POLITICAS = [
+        {'ruta': '/api/auth/', 'limite': 2, 'periodo': 60, 'por': 'ip'},
+        {'ruta': '/api/', 'limite': 3, 'periodo': 60, 'por': 'usuario'},
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_ventana_deslizante(self):
+        from .limites import MotorLocal, Politica
+
+        ahora = [1000.0]
+        motor = MotorLocal(cache, reloj=lambda: ahora[0])
+        politica = Politica('/api/', limite=4, periodo=60)
+
+        restantes = [motor.consumir('k', politica).restantes for _ in range(4)]
+        self.assertEqual(restantes, [3, 2, 1, 0])
+        rechazo = motor.consumir('k', politica)
+        self.assertFalse(rechazo.permitido)
+        self.assertEqual(rechazo.encabezados()['Retry-After'], '15')
+        self.assertEqual(rechazo.encabezados()['RateLimit-Reset'], '60')
+
+        # Un cliente constante recupera cupo al pasar el intervalo
+        ahora[0] += 15
+        self.assertTrue(motor.consumir('k', politica).permitido)
+        self.assertFalse(motor.consumir('k', politica).permitido)
+        ahora[0] += 60
+        self.assertEqual(motor.consumir('k', politica).restantes, 3)
+
+    def assertExactoEnParalelo(self, motor, hilos=16, intentos=25, limite=100):
+        from .limites import Politica
+
+        politica = Politica('/api/', limite=limite, periodo=3600)
+        permitidos = []
+        barrera = threading.Barrier(hilos)
+
+        def trabajador():
+            barrera.wait()
+            permitidos.append(sum(
+                motor.consumir('paralelo', politica).permitido for _ in range(intentos)
+            ))
+
+        trabajadores = [threading.Thread(target=trabajador) for _ in range(hilos)]
+        for hilo in trabajadores:
+            hilo.start()
+        for hilo in trabajadores:
+            hilo.join()
+        self.assertEqual(sum(permitidos), limite)
+
+    def test_exacto_en_paralelo_local(self):
+        from .limites import MotorLocal
+
+        self.assertExactoEnParalelo(MotorLocal(cache))
+
+    def test_exacto_en_paralelo_redis(self):
+        from django.core.cache.backends.redis import RedisCache
+        from .limites import MotorRedis
+
+        url = os.environ.get('REDIS_URL')
+        if not url:
+            self.skipTest('REDIS_URL no configurado')
+        redis_cache = RedisCache(url, {'KEY_PREFIX': f'pruebas-{os.getpid()}'})
+        redis_cache.delete('paralelo')
+        self.addCleanup(redis_cache.delete, 'paralelo')
+        self.assertExactoEnParalelo(MotorRedis(redis_cache))
+
+    @override_settings(RATE_LIMIT={'POLITICAS': POLITICAS})
+    def test_middleware_encabezados_y_429(self):
+        for restantes in ('2', '1', '0'):
+            respuesta = self.client.get('/api/categorias/')
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertEqual(respuesta['RateLimit-Remaining'], restantes)
+            self.assertEqual(respuesta['RateLimit-Policy'], '3;w=60')
+
+        respuesta = self.client.get('/api/categorias/')
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta['Retry-After'], '20')
+        self.assertEqual(respuesta['RateLimit-Remaining'], '0')
+
+        # Otra ruta, otra política; fuera de /api/ no hay límite
+        self.assertEqual(self.client.get('/api/auth/jwt/login/')['RateLimit-Limit'], '2')
+        self.assertNotIn('RateLimit-Limit', self.client.get('/graphql/?query={__typename}'))
+
+    @override_settings(RATE_LIMIT={'POLITICAS': POLITICAS})
+    def test_middleware_por_usuario(self):
+        for _ in range(3):
+            self.client.get('/api/categorias/')
+        self.assertEqual(self.client.get('/api/categorias/').status_code, 429)
+
+        # Con sesión cuenta el usuario, no la IP compartida
+        usuario = User.objects.create_user('lector', password='x')
+        self.client.force_login(usuario)
+        self.assertEqual(self.client.get('/api/categorias/').status_code, 200)
+        # En /api/auth/ se cuenta por IP aunque haya sesión
+        self.client.get('/api/auth/jwt/login/')
+        self.client.get('/api/auth/jwt/login/')
+        self.assertEqual(self.client.get('/api/auth/jwt/login/').status_code, 429)
+
+
+# ===== THROTTLES =====
+
+class ThrottlesTests(TestCase):
+    """Ventanas de contadores evaluadas en lote para todos los scopes"""
+
+    TASAS = {'burst': '3/min', 'sustained': '5/day', 'premium': '2/min'}
+
+    def setUp(self):
+        from rest_framework.throttling import SimpleRateThrottle
+
+        cache.clear()
+        parche = mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', self.TASAS)
+        parche.start()
+        self.addCleanup(parche.stop)
+        # Inicio exacto de una ventana de un minuto
+        self.ahora = 6_000_000.0
+        parche = mock.patch.object(SimpleRateThrottle, 'timer', lambda _: self.ahora)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.usuario = User.objects.create_user('lector', password='x')
+
+    def vista(self, *clases):
+        from rest_framework.response import Response
+        from rest_framework.views import APIView
+
+        class Vista(APIView):
+            throttle_classes = clases
+            permission_classes = []
+
+            def get(self, request):
+                return Response({'ok': True})
+
+        return Vista.as_view()
+
+    def pedir(self, vista, usuario=None):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+
+        request = APIRequestFactory().get('/x/')
+        force_authenticate(request, usuario or self.usuario)
+        return vista(request)
+
+    def test_rafaga_y_rechazos_sin_costo(self):
+        from .throttles import BurstRateThrottle, SustainedRateThrottle
+
+        vista = self.vista(BurstRateThrottle, SustainedRateThrottle)
+        self.assertEqual([self.pedir(vista).status_code for _ in range(4)], [200, 200, 200, 429])
+        respuesta = self.pedir(vista)
+        self.assertEqual(respuesta.status_code, 429)
+        # Fin de esta ventana + lo que tarda la anterior en pesar 2/3
+        self.assertEqual(respuesta['Retry-After'], '80')
+
+        # Los rechazos no gastaron cupo del límite diario
+        self.ahora += 120
+        self.assertEqual([self.pedir(vista).status_code for _ in range(3)], [200, 200, 429])
+
+    def test_ventana_deslizante(self):
+        from .throttles import BurstRateThrottle
+
+        vista = self.vista(BurstRateThrottle)
+        for _ in range(3):
+            self.pedir(vista)
+        # A mitad de la siguiente ventana la anterior pesa 1.5: cabe una
+        self.ahora += 90
+        self.assertEqual(self.pedir(vista).status_code, 200)
+        self.assertEqual(self.pedir(vista).status_code, 429)
+
+    def test_un_solo_conteo_por_peticion(self):
+        from .throttles import BurstRateThrottle, ContadorCache, SustainedRateThrottle
+
+        with mock.patch.object(ContadorCache, 'contar', autospec=True,
+                               side_effect=ContadorCache.contar) as contar:
+            self.pedir(self.vista(BurstRateThrottle, SustainedRateThrottle))
+        self.assertEqual(contar.call_count, 1)
+        ventanas = contar.call_args.args[1]
+        self.assertEqual(len(ventanas), 2)
+        # Un entero por ventana, no una lista de marcas de tiempo
+        self.assertEqual(cache.get(ventanas[0].actual), 1)
+
+    def test_premium_sin_limite(self):
+        from .throttles import PremiumUserThrottle
+
+        vista = self.vista(PremiumUserThrottle)
+        self.usuario.is_premium = True
+        self.assertTrue(all(self.pedir(vista).status_code == 200 for _ in range(5)))
+        self.usuario.is_premium = False
+        self.assertEqual([self.pedir(vista).status_code for _ in range(3)], [200, 200, 429])
+
+
+# ===== CAPA DE CANALES =====
+
+class CapaCompartida(InMemoryChannelLayer):
+    """
+    Sustituto en proceso de RedisChannelLayer para las pruebas: cada
+    instancia hace de un proceso Daphne distinto, pero todas comparten
+    canales y grupos como si usaran el mismo Redis. Los mensajes pasan
+    por msgpack igual que en channels_redis.
+    """
+
+    def __init__(self, compartido, **config):
+        super().__init__(**config)
+        self.channels = compartido.setdefault('canales', {})
+        self.groups = compartido.setdefault('grupos', {})
+
+    async def send(self, channel, message):
+        message = msgpack.unpackb(msgpack.packb(message, use_bin_type=True), raw=False)
+        await super().send(channel, message)
+
+
+class CapaCanalesTests(TestCase):
+    """Configuración de la capa Redis y reparto entre varios workers"""
+
+    def config(self, alias='default'):
+        from django.conf import settings
+
+        return {k: v for k, v in settings.CAPAS_CANALES[alias].items() if k != 'prefix'}
+
+    def test_configuracion_redis_repartida(self):
+        from channels_redis.core import RedisChannelLayer
+        from django.conf import settings
+
+        hosts = ['redis://redis-a:6379/0', 'redis://redis-b:6379/0']
+        for alias, capa in settings.CAPAS_CANALES.items():
+            with self.subTest(alias=alias):
+                layer = RedisChannelLayer(hosts=hosts, **capa)
+                self.assertEqual(layer.ring_size, 2)
+                self.assertEqual(layer.capacity, capa['capacity'])
+                # Los grupos se reparten entre ambos hosts
+                indices = {layer.consistent_hash(f'libro_{i}') for i in range(50)}
+                self.assertEqual(indices, {0, 1})
+                mensaje = {'type': 'libro_actualizado', 'libro': {'id': 1, 'stock': 3}}
+                self.assertEqual(layer.deserialize(layer.serialize(mensaje)), mensaje)
+
+        self.assertNotEqual(
+            settings.CAPAS_CANALES['default']['prefix'], settings.CAPAS_CANALES['chat']['prefix']
+        )
+
+    def test_difusion_entre_workers(self):
+        from channels.layers import channel_layers
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .routing import websocket_urlpatterns
+
+        compartido = {}
+        workers = [CapaCompartida(compartido, **self.config()) for _ in range(3)]
+        publicador = CapaCompartida(compartido, **self.config())
+        self.addCleanup(channel_layers.backends.pop, 'default', None)
+
+        async def sesion():
+            clientes = []
+            for capa in workers:
+                # Cada consumer toma la capa de "su" proceso al conectarse
+                channel_layers.backends['default'] = capa
+                for _ in range(2):
+                    ws = WebsocketCommunicator(
+                        URLRouter(websocket_urlpatterns), '/ws/notificaciones/'
+                    )
+                    conectado, _ = await ws.connect()
+                    self.assertTrue(conectado)
+                    await ws.receive_json_from()
+                    clientes.append(ws)
+
+            await publicador.group_send('notificaciones', {
+                'type': 'libro_actualizado',
+                'libro': {'id': 7, 'stock': 2, 'disponible': True},
+            })
+            recibidos = [await ws.receive_json_from() for ws in clientes]
+
+            # Lo que no se puede serializar en msgpack no sale de Python
+            with self.assertRaises(TypeError):
+                await publicador.group_send('notificaciones', {
+                    'type': 'libro_actualizado', 'libro': {'precio': Decimal('1.00')},
+                })
+            for ws in clientes:
+                await ws.disconnect()
+            return recibidos
+
+        recibidos = async_to_sync(sesion)()
+        self.assertEqual(len(recibidos), 6)
+        self.assertTrue(all(m['libro']['id'] == 7 for m in recibidos))
+        self.assertNotIn('notificaciones', compartido['grupos'])
+
+
+# ===== NOTIFICACIONES DE STOCK =====
+
+@override_settings(NOTIFICACIONES_STOCK={'VENTANA': 0})
+class NotificacionesStockTests(TransactionTestCase):
+    """Deltas de stock publicados por el servidor al confirmar cambios"""
+
+    def setUp(self):
+        self.libro = crear_libro(stock=3)
+        self.otro = crear_libro(titulo='El Aleph', isbn='9780142437889', stock=2)
+
+    async def conectar(self):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .routing import websocket_urlpatterns
+
+        ws = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/notificaciones/')
+        await ws.connect()
+        await ws.receive_json_from()
+        return ws
+
+    def test_delta_sin_consultas_por_cliente(self):
+        from channels.db import database_sync_to_async
+
+        async def sesion():
+            clientes = [await self.conectar() for _ in range(3)]
+            await database_sync_to_async(Libro.objects.ajustar_stock)(self.libro.pk, -3)
+            mensajes = [await ws.receive_json_from() for ws in clientes]
+            for ws in clientes:
+                await ws.disconnect()
+            return mensajes
+
+        with CaptureQueriesContext(connection) as contexto:
+            mensajes = async_to_sync(sesion)()
+        esperado = {'type': 'libro_actualizado', 'libro': {
+            'id': self.libro.pk, 'stock': 0, 'disponible': False,
+            'autor': self.libro.autor_id, 'categoria': None,
+        }}
+        self.assertEqual(mensajes, [esperado] * 3)
+        # Solo el UPDATE ... RETURNING, que ya trae autor y categoría
+        self.assertEqual(len(contexto), 1)
+
+    def test_sin_aviso_si_se_revierte(self):
+        from channels.db import database_sync_to_async
+        from django.db import transaction
+
+        def revertido():
+            with contextlib.suppress(RuntimeError), transaction.atomic():
+                Libro.objects.ajustar_stock(self.libro.pk, -1)
+                raise RuntimeError
+
+        async def sesion():
+            ws = await self.conectar()
+            await database_sync_to_async(revertido)()
+            nada = await ws.receive_nothing(timeout=0.2)
+            await ws.disconnect()
+            return nada
+
+        self.assertTrue(async_to_sync(sesion)())
+
+    # Ventana holgada: los siete cambios deben caer en la misma
+    @override_settings(NOTIFICACIONES_STOCK={'VENTANA': 0.5})
+    def test_cambios_agrupados_por_libro(self):
+        from channels.db import database_sync_to_async
+
+        def cambios():
+            for _ in range(5):
+                Libro.objects.ajustar_stock(self.libro.pk, 1)
+            Libro.objects.ajustar_stock_grupo([self.libro.pk, self.otro.pk], -1)
+            self.otro.refresh_from_db()
+            self.otro.titulo = 'El Aleph (edición)'
+            self.otro.save()
+
+        async def sesion():
+            ws = await self.conectar()
+            await database_sync_to_async(cambios)()
+            # La ventana se vacía en este loop al cumplirse
+            mensajes = [await ws.receive_json_from(timeout=2) for _ in range(2)]
+            self.assertTrue(await ws.receive_nothing(timeout=0.3))
+            await ws.disconnect()
+            return mensajes
+
+        mensajes = async_to_sync(sesion)()
+        self.assertEqual(
+            sorted((m['libro']['id'], m['libro']['stock']) for m in mensajes),
+            sorted([(self.libro.pk, 7), (self.otro.pk, 1)]),
+        )
+
+
+    @override_settings(NOTIFICACIONES_STOCK={'VENTANA': 0.25})
+    def test_ventana_se_vacia_en_el_loop_del_servidor(self):
+        from asgiref.sync import sync_to_async
+        from channels.layers import get_channel_layer
+        from .notificaciones import coalescedor, grupo_de_tema
+
+        async def sesion():
+            # InMemoryChannelLayer: publicar desde otro loop no despierta a receive()
+            capa = get_channel_layer()
+            canal = await capa.new_channel()
+            await capa.group_add(grupo_de_tema('todo'), canal)
+            inicio = time.monotonic()
+            await sync_to_async(coalescedor.agregar, thread_sensitive=False)({self.libro.pk: {
+                'stock': 1, 'estado': Libro.DISPONIBLE,
+                'autor_id': self.libro.autor_id, 'categoria_id': None,
+            }})
+            evento = await asyncio.wait_for(capa.receive(canal), 5)
+            await capa.group_discard(grupo_de_tema('todo'), canal)
+            return evento, time.monotonic() - inicio
+
+        evento, segundos = async_to_sync(sesion)()
+        self.assertEqual(evento['libro_id'], self.libro.pk)
+        self.assertLess(segundos, 2)
+
+    def test_solo_al_crear_o_cambiar_stock_y_estado(self):
+        from channels.db import database_sync_to_async
+
+        def editar(**campos):
+            libro = Libro.objects.get(pk=self.libro.pk)
+            for campo, valor in campos.items():
+                setattr(libro, campo, valor)
+            libro.save()
+
+        async def sesion():
+            ws = await self.conectar()
+            await database_sync_to_async(editar)(titulo='Artificios', precio=Decimal('99.00'))
+            sin_cambios = await ws.receive_nothing(timeout=0.2)
+            await database_sync_to_async(editar)(estado=Libro.MANTENIMIENTO)
+            por_estado = await ws.receive_json_from()
+            await database_sync_to_async(crear_libro)(isbn='9780060883287')
+            al_crear = await ws.receive_json_from()
+            await ws.disconnect()
+            return sin_cambios, por_estado, al_crear
+
+        sin_cambios, por_estado, al_crear = async_to_sync(sesion)()
+        self.assertTrue(sin_cambios)
+        self.assertEqual(por_estado['libro']['id'], self.libro.pk)
+        self.assertFalse(por_estado['libro']['disponible'])
+        self.assertNotEqual(al_crear['libro']['id'], self.libro.pk)
+
+
+@override_settings(NOTIFICACIONES_STOCK={'VENTANA': 0})
+class SuscripcionesNotificacionesTests(TransactionTestCase):
+    """Temas por libro, categoría y autor en ws/notificaciones/"""
+
+    def setUp(self):
+        self.categoria = Categoria.objects.create(nombre='Cuentos')
+        self.libro = crear_libro(stock=3, categoria=self.categoria)
+        self.otro = crear_libro(titulo='El Aleph', isbn='9780142437889', stock=2)
+
+    async def conectar(self, temas):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .routing import websocket_urlpatterns
+
+        ws = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/notificaciones/?temas={temas}'
+        )
+        await ws.connect()
+        bienvenida = await ws.receive_json_from()
+        return ws, bienvenida
+
+    def test_solo_recibe_sus_temas(self):
+        from channels.db import database_sync_to_async
+
+        async def sesion():
+            ws, bienvenida = await self.conectar(f'libro:{self.libro.pk}')
+            await database_sync_to_async(Libro.objects.ajustar_stock)(self.otro.pk, 1)
+            nada = await ws.receive_nothing(timeout=0.1)
+            await database_sync_to_async(Libro.objects.ajustar_stock)(self.libro.pk, 1)
+            mensaje = await ws.receive_json_from()
+            await ws.disconnect()
+            return bienvenida, nada, mensaje
+
+        bienvenida, nada, mensaje = async_to_sync(sesion)()
+        self.assertEqual(bienvenida['temas'], [f'libro:{self.libro.pk}'])
+        self.assertTrue(nada)
+        self.assertEqual(mensaje['libro']['id'], self.libro.pk)
+        self.assertEqual(mensaje['libro']['stock'], 4)
+
+    def test_varios_temas_del_mismo_libro_llegan_una_vez(self):
+        from channels.db import database_sync_to_async
+
+        async def sesion():
+            ws, _ = await self.conectar('')
+            await ws.send_json_to({
+                'type': 'suscribir',
+                'temas': [f'categoria:{self.categoria.pk}', f'autor:{self.libro.autor_id}'],
+            })
+            confirmacion = await ws.receive_json_from()
+            await ws.send_json_to({'type': 'desuscribir', 'temas': ['todo']})
+            await ws.receive_json_from()
+            await database_sync_to_async(Libro.objects.ajustar_stock)(self.libro.pk, -1)
+            mensaje = await ws.receive_json_from()
+            duplicado = await ws.receive_nothing(timeout=0.1)
+            await ws.disconnect()
+            return confirmacion, mensaje, duplicado
+
+        confirmacion, mensaje, duplicado = async_to_sync(sesion)()
+        self.assertEqual(confirmacion['temas'], sorted([
+            'todo', f'categoria:{self.categoria.pk}', f'autor:{self.libro.autor_id}',
+        ]))
+        self.assertEqual(mensaje['libro']['categoria'], self.categoria.pk)
+        self.assertTrue(duplicado)
+
+    @override_settings(NOTIFICACIONES_STOCK={'VENTANA': 0, 'MAX_SUSCRIPCIONES': 2})
+    def test_limite_y_temas_no_validos(self):
+        async def sesion():
+            ws, bienvenida = await self.conectar('libro:1')
+            await ws.send_json_to({
+                'type': 'suscribir', 'temas': ['editorial:1', 'libro:2', 'libro:3'],
+            })
+            confirmacion = await ws.receive_json_from()
+            error = await ws.receive_json_from()
+            await ws.disconnect()
+            return confirmacion, error
+
+        confirmacion, error = async_to_sync(sesion)()
+        self.assertEqual(confirmacion['temas'], ['libro:1', 'libro:2'])
+        self.assertEqual(error['type'], 'error')
+        self.assertEqual(sorted(error['temas']), ['editorial:1', 'libro:3'])
+
+
+def cliente_lento(app, demora):
+    """Envolver una app ASGI para que cada envío al socket tarde `demora`"""
+    async def envuelta(scope, receive, send):
+        async def enviar(mensaje):
+            if mensaje['type'] == 'websocket.send':
+                await asyncio.sleep(demora)
+            await send(mensaje)
+        return await app(scope, receive, enviar)
+    return envuelta
+
+
+class ContrapresionTests(SimpleTestCase):
+    """Colas de salida acotadas por conexión WebSocket"""
+
+    def setUp(self):
+        from .contrapresion import metricas
+        metricas.reiniciar()
+
+    def test_cola_coalesce_y_descarta_el_mas_antiguo(self):
+        from .contrapresion import ColaSalida
+
+        async def probar():
+            cola = ColaSalida(3)
+            resultados = [
+                cola.agregar('a1', clave='a'),
+                cola.agregar('b'),
+                cola.agregar('a2', clave='a'),
+                cola.agregar('c'),
+                cola.agregar('d'),
+            ]
+            return resultados, [await cola.siguiente() for _ in range(len(cola))], cola.saturada(0)
+
+        resultados, pendientes, saturada = async_to_sync(probar)()
+        self.assertEqual(resultados, [None, None, 'coalescido', None, 'descartado'])
+        # 'a2' ocupó el lugar de 'a1', que fue el descartado por antiguo
+        self.assertEqual(pendientes, ['b', 'c', 'd'])
+        # Se vació por debajo de la mitad: la tolerancia se reinicia
+        self.assertFalse(saturada)
+
+    @override_settings(SALIDA_WEBSOCKET={'MAX_COLA': 5, 'TOLERANCIA': 60})
+    def test_lector_lento_recibe_el_ultimo_estado(self):
+        from channels.layers import get_channel_layer
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .contrapresion import metricas
+        from .routing import websocket_urlpatterns
+
+        async def sesion():
+            ws = WebsocketCommunicator(
+                cliente_lento(URLRouter(websocket_urlpatterns), 0.02), '/ws/notificaciones/'
+            )
+            await ws.connect()
+            await ws.receive_json_from()
+            capa = get_channel_layer()
+            # Más eventos que la capacidad del canal (50) en la capa
+            for i in range(1, 121):
+                await capa.group_send('notificaciones', {
+                    'type': 'libro_actualizado',
+                    'evento': str(i),
+                    'libro': {'id': i % 3, 'stock': i},
+                })
+                await asyncio.sleep(0.001)
+            recibidos = []
+            while not await ws.receive_nothing(timeout=0.2):
+                recibidos.append((await ws.receive_json_from())['libro'])
+            await ws.disconnect()
+            return recibidos
+
+        recibidos = async_to_sync(sesion)()
+        ultimos = {libro['id']: libro['stock'] for libro in recibidos}
+        self.assertEqual(ultimos, {0: 120, 1: 118, 2: 119})
+        self.assertLess(len(recibidos), 120)
+        resumen = metricas.resumen()['NotificacionesConsumer']
+        self.assertEqual(resumen['coalescidos'], 120 - len(recibidos))
+        self.assertEqual(resumen['desconectados'], 0)
+
+    @override_settings(
+        SALIDA_WEBSOCKET={'MAX_COLA': 3, 'TOLERANCIA': 0.05}, CHAT_PERSISTENTE={'ACTIVO': False},
+    )
+    def test_desconecta_al_cliente_que_no_da_abasto(self):
+        from channels.layers import get_channel_layer
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .consumers import ChatConsumer
+        from .contrapresion import CODIGO_LENTO, metricas
+        from .routing import websocket_urlpatterns
+
+        async def sesion():
+            ws = WebsocketCommunicator(
+                cliente_lento(URLRouter(websocket_urlpatterns), 10), '/ws/chat/sala/'
+            )
+            await ws.connect()
+            capa = get_channel_layer('chat')
+            for i in range(20):
+                await capa.group_send('chat_sala', {
+                    'type': 'chat_message', 'message': str(i), 'username': 'ana',
+                })
+                await asyncio.sleep(0.01)
+            cierre = await ws.receive_output(timeout=1)
+            await ws.disconnect()
+            return cierre
+
+        with mock.patch.object(ChatConsumer, 'max_cola', None):
+            cierre = async_to_sync(sesion)()
+        self.assertEqual(cierre, {'type': 'websocket.close', 'code': CODIGO_LENTO})
+        resumen = metricas.resumen()['ChatConsumer']
+        self.assertEqual(resumen['desconectados'], 1)
+        self.assertGreater(resumen['descartados'], 0)
+
+
+@override_settings(CHAT_PERSISTENTE={'ACTIVO': True, 'HISTORIAL': 3, 'INTERVALO': 60, 'LOTE': 500})
+class ChatPersistenteTests(TransactionTestCase):
+    """Historial del chat con buffer por sala y guardado en lotes"""
+
+    def tearDown(self):
+        from .chat import almacen
+        almacen.olvidar()
+
+    async def entrar(self, sala='lectura'):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .routing import websocket_urlpatterns
+
+        ws = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{sala}/')
+        await ws.connect()
+        historial = await ws.receive_json_from()
+        await ws.receive_json_from()
+        return ws, historial
+
+    async def escribir(self, ws, *mensajes):
+        for mensaje in mensajes:
+            await ws.send_json_to({'message': mensaje, 'username': 'ana'})
+            await ws.receive_json_from()
+
+    def test_mensajes_en_lote_e_historial_desde_memoria(self):
+        from .chat import almacen
+
+        async def primera():
+            ws, historial = await self.entrar()
+            await self.escribir(ws, 'uno', 'dos', 'tres', 'cuatro')
+            await ws.disconnect()
+            return historial
+
+        async def segunda():
+            ws, historial = await self.entrar()
+            await ws.disconnect()
+            return historial
+
+        with consultas_en_todos_los_hilos() as al_escribir:
+            vacio = async_to_sync(primera)()
+        with consultas_en_todos_los_hilos() as al_entrar:
+            historial = async_to_sync(segunda)()
+        with CaptureQueriesContext(connection) as al_vaciar:
+            almacen.vaciar()
+
+        self.assertEqual(vacio['mensajes'], [])
+        # Solo la carga de la sala al entrar el primero; nada por mensaje
+        self.assertEqual(len(al_escribir), 1)
+        self.assertEqual(len(al_entrar), 0)
+        self.assertEqual([m['message'] for m in historial['mensajes']], ['dos', 'tres', 'cuatro'])
+        inserts = [q for q in al_vaciar.captured_queries if 'INSERT' in q['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            list(MensajeChat.objects.order_by('fecha').values_list('mensaje', flat=True)),
+            ['uno', 'dos', 'tres', 'cuatro'],
+        )
+
+    def test_historial_anterior_desde_la_base_de_datos(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        inicio = timezone.now() - timedelta(hours=1)
+        # m3, m4 y m5 comparten fecha y la primera página termina en m5
+        minutos = [1, 2, 3, 3, 3, 6, 7]
+        MensajeChat.objects.bulk_create([
+            MensajeChat(
+                sala='lectura', uid=f'm{i}', usuario='ana', mensaje=f'm{i}',
+                fecha=inicio + timedelta(minutes=minuto),
+            )
+            for i, minuto in enumerate(minutos, 1)
+        ])
+
+        async def sesion():
+            ws, historial = await self.entrar()
+            paginas = [historial['mensajes']]
+            while historial['antes']:
+                await ws.send_json_to({'type': 'historial', 'antes': historial['antes']})
+                historial = await ws.receive_json_from()
+                paginas.append(historial['mensajes'])
+            await ws.disconnect()
+            return paginas
+
+        paginas = async_to_sync(sesion)()
+        self.assertEqual(
+            [[m['message'] for m in pagina] for pagina in paginas],
+            [['m5', 'm6', 'm7'], ['m2', 'm3', 'm4'], ['m1'], []],
+        )
+
+    def test_sala_y_usuario_validados(self):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .routing import websocket_urlpatterns
+
+        async def conectar(sala):
+            ws = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{sala}/')
+            conectado, _ = await ws.connect()
+            await ws.disconnect()
+            return conectado
+
+        async def sesion():
+            ws, _ = await self.entrar()
+            recibidos = []
+            for usuario in ('u' * 300, 7, '  '):
+                await ws.send_json_to({'message': 'hola', 'username': usuario})
+                recibidos.append((await ws.receive_json_from())['username'])
+            await ws.send_json_to({'username': 'ana'})
+            error = await ws.receive_json_from()
+            await ws.disconnect()
+            return recibidos, error
+
+        self.assertFalse(async_to_sync(conectar)('s' * 95))
+        self.assertFalse(async_to_sync(conectar)('café'))
+        self.assertTrue(async_to_sync(conectar)('s' * 94))
+        recibidos, error = async_to_sync(sesion)()
+        self.assertEqual(recibidos, ['u' * 150, 'Anónimo', 'Anónimo'])
+        self.assertEqual(error['type'], 'error')
+
+    def test_pedidos_mal_formados(self):
+        async def sesion():
+            ws, historial = await self.entrar()
+            respuestas = []
+            for antes in ('2024-05-01T12:00:00', 12, 'bm8gZXMgdW4gY3Vyc29y'):
+                await ws.send_json_to({'type': 'historial', 'antes': antes})
+                respuestas.append((await ws.receive_json_from())['type'])
+            for frame in ('{no es json', '[]', '"hola"', '1'):
+                await ws.send_to(text_data=frame)
+                respuestas.append((await ws.receive_json_from())['type'])
+            await ws.send_to(bytes_data=b'{"message": "hola"}')
+            respuestas.append((await ws.receive_json_from())['type'])
+            # La conexión sigue abierta
+            await ws.send_json_to({'type': 'historial', 'antes': historial['antes']})
+            respuestas.append((await ws.receive_json_from())['type'])
+            await ws.disconnect()
+            return respuestas
+
+        self.assertEqual(async_to_sync(sesion)(), ['error'] * 8 + ['historial'])
+
+    def test_fila_mala_no_descarta_el_lote(self):
+        from .chat import almacen, nuevo_mensaje
+
+        for sala in ('lectura', 'poesia'):
+            for texto in ('uno', 'dos'):
+                almacen.guardar(sala, nuevo_mensaje('ana', f'{sala} {texto}'))
+        almacen.guardar('poesia', nuevo_mensaje('ana', 'roto'))
+
+        def rechazar_roto(execute, sql, params, many, context):
+            # Como MySQL con un emoji en una columna utf8mb3: falla el INSERT entero
+            if sql.startswith('INSERT') and 'roto' in params:
+                raise IntegrityError('fila rechazada')
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(rechazar_roto), self.assertLogs('libros.chat', 'ERROR'):
+            almacen.vaciar()
+        self.assertEqual(
+            sorted(MensajeChat.objects.values_list('mensaje', flat=True)),
+            ['lectura dos', 'lectura uno', 'poesia dos', 'poesia uno'],
+        )
+
+
+class JSONRapidoTests(SimpleTestCase):
+    """Renderer/parser con ujson y frames de WebSocket codificados una vez"""
+
+    DATOS = {
+        'precio': Decimal('220.50'),
+        'valoracion': Decimal('4.25'),
+        'fecha': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'dia': date(2024, 5, 1),
+        'titulo': 'Niebla / Unamuno \u2028',
+        'etiquetas': ('clásico', None, True, 1.5),
+    }
+
+    def test_misma_salida_que_el_renderer_de_drf(self):
+        from rest_framework.renderers import JSONRenderer
+        from .json_rapido import JSONRapidoRenderer
+
+        esperado = JSONRenderer().render(self.DATOS)
+        self.assertEqual(JSONRapidoRenderer().render(self.DATOS), esperado)
+        with override_settings(JSON_RAPIDO={'MOTOR': 'json'}):
+            self.assertEqual(JSONRapidoRenderer().render(self.DATOS), esperado)
+        # Con sangría se usa el de DRF
+        self.assertEqual(
+            JSONRapidoRenderer().render(self.DATOS, 'application/json; indent=2'),
+            JSONRenderer().render(self.DATOS, 'application/json; indent=2'),
+        )
+
+    def test_nan_e_infinitos_se_rechazan(self):
+        from rest_framework.exceptions import ParseError
+        from .json_rapido import JSONRapidoParser, JSONRapidoRenderer
+
+        with self.assertRaises(ValueError):
+            JSONRapidoRenderer().render({'valoracion': float('nan')})
+        with self.assertRaises(ParseError):
+            JSONRapidoParser().parse(io.BytesIO(b'{"valoracion": Infinity}'))
+        self.assertEqual(
+            JSONRapidoParser().parse(io.BytesIO('{"titulo": "NaN ñ", "stock": 2}'.encode())),
+            {'titulo': 'NaN ñ', 'stock': 2},
+        )
+
+    def test_broadcast_codifica_una_vez(self):
+        from channels.layers import get_channel_layer
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from . import consumers, json_rapido, notificaciones, protocolos
+        from .routing import websocket_urlpatterns
+
+        libro = notificaciones.delta(7, 2, Libro.DISPONIBLE, 1, None)
+
+        async def sesion():
+            clientes = []
+            for _ in range(3):
+                ws = WebsocketCommunicator(URLRouter(websocket_urlpatterns), '/ws/notificaciones/')
+                await ws.connect()
+                await ws.receive_json_from()
+                clientes.append(ws)
+            with mock.patch.object(protocolos, 'dumps', wraps=json_rapido.dumps) as al_publicar, \
+                    mock.patch.object(consumers, 'codificar', wraps=protocolos.codificar) as por_cliente:
+                await notificaciones._enviar(get_channel_layer(), [libro])
+                frames = [await ws.receive_from() for ws in clientes]
+            for ws in clientes:
+                await ws.disconnect()
+            return frames, al_publicar.call_count, por_cliente.call_count
+
+        frames, al_publicar, por_cliente = async_to_sync(sesion)()
+        self.assertEqual(al_publicar, 1)
+        self.assertEqual(por_cliente, 0)
+        self.assertEqual(len(set(frames)), 1)
+        self.assertEqual(json.loads(frames[0]), {'type': 'libro_actualizado', 'libro': libro})
+
+
+class SubprotocolosTests(SimpleTestCase):
+    """Frames binarios msgpack/CBOR negociados con Sec-WebSocket-Protocol"""
+
+    async def conectar(self, subprotocolos=None):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .routing import websocket_urlpatterns
+
+        ws = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), '/ws/notificaciones/', subprotocols=subprotocolos,
+        )
+        _, subprotocolo = await ws.connect()
+        bienvenida = await ws.receive_from()
+        return ws, subprotocolo, bienvenida
+
+    def recibir_cambio(self, subprotocolos):
+        from channels.layers import get_channel_layer
+        from . import notificaciones
+
+        libro = notificaciones.delta(7, 2, Libro.DISPONIBLE, 3, None)
+
+        async def sesion():
+            ws, subprotocolo, bienvenida = await self.conectar(subprotocolos)
+            await notificaciones._enviar(get_channel_layer(), [libro])
+            frame = await ws.receive_from()
+            await ws.disconnect()
+            return subprotocolo, bienvenida, frame
+
+        return async_to_sync(sesion)()
+
+    def test_json_por_defecto(self):
+        for subprotocolos in (None, ['otro.protocolo']):
+            subprotocolo, bienvenida, frame = self.recibir_cambio(subprotocolos)
+            self.assertIsNone(subprotocolo)
+            self.assertEqual(json.loads(bienvenida)['type'], 'connection')
+            self.assertEqual(json.loads(frame)['libro']['stock'], 2)
+
+    def test_frames_compactos_msgpack_y_cbor(self):
+        import cbor2
+
+        for subprotocolo, decodificar in (
+            ('biblioteca.msgpack', msgpack.unpackb),
+            ('biblioteca.cbor', cbor2.loads),
+        ):
+            aceptado, bienvenida, frame = self.recibir_cambio(['otro.protocolo', subprotocolo])
+            self.assertEqual(aceptado, subprotocolo)
+            self.assertIsInstance(frame, bytes)
+            self.assertEqual(decodificar(bienvenida)['temas'], ['todo'])
+            self.assertEqual(decodificar(frame), [1, 7, 2, True, 3, None])
+
+    def test_mensajes_del_cliente_en_binario(self):
+        async def sesion():
+            ws, _, _ = await self.conectar(['biblioteca.msgpack'])
+            await ws.send_to(bytes_data=msgpack.packb({'type': 'suscribir', 'temas': ['libro:7']}))
+            respuesta = await ws.receive_from()
+            await ws.disconnect()
+            return respuesta
+
+        self.assertEqual(msgpack.unpackb(async_to_sync(sesion)())['temas'], ['libro:7', 'todo'])
@@ -1,29 +1,214 @@
+"""
+Throttles de DRF con ventanas de contadores evaluadas en lote.
+
+SimpleRateThrottle guarda por llave la lista de marcas de tiempo de cada
+petición (hasta 1000 floats con '1000/day') y hace un get + set por
+throttle. Aquí cada llave es un contador entero por ventana fija y el
+límite se estima con ventana deslizante:
+
+    previa * (fracción de la ventana anterior aún cubierta) + actual
+
+El primer throttle que DRF evalúa en una petición cuenta los de todos
+los scopes de la vista a la vez (INCR de la ventana actual y GET de la
+anterior): con Redis es un solo pipeline, una ida y vuelta. Los demás
+throttles leen su resultado del lote. Si algún scope rechaza, los
+contadores se devuelven: las peticiones rechazadas no consumen cupo,
+igual que en DRF.
+"""
+from django.core.cache.backends.redis import RedisCache
 from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
 
 
-class BurstRateThrottle(UserRateThrottle):
+# ===== CONTADORES =====
+
+class Ventana:
+    """Contador de un scope para una llave en la ventana fija actual"""
+
+    def __init__(self, llave, num_requests, duration, ahora):
+        self.num_requests = num_requests
+        self.duration = duration
+        self.ahora = ahora
+        self.inicio = ahora - ahora % duration
+        numero = int(self.inicio // duration)
+        self.actual = f'{llave}:{numero}'
+        self.anterior = f'{llave}:{numero - 1}'
+        # La ventana actual se lee como "anterior" durante la siguiente
+        self.ttl = 2 * duration
+        self.contadas = 0
+        self.previas = 0
+
+    @property
+    def peso_anterior(self):
+        return 1 - (self.ahora - self.inicio) / self.duration
+
+    @property
+    def estimado(self):
+        return self.previas * self.peso_anterior + self.contadas
+
+    @property
+    def permitido(self):
+        return self.estimado <= self.num_requests
+
+    def espera(self):
+        """Segundos hasta que una petición más quepa en el límite"""
+        n, d = self.num_requests, self.duration
+        transcurrido = self.ahora - self.inicio
+        # Sin contar la petición rechazada
+        contadas = self.contadas - 1
+        if contadas + 1 > n:
+            # No cabe en esta ventana: en la siguiente pesa como anterior
+            fraccion = 1 - (n - 1) / contadas if contadas else 0
+            return (d - transcurrido) + max(fraccion, 0) * d
+        if not self.previas:
+            return 0.0
+        fraccion = 1 - (n - contadas - 1) / self.previas
+        return max(fraccion * d - transcurrido, 0.0)
+
+
+class ContadorCache:
+    """
+    Contadores sobre cualquier caché de Django: get_many para las ventanas
+    anteriores y un incr por scope (add si la ventana es nueva).
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def contar(self, ventanas):
+        previas = self.cache.get_many([v.anterior for v in ventanas])
+        for ventana in ventanas:
+            ventana.previas = previas.get(ventana.anterior, 0)
+            ventana.contadas = self._incr(ventana.actual, ventana.ttl)
+
+    def _incr(self, llave, ttl):
+        while True:
+            try:
+                return self.cache.incr(llave)
+            except ValueError:
+                if self.cache.add(llave, 1, ttl):
+                    return 1
+
+    def devolver(self, ventanas):
+        for ventana in ventanas:
+            try:
+                self.cache.decr(ventana.actual)
+            except ValueError:
+                pass
+
+
+class ContadorRedis:
+    """Todas las ventanas de una petición en un solo pipeline de Redis"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def _pipeline(self, ventanas):
+        llaves = [
+            (self.cache.make_and_validate_key(v.actual), self.cache.make_and_validate_key(v.anterior))
+            for v in ventanas
+        ]
+        cliente = self.cache._cache.get_client(llaves[0][0], write=True)
+        return cliente.pipeline(transaction=False), llaves
+
+    def contar(self, ventanas):
+        pipeline, llaves = self._pipeline(ventanas)
+        for ventana, (actual, anterior) in zip(ventanas, llaves):
+            pipeline.incr(actual)
+            pipeline.expire(actual, ventana.ttl)
+            pipeline.get(anterior)
+        respuestas = pipeline.execute()
+        for i, ventana in enumerate(ventanas):
+            ventana.contadas = int(respuestas[3 * i])
+            ventana.previas = int(respuestas[3 * i + 2] or 0)
+
+    def devolver(self, ventanas):
+        pipeline, llaves = self._pipeline(ventanas)
+        for actual, _ in llaves:
+            pipeline.decr(actual)
+        pipeline.execute()
+
+
+def contador_para(cache):
+    return ContadorRedis(cache) if isinstance(cache, RedisCache) else ContadorCache(cache)
+
+
+# ===== THROTTLES =====
+
+class VentanaThrottleMixin:
+    """
+    Reemplaza el historial de SimpleRateThrottle por ventanas de contadores
+    evaluadas en lote para todos los throttles de la vista.
+    """
+
+    def exento(self, request):
+        """True si la petición no se limita con este throttle"""
+        return False
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        lote = getattr(request, '_ventanas_throttle', None)
+        if lote is None or self.scope not in lote:
+            lote = evaluar_lote(request, view, self)
+        self.ventana = lote[self.scope]
+        return self.ventana is None or self.ventana.permitido
+
+    def wait(self):
+        return self.ventana.espera()
+
+
+def evaluar_lote(request, view, throttle):
+    """
+    Contar la petición en todos los scopes de la vista a la vez y dejar
+    las ventanas en la petición para los demás throttles.
+    """
+    throttles = [
+        t for t in (view.get_throttles() if view is not None else [])
+        if isinstance(t, VentanaThrottleMixin) and t.rate is not None
+        and t.scope != throttle.scope
+    ] + [throttle]
+
+    lote = {}
+    ahora = throttle.timer()
+    for t in throttles:
+        llave = None if t.exento(request) else t.get_cache_key(request, view)
+        lote[t.scope] = (
+            None if llave is None else Ventana(llave, t.num_requests, t.duration, ahora)
+        )
+
+    ventanas = [v for v in lote.values() if v is not None]
+    if ventanas:
+        contador = contador_para(throttle.cache)
+        contador.contar(ventanas)
+        if not all(v.permitido for v in ventanas):
+            contador.devolver(ventanas)
+
+    request._ventanas_throttle = lote
+    return lote
+
+
+class BurstRateThrottle(VentanaThrottleMixin, UserRateThrottle):
     """Límite para ráfagas cortas"""
     scope = 'burst'
 
 
-class SustainedRateThrottle(UserRateThrottle):
+class SustainedRateThrottle(VentanaThrottleMixin, UserRateThrottle):
     """Límite sostenido"""
     scope = 'sustained'
 
 
-class AnonBurstRateThrottle(AnonRateThrottle):
+class AnonBurstRateThrottle(VentanaThrottleMixin, AnonRateThrottle):
     """Límite para usuarios anónimos"""
     scope = 'anon_burst'
 
 
-class PremiumUserThrottle(UserRateThrottle):
+class PremiumUserThrottle(VentanaThrottleMixin, UserRateThrottle):
     """Límite más alto para usuarios premium"""
     scope = 'premium'
-    
-    def allow_request(self, request, view):
-        # Usuarios premium tienen límite más alto
-        if request.user.is_authenticated and hasattr(request.user, 'is_premium'):
-            if request.user.is_premium:
-                return True
-        
-        return super().allow_request(request, view)
\ No newline at end of file
+
+    def exento(self, request):
+        # Usuarios premium no tienen límite
+        return bool(
+            request.user.is_authenticated
+            and getattr(request.user, 'is_premium', False)
+        )